@@ -19,6 +19,10 @@ from that data (e.g. summit+/-100bps); one containing the header
 information from the input; and one describing what each of the columns
 in the data sheet are.
 
+If the output file name ends with '.xlsx' then an XLSX spreadsheet is
+written instead; this isn't subject to the XLS limit of 65,536 rows, so
+should be used for large peak lists.
+
 This is a modified version of make_macs_xls.py updated to work with
 output from MACS 2.0.10(alpha)."""
 
@@ -44,7 +48,7 @@ import Spreadsheet
 # Module metadata
 #######################################################################
 
-__version__ = '0.1.0'
+__version__ = '0.2.1'
 
 #######################################################################
 # Class definitions
@@ -71,7 +75,9 @@ if __name__ == "__main__":
                               "of the MACS peak caller. <MACS2_OUTPUT> is the output '.xls' "
                               "file from MACS2; if supplied then <XLS_OUT> is the name to use "
                               "for the output file, otherwise it will be called "
-                              "'XLS_<MACS2_OUTPUT>.xls'.")
+                              "'XLS_<MACS2_OUTPUT>.xls'. If <XLS_OUT> ends with '.xlsx' "
+                              "then an XLSX file is written instead (use this for "
+                              "more than 65,535 peaks).")
     options,args = p.parse_args()
     # Get input file name
     if len(args) < 1 or len(args) > 2:
@@ -126,9 +132,9 @@ if __name__ == "__main__":
                       macs_version)
         sys.exit(1)
 
-    # Sort into order by fold_enrichment and then by -log10(pvalue) column
-    data.sort(lambda line: line['fold_enrichment'],reverse=True)
-    data.sort(lambda line: line['-log10(pvalue)'],reverse=True)
+    # Sort into order by -log10(pvalue) column, with lines with equal
+    # pvalues ordered by fold_enrichment
+    data.sortByColumns('-log10(pvalue)','fold_enrichment',reverse=True)
 
     # Restore first line
     data.insert(0,tabdata=header_line)
@@ -161,7 +167,14 @@ fold_enrichment\tFold enrichment for this region against random Poisson distribu
 #FDR(%)\tFalse discovery rate (FDR) as a percentage
 """
     # Create a new spreadsheet
-    wb = Spreadsheet.Workbook()
+    if xls_out.lower().endswith('.xlsx'):
+        wb = Spreadsheet.XLSXWorkbook()
+    else:
+        wb = Spreadsheet.Workbook()
+        if len(data) > Spreadsheet.MAX_NUMBER_ROWS_PER_WORKSHEET:
+            logging.warning("%d lines of data exceeds the XLS limit of %d rows; "
+                            "use an output name ending with '.xlsx' to keep them all" %
+                            (len(data),Spreadsheet.MAX_NUMBER_ROWS_PER_WORKSHEET))
 
     # Create the sheets
     #
@@ -178,30 +191,28 @@ fold_enrichment\tFold enrichment for this region against random Poisson distribu
     ws_legends = wb.addSheet("legends")
     ws_legends.addText(legends_text)
 
-    # Add data to the "data" sheet
-    ws_data.addText(str(data))
-
-    # Insert formulae columns
-    #
-    # Copy of "chr" column
-    ws_data.insertColumn(4,title="chr",insert_items="=B?")
-    #
-    # Summit-100
-    ws_data.insertColumn(5,title="abs_summit-100",insert_items="=L?-100")
-    #
-    # Summit+100
-    ws_data.insertColumn(6,title="abs_summit+100",insert_items="=L?+100")
-    #
-    # Copy of "chr" column
-    ws_data.insertColumn(7,title="chr",insert_items="=B?")
-    #
-    # Summit-1
-    ws_data.insertColumn(8,title="summit-1",insert_items="=L?-1")
-    #
-    # Summit
-    ws_data.insertColumn(9,title="summit",insert_items="=L?")
+    # Add data to the "data" sheet, with formulae columns inserted
+    # after the "end" column (the XLSX writer can't insert columns
+    # afterwards, so these are added to each row as it's written)
+    formulae_titles = ["chr",            # Copy of "chr" column
+                       "abs_summit-100", # Summit-100
+                       "abs_summit+100", # Summit+100
+                       "chr",            # Copy of "chr" column
+                       "summit-1",       # Summit-1
+                       "summit"]         # Summit
+    formulae = ["=B?","=L?-100","=L?+100","=B?","=L?-1","=L?"]
+    for i,line in enumerate(data):
+        items = str(line).split('\t')
+        if i == 0:
+            items[4:4] = formulae_titles
+        else:
+            items[4:4] = formulae
+        ws_data.addTabData(['\t'.join(items)])
 
     # Write the spreadsheet to file
     wb.save(xls_out)
+    if isinstance(wb,Spreadsheet.XLSXWorkbook):
+        # Remove the temporary sheet data
+        wb.close()
 
 
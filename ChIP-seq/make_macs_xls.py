@@ -43,7 +43,7 @@ import Spreadsheet
 # Module metadata
 #######################################################################
 
-__version__ = '0.1.0'
+__version__ = '0.1.1'
 
 #######################################################################
 # Class definitions
@@ -124,9 +124,9 @@ if __name__ == "__main__":
                       macs_version)
         sys.exit(1)
 
-    # Sort into order by fold_enrichment and then by -10*log10(pvalue) column
-    data.sort(lambda line: line['fold_enrichment'],reverse=True)
-    data.sort(lambda line: line['-10*log10(pvalue)'],reverse=True)
+    # Sort into order by -10*log10(pvalue) column, with lines with equal
+    # pvalues ordered by fold_enrichment
+    data.sortByColumns('-10*log10(pvalue)','fold_enrichment',reverse=True)
 
     # Restore first line
     data.insert(0,tabdata=header_line)
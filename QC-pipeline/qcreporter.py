@@ -14,7 +14,7 @@
 Generate HTML reports for an NGS QC pipeline runs.
 """
 
-__version__ = "0.1.0"
+__version__ = "0.1.1"
 
 #######################################################################
 # Import modules that this module depends on
@@ -900,6 +900,9 @@ class SolidQCReporter(QCReporter):
         else:
             logging.error("Can't find stats file %s" % stats_file)
             self.__stats = TabFile.TabFile()
+        # Index the stats on sample name for lookups
+        if 'File' in self.__stats.header():
+            self.__stats.index('File')
         # Check on boxplots and screens
         for sample in self.samples:
             if self.__paired_end:
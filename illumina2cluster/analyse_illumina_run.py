@@ -9,7 +9,7 @@ Provides functionality for analysing data from an Illumina sequencer run.
 
 """
 
-__version__ = "0.1.11"
+__version__ = "0.1.13"
 
 #######################################################################
 # Import modules
@@ -198,18 +198,34 @@ if __name__ == "__main__":
                  help="check CASAVA outputs against those expected for SAMPLE_SHEET")
     p.add_option("--stats",action="store_true",dest="stats",
                  help="Report statistics (read counts etc) for fastq files")
+    p.add_option("--snapshot",action="store_true",dest="snapshot",default=False,
+                 help="reuse the scan of the analysis directory from a snapshot "
+                 "file if it hasn't changed (otherwise scan and write the "
+                 "snapshot)")
+    p.add_option("--workers",action="store",dest="workers",type="int",default=1,
+                 help="number of project and sample directories to scan at the "
+                 "same time (default 1)")
     # Parse command line
     options,args = p.parse_args()
 
     # Get data directory name
     if len(args) != 1:
         p.error("expected one argument (location of Illumina analysis dir)")
+    if options.workers < 1:
+        p.error("--workers: must be at least 1")
     illumina_analysis_dir = os.path.abspath(args[0])
 
     # Populate Illumina data object
     try:
+        if options.snapshot:
+            snapshot = os.path.join(illumina_analysis_dir,
+                                    IlluminaData.SNAPSHOT_FILE)
+        else:
+            snapshot = None
         illumina_data = IlluminaData.IlluminaData(illumina_analysis_dir,
-                                                  unaligned_dir=options.unaligned_dir)
+                                                  unaligned_dir=options.unaligned_dir,
+                                                  snapshot=snapshot,
+                                                  workers=options.workers)
     except IlluminaData.IlluminaDataError, ex:
         logging.error("Failed to collect data: %s",ex)
         sys.exit(1)
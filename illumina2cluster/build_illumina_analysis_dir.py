@@ -4,7 +4,7 @@
 #     Copyright (C) University of Manchester 2012-2013 Peter Briggs
 #
 
-__version__ = "1.0.2"
+__version__ = "1.2.3"
 
 """build_illumina_analysis_dir.py
 
@@ -20,6 +20,12 @@ Use --dry-run to see what will be done before actually doing it.
 
 Use --expt=... option to set application types for each project.
 
+Use --merge-replicates to create merged FASTQs for each set of replicates
+(e.g. where a sample is split across lanes); use --workers=... to run
+several merges at the same time. If all the replicates are gzipped then
+the merged FASTQ is also gzipped (and the replicates are appended to it
+without being decompressed).
+
 """
 
 #######################################################################
@@ -30,7 +36,8 @@ import os
 import sys
 import optparse
 import logging
-import gzip
+import time
+from multiprocessing.pool import ThreadPool
 
 # Put ../share onto Python search path for modules
 SHARE_DIR = os.path.abspath(
@@ -48,13 +55,16 @@ def create_analysis_dir(project,
                         top_dir=None,
                         merge_replicates=False,
                         keep_names=False,
-                        dry_run=False):
+                        dry_run=False,
+                        workers=1):
     """Create and populate analysis directory for an IlluminaProject
 
     Creates a new directory and populates either with links to FASTQ
     files, or with 'merged' FASTQ files created by concatenating
     multiple FASTQs for each sample (which can happen for multiplexed
-    runs where samples are split across multiple lanes).
+    runs where samples are split across multiple lanes). Merged
+    FASTQs are gzipped if all the FASTQs being merged are gzipped, in
+    which case the data is copied without being recompressed.
 
     Project directory names are made up of the project name and then
     the experiment type, or just the project name if experiment type
@@ -71,9 +81,13 @@ def create_analysis_dir(project,
                   shortest unique name
       dry_run   : if True then report what would be done but don't
                   actually perform any action
+      workers   : number of replicate merges to run at the same time
+                  (default 1)
 
     Returns:
-      Name of the project directory.
+      Tuple (project_dir,status) where 'project_dir' is the name of
+      the project directory and 'status' is zero on success, or 1 if
+      any of the replicate merges failed.
     
     """
     project_dir = os.path.join(top_dir,project.full_name)
@@ -93,6 +107,7 @@ def create_analysis_dir(project,
         print "Making 'ScriptCode' directory for %s" % project.name
         if not dry_run:
             bcf_utils.mkdir(scriptcode_dir,mode=0775)
+    status = 0
     # Check for & create links to fastq files
     if not merge_replicates:
         for sample in project.samples:
@@ -112,6 +127,7 @@ def create_analysis_dir(project,
                         bcf_utils.mklink(fastq_file,fastq_ln,relative=True)
     else:
         # Merge files for replicates within each sample
+        merges = []
         for sample in project.samples:
             replicates = {}
             # Gather replicates to be merged
@@ -131,12 +147,98 @@ def create_analysis_dir(project,
                 print "\tReplicate '%s'" % name
                 for fastq in replicates[name]:
                     print "\t\t%s" % fastq
-            # Do the merge
-            for name in replicates:
+            # Queue the merges
+            for name in sorted(replicates.keys()):
                 merged_fastq = os.path.join(project_dir,name+'.fastq')
-                bcf_utils.concatenate_fastq_files(merged_fastq,replicates[name])
-    # Return directory name
-    return project_dir
+                if all([bcf_utils.is_gzipped_file(f)
+                        for f in replicates[name]]):
+                    # Keep the gzipped data as it is
+                    merged_fastq += '.gz'
+                merges.append((merged_fastq,replicates[name]))
+        # Do the merges for all samples
+        if not dry_run:
+            status = run_merges(merges,workers=workers)
+    # Return directory name and status
+    return (project_dir,status)
+
+def run_merges(merges,workers=1):
+    """Perform a set of replicate merges in parallel
+
+    Each merge concatenates a list of FASTQ files into a single
+    merged FASTQ. The merges are independent and are run on a pool
+    of 'workers' threads; as the merges are dominated by I/O, the
+    number of workers is also the limit on the number of files being
+    read and written at the same time, and should be kept modest on
+    shared filesystems.
+
+    Progress (number of merges completed) and throughput are reported
+    for each merge as it finishes.
+
+    Arguments:
+      merges: list of (merged_fastq,fastq_files) tuples, where
+        'fastq_files' is the list of FASTQs to merge into
+        'merged_fastq'
+      workers: (optional) number of merges to run at the same
+        time (default 1)
+
+    Returns:
+      Zero on success, 1 if any of the merges failed.
+    """
+    status = 0
+    nmerges = len(merges)
+    if not nmerges:
+        return status
+    print "Merging %d sets of replicates using %d worker%s" % \
+        (nmerges,workers,('' if workers == 1 else 's'))
+    start_time = time.time()
+    total_size = 0
+    pool = ThreadPool(min(workers,nmerges))
+    try:
+        for i,result in enumerate(pool.imap_unordered(merge_fastqs,merges)):
+            merged_fastq,nbytes,elapsed,ex = result
+            if ex is not None:
+                logging.error("[%d/%d] Failed to create %s: %s" %
+                              (i+1,nmerges,os.path.basename(merged_fastq),ex))
+                status = 1
+                continue
+            total_size += nbytes
+            print "[%d/%d] Created %s: %s in %.1fs (%s/s)" % \
+                (i+1,nmerges,os.path.basename(merged_fastq),
+                 bcf_utils.format_file_size(nbytes),elapsed,
+                 bcf_utils.format_file_size(nbytes/max(elapsed,0.001)))
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = time.time() - start_time
+    print "Merged %s in %.1fs (%s/s)" % \
+        (bcf_utils.format_file_size(total_size),elapsed,
+         bcf_utils.format_file_size(total_size/max(elapsed,0.001)))
+    return status
+
+def merge_fastqs(merge):
+    """Concatenate a set of FASTQs, trapping errors
+
+    Wrapper for bcf_utils.concatenate_fastq_files for use with a
+    pool of workers.
+
+    Arguments:
+      merge: tuple (merged_fastq,fastq_files)
+
+    Returns:
+      Tuple (merged_fastq,nbytes,elapsed,error) where 'nbytes' is the
+      total size of the input FASTQs, 'elapsed' is the time taken in
+      seconds, and 'error' is the exception that was raised (or None
+      if there was no error).
+    """
+    merged_fastq,fastq_files = merge
+    start_time = time.time()
+    try:
+        nbytes = sum([os.path.getsize(f) for f in fastq_files])
+        bcf_utils.concatenate_fastq_files(merged_fastq,fastq_files,
+                                          verbose=False)
+    except (IOError,OSError),ex:
+        return (merged_fastq,0,0.0,ex)
+    return (merged_fastq,nbytes,time.time()-start_time,None)
 
 #######################################################################
 # Main program
@@ -168,17 +270,34 @@ if __name__ == "__main__":
                  help="preserve the full names of the source fastq files when creating links")
     p.add_option("--merge-replicates",action="store_true",dest="merge_replicates",default=False,
                  help="create merged fastq files for each set of replicates detected")
+    p.add_option("--snapshot",action="store_true",dest="snapshot",default=False,
+                 help="reuse the scan of the analysis directory from a snapshot "
+                 "file if it hasn't changed (otherwise scan and write the "
+                 "snapshot)")
+    p.add_option("--workers",action="store",dest="workers",type="int",default=1,
+                 help="number of project and sample directories to scan at the "
+                 "same time, and with --merge-replicates, number of merges to run at "
+                 "the same time; this also limits the number of files being read and "
+                 "written at once (default 1)")
     # Parse command line
     options,args = p.parse_args()
 
     # Get data directory name
     if len(args) != 1:
         p.error("expected one argument (location of Illumina analysis dir)")
+    if options.workers < 1:
+        p.error("--workers: must be at least 1")
     illumina_analysis_dir = os.path.abspath(args[0])
 
     # Populate Illumina data object
+    if options.snapshot:
+        snapshot = os.path.join(illumina_analysis_dir,IlluminaData.SNAPSHOT_FILE)
+    else:
+        snapshot = None
     illumina_data = IlluminaData.IlluminaData(illumina_analysis_dir,
-                                              unaligned_dir=options.unaligned_dir)
+                                              unaligned_dir=options.unaligned_dir,
+                                              snapshot=snapshot,
+                                              workers=options.workers)
 
     # Assign experiment types
     for expt in options.expt_type:
@@ -186,11 +305,20 @@ if __name__ == "__main__":
         illumina_data.get_project(name).expt_type = type_
 
     # Create and populate per-project directory structure
+    status = 0
     for project in illumina_data.projects:
-        create_analysis_dir(project,
-                            top_dir=illumina_analysis_dir,
-                            merge_replicates=options.merge_replicates,
-                            keep_names=options.keep_names,
-                            dry_run=options.dry_run)
+        project_dir,project_status = create_analysis_dir(
+            project,
+            top_dir=illumina_analysis_dir,
+            merge_replicates=options.merge_replicates,
+            keep_names=options.keep_names,
+            dry_run=options.dry_run,
+            workers=options.workers)
+        if project_status != 0:
+            logging.error("Failed to create analysis directory %s" %
+                          project_dir)
+            status = 1
+    if status != 0:
+        sys.exit(1)
 
 
@@ -0,0 +1,696 @@
+#     BAMFile.py: read BGZF-compressed BAM alignment files
+#     Copyright (C) University of Manchester 2026
+#
+########################################################################
+#
+# BAMFile.py
+#
+#########################################################################
+
+__version__ = "0.0.2"
+
+"""BAMFile
+
+Pure-Python classes for reading BAM alignment files, using only the
+zlib module for decompression:
+
+* BGZFReader: file-like object returning the decompressed contents of
+  a BGZF file (optionally decompressing blocks in parallel)
+* BAMIterator: enables looping through all alignment records in a BAM
+  file, returning a BAMRecord object for each
+* BAMRecord: provides access to the data for a single alignment
+
+BAMRecord exposes the same fields as the SAMLine class in sam2soap.py,
+and str(BAMRecord) returns the equivalent SAM alignment line.
+
+Functions:
+
+* is_bam_file: check whether a file looks like a BAM file
+
+SAM/BAM format specification v1.4: http://samtools.sourceforge.net/SAM1.pdf
+"""
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+from collections import Iterator
+import struct
+import zlib
+import string
+from multiprocessing.pool import ThreadPool
+
+#######################################################################
+# Module constants
+#######################################################################
+
+# Magic numbers
+BGZF_MAGIC = '\x1f\x8b\x08\x04'
+BAM_MAGIC = 'BAM\x01'
+
+# Size of the fixed part of a BGZF block header
+BGZF_HEADER_SIZE = 12
+
+# Decoding tables
+CIGAR_CODES = 'MIDNSHP=X'
+SEQ_CODES = '=ACMGRSVTWYHKDBN'
+SEQ_PAIRS = [a+b for a in SEQ_CODES for b in SEQ_CODES]
+QUAL_TABLE = string.maketrans(''.join([chr(i) for i in xrange(94)]),
+                              ''.join([chr(i+33) for i in xrange(94)]))
+
+# Formats for optional fields: (struct format,size,SAM type)
+TAG_TYPES = { 'A': ('<c',1,'A'),
+              'c': ('<b',1,'i'),
+              'C': ('<B',1,'i'),
+              's': ('<h',2,'i'),
+              'S': ('<H',2,'i'),
+              'i': ('<i',4,'i'),
+              'I': ('<I',4,'i'),
+              'f': ('<f',4,'f'), }
+
+#######################################################################
+# Class definitions
+#######################################################################
+
+class BGZFReader:
+    """BGZFReader
+
+    File-like object which reads and decompresses a BGZF file (i.e.
+    a series of gzip members each holding at most 64Kb of data, as
+    used for BAM files).
+
+    Blocks are read in batches of 'nblocks' at a time; if 'nthreads'
+    is greater than 1 then the blocks in each batch are decompressed
+    in parallel on a pool of threads (zlib releases the GIL while
+    decompressing). Data is always returned in file order.
+
+    Call 'close' (or use the reader as a context manager) to release
+    the threads when finished. Note that processes shouldn't be forked
+    (e.g. by creating a multiprocessing.Pool) while the threads are
+    running.
+
+    Example:
+    >>> with BGZFReader('test.bam') as bgzf:
+    ...     magic = bgzf.read(4)
+
+    """
+
+    def __init__(self,filen=None,fp=None,nthreads=1,nblocks=64):
+        """Create a new BGZFReader
+
+        Arguments:
+          filen: name of the BGZF file to read
+          fp: file-like object opened for (binary) reading
+          nthreads: (optional) number of threads to use for
+            decompressing blocks (default 1)
+          nblocks: (optional) number of blocks to read in each
+            batch (default 64)
+
+        """
+        self.__filen = filen
+        if fp is None:
+            self.__fp = open(filen,'rb')
+        else:
+            self.__fp = fp
+        self.__nblocks = nblocks
+        if nthreads > 1:
+            self.__pool = ThreadPool(nthreads)
+        else:
+            self.__pool = None
+        self.__blocks = self.__decompressed_blocks()
+        self.__buffer = ''
+        self.__offset = 0
+
+    def __decompressed_blocks(self):
+        """Internal: generator yielding decompressed blocks in order
+        """
+        while True:
+            batch = []
+            while len(batch) < self.__nblocks:
+                block = read_bgzf_block(self.__fp)
+                if block is None:
+                    break
+                batch.append(block)
+            if not batch:
+                break
+            if self.__pool is not None:
+                data = self.__pool.map(decompress_bgzf_block,batch)
+            else:
+                data = map(decompress_bgzf_block,batch)
+            for block in data:
+                if block:
+                    yield block
+
+    def read(self,size):
+        """Read and return up to 'size' bytes of decompressed data
+
+        Returns an empty string at EOF.
+        """
+        available = len(self.__buffer) - self.__offset
+        if available >= size:
+            data = self.__buffer[self.__offset:self.__offset+size]
+            self.__offset += size
+            return data
+        pieces = [self.__buffer[self.__offset:]]
+        for block in self.__blocks:
+            pieces.append(block)
+            available += len(block)
+            if available >= size:
+                break
+        self.__buffer = ''.join(pieces)
+        self.__offset = min(size,len(self.__buffer))
+        return self.__buffer[:self.__offset]
+
+    def close(self):
+        """Close the underlying file and release the thread pool
+
+        It is safe to call this more than once.
+        """
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+        if self.__filen is not None:
+            self.__fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+class BAMIterator(Iterator):
+    """BAMIterator
+
+    Class to loop over all alignment records in a BAM file, returning a
+    BAMRecord object for each record.
+
+    Example looping over all alignments
+    >>> for alignment in BAMIterator(bam_file):
+    >>>    print alignment
+
+    The underlying file (and any decompression threads) are released
+    when the end of the data is reached; if iteration may stop early
+    then call 'close', or use the iterator as a context manager:
+    >>> with BAMIterator(bam_file,nthreads=4) as bam:
+    >>>    alignment = bam.next()
+
+    After creation the following properties are available:
+
+    header: the SAM header text stored in the BAM file
+    references: list of (name,length) tuples for the reference
+      sequences
+
+    """
+
+    def __init__(self,bam_file=None,fp=None,nthreads=1):
+        """Create a new BAMIterator
+
+        The input BAM can be specified either via a file name (using
+        the 'bam_file' argument), or a file-like object opened for
+        binary reading (using the 'fp' argument).
+
+        Arguments:
+           bam_file: name of the BAM file to iterate through
+           fp: file-like object opened for reading
+           nthreads: (optional) number of threads to use for
+             decompressing BGZF blocks (default 1)
+
+        """
+        self.__bgzf = BGZFReader(filen=bam_file,fp=fp,nthreads=nthreads)
+        try:
+            # Read the header
+            if self.__bgzf.read(4) != BAM_MAGIC:
+                raise Exception,"Bad magic number (not a BAM file?)"
+            l_text = self.__read_int32()
+            self.header = self.__bgzf.read(l_text).rstrip('\0')
+            self.references = []
+            for i in xrange(self.__read_int32()):
+                l_name = self.__read_int32()
+                name = self.__bgzf.read(l_name).rstrip('\0')
+                self.references.append((name,self.__read_int32()))
+        except:
+            self.__bgzf.close()
+            raise
+        self.__reference_names = [ref[0] for ref in self.references]
+
+    def close(self):
+        """Close the BAM file and release any decompression threads
+        """
+        self.__bgzf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+    def __read_int32(self):
+        """Internal: read a little-endian 32-bit integer
+        """
+        return struct.unpack('<i',self.__bgzf.read(4))[0]
+
+    def next(self):
+        """Return next record from BAM file as a BAMRecord object
+        """
+        data = self.__bgzf.read(4)
+        if len(data) < 4:
+            # Reached EOF
+            self.__bgzf.close()
+            raise StopIteration
+        block_size = struct.unpack('<i',data)[0]
+        data = self.__bgzf.read(block_size)
+        if len(data) != block_size:
+            raise Exception,"Truncated BAM record"
+        return BAMRecord(data,self.__reference_names)
+
+class BAMRecord:
+    """Class to store a single alignment record from a BAM file
+
+    Decodes a BAM alignment record and sets the class properties
+    accordingly:
+
+    qname: Query template NAME
+    flag : bitwise FLAG (integer)
+    rname: Reference sequence NAME
+    pos  : 1-based leftmost mapping POSition
+    mapq : MAPping Quality
+    cigar: CIGAR string
+    rnext: Ref. name of the mate/next segment
+    pnext: Position of the mate/next segment
+    tlen : observed Template LENgth
+    seq  : segment SEQuence
+    qual : ASCII of Phred-scaled base QUALity+33
+    md   : MD tag (string for mismatching positions)
+    nh   : NH tag (number of reported alignments that contains the
+           query in the current record)
+    optional: list of optional fields in SAM format (e.g. 'NM:i:1')
+    cigar_operations: CIGAR as a tuple of (count,code) tuples
+
+    These are the same properties as for the SAMLine class in
+    sam2soap.py, with values as they would appear in a SAM file.
+    """
+
+    def __init__(self,data,reference_names):
+        """Create a new BAMRecord
+
+        Arguments:
+          data: the raw bytes for the record (excluding the
+            leading 'block_size' field)
+          reference_names: list of reference sequence names
+            from the BAM header
+
+        """
+        refid,pos,l_read_name,mapq,bin_,n_cigar,flag,l_seq,\
+            next_refid,next_pos,tlen = struct.unpack_from('<iiBBHHHiiii',data)
+        offset = 32
+        self.qname = data[offset:offset+l_read_name-1]
+        offset += l_read_name
+        self.flag = flag
+        self.rname = reference_name(refid,reference_names)
+        self.pos = pos + 1
+        self.mapq = mapq
+        # CIGAR
+        cigar = struct.unpack_from('<%dI' % n_cigar,data,offset)
+        offset += 4*n_cigar
+        self.cigar_operations = tuple([(op >> 4,CIGAR_CODES[op & 0xf])
+                                       for op in cigar])
+        if self.cigar_operations:
+            self.cigar = ''.join(["%d%s" % op for op in self.cigar_operations])
+        else:
+            self.cigar = '*'
+        # Mate
+        if next_refid == refid and refid != -1:
+            self.rnext = '='
+        else:
+            self.rnext = reference_name(next_refid,reference_names)
+        self.pnext = next_pos + 1
+        self.tlen = tlen
+        # Sequence: 4-bit encoded, two bases per byte
+        nbytes = (l_seq + 1)/2
+        if l_seq:
+            self.seq = ''.join([SEQ_PAIRS[ord(c)]
+                                for c in data[offset:offset+nbytes]])[:l_seq]
+        else:
+            self.seq = '*'
+        offset += nbytes
+        # Quality
+        qual = data[offset:offset+l_seq]
+        if not l_seq or qual[0] == '\xff':
+            self.qual = '*'
+        else:
+            self.qual = qual.translate(QUAL_TABLE)
+        offset += l_seq
+        # Optional fields
+        self.md = None
+        self.nh = None
+        self.optional = decode_tags(data,offset)
+        for field in self.optional:
+            if field.startswith('MD:Z:'):
+                self.md = field
+            elif field.startswith('NH:i'):
+                self.nh = field
+
+    def __repr__(self):
+        """Return the record as a SAM alignment line
+        """
+        return '\t'.join([str(x) for x in (self.qname,
+                                           self.flag,
+                                           self.rname,
+                                           self.pos,
+                                           self.mapq,
+                                           self.cigar,
+                                           self.rnext,
+                                           self.pnext,
+                                           self.tlen,
+                                           self.seq,
+                                           self.qual)] + self.optional)
+
+#######################################################################
+# Functions
+#######################################################################
+
+def is_bam_file(filen):
+    """Check whether a file looks like a BAM file
+
+    Checks that the file starts with a BGZF block which decompresses
+    to data beginning with the BAM magic number.
+
+    Arguments:
+      filen: name of the file to check
+
+    Returns:
+      True if the file looks like BAM, False otherwise.
+    """
+    fp = open(filen,'rb')
+    try:
+        try:
+            block = read_bgzf_block(fp)
+        except Exception:
+            return False
+        if block is None:
+            return False
+        return decompress_bgzf_block(block).startswith(BAM_MAGIC)
+    finally:
+        fp.close()
+
+def read_bgzf_block(fp):
+    """Read the next raw BGZF block from a file
+
+    Arguments:
+      fp: file-like object opened for binary reading
+
+    Returns:
+      Tuple (cdata,crc32,isize) where cdata is the raw deflated
+      data, and crc32 and isize are the CRC and size of the
+      uncompressed data; or None at EOF.
+
+    Raises:
+      Exception if the data is not BGZF.
+    """
+    header = fp.read(BGZF_HEADER_SIZE)
+    if not header:
+        return None
+    if len(header) < BGZF_HEADER_SIZE or not header.startswith(BGZF_MAGIC):
+        raise Exception,"Bad BGZF block header"
+    xlen = struct.unpack('<H',header[10:12])[0]
+    extra = fp.read(xlen)
+    # Locate the 'BC' subfield which holds the block size
+    bsize = None
+    i = 0
+    while i < xlen:
+        si1,si2,slen = struct.unpack_from('<ccH',extra,i)
+        if si1 == 'B' and si2 == 'C':
+            bsize = struct.unpack_from('<H',extra,i+4)[0]
+            break
+        i += 4 + slen
+    if bsize is None:
+        raise Exception,"BGZF block size not found"
+    data = fp.read(bsize - xlen - 19)
+    crc32,isize = struct.unpack('<Ii',fp.read(8))
+    return (data,crc32,isize)
+
+def decompress_bgzf_block(block):
+    """Decompress a raw BGZF block
+
+    Arguments:
+      block: tuple (cdata,crc32,isize) as returned by
+        read_bgzf_block
+
+    Returns:
+      The decompressed data.
+
+    Raises:
+      Exception if the size or CRC of the decompressed data
+      don't match the values stored in the block.
+    """
+    cdata,crc32,isize = block
+    data = zlib.decompress(cdata,-15)
+    if len(data) != isize:
+        raise Exception,"BGZF block size mismatch"
+    if (zlib.crc32(data) & 0xffffffff) != crc32:
+        raise Exception,"BGZF block CRC mismatch"
+    return data
+
+def reference_name(refid,reference_names):
+    """Return the reference name for a BAM reference ID
+
+    Returns '*' for unmapped (refid of -1).
+    """
+    if refid < 0:
+        return '*'
+    return reference_names[refid]
+
+def decode_tags(data,offset=0):
+    """Decode BAM optional fields into SAM format
+
+    Arguments:
+      data: raw BAM record data
+      offset: position in 'data' where the optional fields start
+
+    Returns:
+      List of optional fields in SAM format e.g. ['NM:i:1','MD:Z:75T0']
+    """
+    tags = []
+    end = len(data)
+    while offset < end:
+        tag = data[offset:offset+2]
+        val_type = data[offset+2]
+        offset += 3
+        if val_type in TAG_TYPES:
+            fmt,size,sam_type = TAG_TYPES[val_type]
+            value = struct.unpack_from(fmt,data,offset)[0]
+            if sam_type == 'f':
+                value = "%g" % value
+            offset += size
+        elif val_type in 'ZH':
+            sam_type = val_type
+            nul = data.index('\0',offset)
+            value = data[offset:nul]
+            offset = nul + 1
+        elif val_type == 'B':
+            sub_type = data[offset]
+            count = struct.unpack_from('<i',data,offset+1)[0]
+            offset += 5
+            fmt,size,sam_type = TAG_TYPES[sub_type]
+            values = struct.unpack_from('<%d%s' % (count,fmt[1]),data,offset)
+            if sub_type == 'f':
+                values = ["%g" % x for x in values]
+            value = ','.join([sub_type]+[str(x) for x in values])
+            sam_type = 'B'
+            offset += size*count
+        else:
+            raise Exception,"Unrecognised BAM tag type '%s'" % val_type
+        tags.append("%s:%s:%s" % (tag,sam_type,value))
+    return tags
+
+#######################################################################
+# Tests
+#######################################################################
+
+import unittest
+import cStringIO
+import os
+import tempfile
+
+def make_bgzf_block(data):
+    """Create a BGZF block for test data
+    """
+    compressor = zlib.compressobj(6,zlib.DEFLATED,-15)
+    cdata = compressor.compress(data) + compressor.flush()
+    return BGZF_MAGIC + '\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00' + \
+        struct.pack('<H',len(cdata)+25) + cdata + \
+        struct.pack('<Ii',zlib.crc32(data) & 0xffffffff,len(data))
+
+def make_bam_data(header,references,records,block_size=100):
+    """Create BGZF-compressed BAM data for testing
+
+    'records' is a list of tuples (qname,flag,refid,pos,mapq,cigar,
+    next_refid,next_pos,tlen,seq,qual,tags) where 'cigar' is a list
+    of (count,code) tuples and 'tags' is raw BAM tag data.
+    """
+    data = [BAM_MAGIC,struct.pack('<i',len(header)),header,
+            struct.pack('<i',len(references))]
+    for name,length in references:
+        data.append(struct.pack('<i',len(name)+1) + name + '\0' +
+                    struct.pack('<i',length))
+    for qname,flag,refid,pos,mapq,cigar,next_refid,next_pos,tlen,\
+            seq,qual,tags in records:
+        seq_codes = [SEQ_CODES.index(c) for c in seq] + [0]
+        if qual == '*':
+            qual = '\xff'*len(seq)
+        else:
+            qual = ''.join([chr(ord(q)-33) for q in qual])
+        packed_seq = ''.join([chr(seq_codes[i] << 4 | seq_codes[i+1])
+                              for i in xrange(0,len(seq),2)])
+        record = struct.pack('<iiBBHHHiiii',refid,pos,len(qname)+1,mapq,
+                             0,len(cigar),flag,len(seq),next_refid,
+                             next_pos,tlen) + qname + '\0' + \
+                             ''.join([struct.pack('<I',n << 4 | CIGAR_CODES.index(c))
+                                      for n,c in cigar]) + \
+                             packed_seq + \
+                             qual + tags
+        data.append(struct.pack('<i',len(record)) + record)
+    data = ''.join(data)
+    # Split into multiple blocks and add EOF marker
+    return ''.join([make_bgzf_block(data[i:i+block_size])
+                    for i in xrange(0,len(data),block_size)]) + \
+                    make_bgzf_block('')
+
+# Example alignment used for testing
+sam_data = "SRR189243_1-SRR189243.3751\t81\tgi|42410857|gb|AE017196.1|\t60083\t30\t36M\t=\t60200\t153\tCGATACGGGGACATCCGGCCTGCTCCTTCTCACATG\tIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIHH\tNM:i:7\tMD:Z:1A0C0C0C1T0C0T27\tNH:i:2"
+
+bam_data = make_bam_data("@SQ\tSN:gi|42410857|gb|AE017196.1|\tLN:1267782\n",
+                         [("gi|42410857|gb|AE017196.1|",1267782)],
+                         [("SRR189243_1-SRR189243.3751",81,0,60082,30,[(36,'M')],
+                           0,60199,153,"CGATACGGGGACATCCGGCCTGCTCCTTCTCACATG",
+                           "IIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIHH",
+                           "NMC\x07MDZ1A0C0C0C1T0C0T27\0NHc\x02"),
+                          ("unmapped",4,-1,-1,0,[],-1,-1,0,"ACGTN","*","")])
+
+class TestBGZFReader(unittest.TestCase):
+
+    def test_read(self):
+        """Read data split across multiple BGZF blocks
+        """
+        data = "The quick brown fox jumped over the lazy dog\n"*10
+        bgzf = ''.join([make_bgzf_block(data[i:i+7])
+                        for i in xrange(0,len(data),7)])
+        reader = BGZFReader(fp=cStringIO.StringIO(bgzf),nblocks=3)
+        self.assertEqual(reader.read(4),"The ")
+        self.assertEqual(reader.read(1000),data[4:])
+        self.assertEqual(reader.read(4),'')
+
+    def test_read_threaded(self):
+        """Read data using multiple decompression threads
+        """
+        data = ''.join(["Line %d\n" % i for i in xrange(1000)])
+        bgzf = ''.join([make_bgzf_block(data[i:i+100])
+                        for i in xrange(0,len(data),100)])
+        reader = BGZFReader(fp=cStringIO.StringIO(bgzf),nthreads=4,nblocks=5)
+        self.assertEqual(reader.read(len(data)),data)
+        reader.close()
+
+    def test_close_threaded(self):
+        """Close a threaded reader before reaching EOF
+        """
+        data = ''.join(["Line %d\n" % i for i in xrange(1000)])
+        bgzf = ''.join([make_bgzf_block(data[i:i+100])
+                        for i in xrange(0,len(data),100)])
+        with BGZFReader(fp=cStringIO.StringIO(bgzf),nthreads=2,nblocks=2) as reader:
+            self.assertEqual(reader.read(7),"Line 0\n")
+        reader.close()
+
+    def test_bad_crc(self):
+        """Detect corrupted BGZF block
+        """
+        bgzf = make_bgzf_block("Some test data")
+        bgzf = bgzf[:-8] + '\0\0\0\0' + bgzf[-4:]
+        reader = BGZFReader(fp=cStringIO.StringIO(bgzf))
+        self.assertRaises(Exception,reader.read,4)
+
+class TestBAMIterator(unittest.TestCase):
+
+    def test_header(self):
+        """Read header and references from BAM data
+        """
+        bam = BAMIterator(fp=cStringIO.StringIO(bam_data))
+        self.assertEqual(bam.header,
+                         "@SQ\tSN:gi|42410857|gb|AE017196.1|\tLN:1267782\n")
+        self.assertEqual(bam.references,[("gi|42410857|gb|AE017196.1|",1267782)])
+
+    def test_records(self):
+        """Read alignment records from BAM data
+        """
+        records = [r for r in BAMIterator(fp=cStringIO.StringIO(bam_data),
+                                          nthreads=2)]
+        self.assertEqual(len(records),2)
+        self.assertEqual(str(records[0]),sam_data)
+        self.assertEqual(str(records[1]),
+                         "unmapped\t4\t*\t0\t0\t*\t*\t0\t0\tACGTN\t*")
+
+    def test_close_early(self):
+        """Stop iterating early and close the BAMIterator
+        """
+        with BAMIterator(fp=cStringIO.StringIO(bam_data),nthreads=2) as bam:
+            self.assertEqual(str(bam.next()),sam_data)
+
+    def test_record_fields(self):
+        """Check BAMRecord fields match SAM values
+        """
+        record = BAMIterator(fp=cStringIO.StringIO(bam_data)).next()
+        self.assertEqual(record.qname,"SRR189243_1-SRR189243.3751")
+        self.assertEqual(record.flag,81)
+        self.assertEqual(record.rname,"gi|42410857|gb|AE017196.1|")
+        self.assertEqual(record.pos,60083)
+        self.assertEqual(record.mapq,30)
+        self.assertEqual(record.cigar,"36M")
+        self.assertEqual(record.cigar_operations,((36,'M'),))
+        self.assertEqual(record.rnext,"=")
+        self.assertEqual(record.pnext,60200)
+        self.assertEqual(record.tlen,153)
+        self.assertEqual(record.seq,"CGATACGGGGACATCCGGCCTGCTCCTTCTCACATG")
+        self.assertEqual(record.qual,"IIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIHH")
+        self.assertEqual(record.md,"MD:Z:1A0C0C0C1T0C0T27")
+        self.assertEqual(record.nh,"NH:i:2")
+
+class TestDecodeTags(unittest.TestCase):
+
+    def test_decode_tags(self):
+        """Decode different types of BAM tags
+        """
+        data = "XAAy" + "XiI" + struct.pack('<I',100000) + \
+            "Xff" + struct.pack('<f',0.5) + "XZZhello\0" + \
+            "XBBs" + struct.pack('<ihhh',3,-1,2,3)
+        self.assertEqual(decode_tags(data),
+                         ['XA:A:y','Xi:i:100000','Xf:f:0.5','XZ:Z:hello',
+                          'XB:B:s,-1,2,3'])
+
+class TestIsBAMFile(unittest.TestCase):
+
+    def setUp(self):
+        self.bam = tempfile.mkstemp(suffix='.bam')[1]
+        open(self.bam,'wb').write(bam_data)
+        self.sam = tempfile.mkstemp(suffix='.sam')[1]
+        open(self.sam,'w').write(sam_data)
+
+    def tearDown(self):
+        os.remove(self.bam)
+        os.remove(self.sam)
+
+    def test_is_bam_file(self):
+        self.assertTrue(is_bam_file(self.bam))
+        self.assertFalse(is_bam_file(self.sam))
+
+def run_tests():
+    """Run the tests
+    """
+    unittest.main()
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+    # Run the tests
+    run_tests()
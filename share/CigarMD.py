@@ -0,0 +1,346 @@
+#     CigarMD.py: decode CIGAR strings and MD tags from SAM alignments
+#     Copyright (C) University of Manchester 2026
+#
+########################################################################
+#
+# CigarMD.py
+#
+#########################################################################
+
+__version__ = "0.0.1"
+
+"""CigarMD
+
+Functions for decoding the CIGAR strings and MD tags found in SAM/BAM
+alignment records:
+
+* parse_cigar: split CIGAR string into (count,code) operations
+* parse_md: split MD tag into (code,value) operations
+* md_from_tag: extract the MD string from a full 'MD:Z:...' tag
+* reference_length: number of reference bases spanned by a CIGAR
+* recover_reference_sequence: rebuild the reference sequence for an
+  alignment
+
+Operations are returned as tuples of tuples. CIGAR strings are heavily
+repeated within an alignment file (e.g. '76M'), so the results of
+decoding a CIGAR string are cached and reused.
+
+CIGAR operations are (count,code) tuples, where code is one of the
+SAM operation letters 'MIDNSHP=X' e.g. '6M1I29M' gives
+
+((6,'M'),(1,'I'),(29,'M'))
+
+MD operations are (code,value) tuples where code is one of:
+
+MD_MATCH    value is the number of matching bases (integer)
+MD_MISMATCH value is the reference base (string)
+MD_DELETION value is the deleted reference bases (string, without
+            the leading '^')
+
+e.g. '3C3T1^GCTCAG25T0' gives
+
+((MD_MATCH,3),(MD_MISMATCH,'C'),(MD_MATCH,3),(MD_MISMATCH,'T'),
+ (MD_MATCH,1),(MD_DELETION,'GCTCAG'),(MD_MATCH,25),(MD_MISMATCH,'T'),
+ (MD_MATCH,0))
+
+SAM format specification v1.4: http://samtools.sourceforge.net/SAM1.pdf
+"""
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import re
+import logging
+
+#######################################################################
+# Module constants
+#######################################################################
+
+# MD operation codes
+MD_MATCH = '='
+MD_MISMATCH = 'X'
+MD_DELETION = '^'
+
+# Precompiled regular expressions for tokenising
+CIGAR_OPERATION = re.compile(r"(\d+)([MIDNSHP=X])")
+CIGAR_STRING = re.compile(r"^(\d+[MIDNSHP=X])*$")
+MD_OPERATION = re.compile(r"(\d+)|([A-Z])|\^([A-Z]+)")
+
+# CIGAR operations which consume bases from the aligned sequence
+# and/or the reference
+CONSUMES_QUERY = 'MIS=X'
+CONSUMES_REFERENCE = 'MDN=X'
+
+# Maximum number of distinct CIGAR strings to cache
+CACHE_SIZE = 10000
+
+#######################################################################
+# Module data
+#######################################################################
+
+# Caches of decoded CIGAR strings
+_cigar_cache = {}
+_layout_cache = {}
+
+#######################################################################
+# Module Functions
+#######################################################################
+
+def parse_cigar(cigar_string):
+    """Split a CIGAR string into operations
+
+    Results are cached, so repeated calls with the same CIGAR
+    string are cheap.
+
+    Arguments:
+      cigar_string: the CIGAR string (e.g. '6M1I29M')
+
+    Returns:
+      Tuple of (count,code) tuples e.g. ((6,'M'),(1,'I'),(29,'M')),
+      or an empty tuple if the CIGAR string is '*'.
+
+    Raises:
+      ValueError if the CIGAR string cannot be decoded.
+    """
+    try:
+        return _cigar_cache[cigar_string]
+    except KeyError:
+        pass
+    if cigar_string == '*':
+        # CIGAR unavailable
+        operations = ()
+    elif CIGAR_STRING.match(cigar_string):
+        operations = tuple([(int(count),code) for count,code in
+                            CIGAR_OPERATION.findall(cigar_string)])
+    else:
+        raise ValueError("Unable to decode CIGAR string '%s'" % cigar_string)
+    if len(_cigar_cache) >= CACHE_SIZE:
+        _cigar_cache.clear()
+    _cigar_cache[cigar_string] = operations
+    return operations
+
+def parse_md(md):
+    """Split an MD string into operations
+
+    Arguments:
+      md: the MD string, without the leading 'MD:Z:'
+        (e.g. '3C3T1^GCTCAG25T0')
+
+    Returns:
+      Tuple of (code,value) tuples, where code is one of MD_MATCH,
+      MD_MISMATCH or MD_DELETION.
+    """
+    operations = []
+    for nmatch,mismatch,deletion in MD_OPERATION.findall(md):
+        if nmatch:
+            operations.append((MD_MATCH,int(nmatch)))
+        elif mismatch:
+            operations.append((MD_MISMATCH,mismatch))
+        else:
+            operations.append((MD_DELETION,deletion))
+    return tuple(operations)
+
+def md_from_tag(md_tag):
+    """Return the MD string from a full MD tag
+
+    Arguments:
+      md_tag: the full MD tag (e.g. 'MD:Z:1A0C0C0C1T0C0T27')
+
+    Returns:
+      The MD string (e.g. '1A0C0C0C1T0C0T27').
+    """
+    return md_tag.split(':')[2]
+
+def reference_length(cigar_string):
+    """Return the number of reference bases spanned by a CIGAR string
+
+    Arguments:
+      cigar_string: the CIGAR string (e.g. '2M1I7M6D26M')
+
+    Returns:
+      Number of bases of the reference covered by the alignment
+      (e.g. 41).
+    """
+    return sum([count for count,code in parse_cigar(cigar_string)
+                if code in CONSUMES_REFERENCE])
+
+def reference_layout(cigar_string):
+    """Return the layout of the reference sequence implied by a CIGAR
+
+    The layout is a tuple of (start,length) tuples which describe
+    how to build the reference sequence from the aligned sequence:
+    where start is an integer, 'length' bases are sliced from the
+    aligned sequence starting at that position; where start is None,
+    'length' placeholder bases are inserted (for deleted bases).
+
+    Inserted and soft-clipped bases are skipped; hard clips and
+    padding are ignored. Results are cached.
+
+    Arguments:
+      cigar_string: the CIGAR string (e.g. '6M1I29M')
+
+    Returns:
+      Tuple of (start,length) tuples.
+    """
+    try:
+        return _layout_cache[cigar_string]
+    except KeyError:
+        pass
+    layout = []
+    index = 0
+    for count,code in parse_cigar(cigar_string):
+        if code in 'M=X':
+            # (Mis)match: keep aligned sequence for now
+            layout.append((index,count))
+            index += count
+        elif code in 'IS':
+            # Insertion or soft clip: skip bases in aligned sequence
+            index += count
+        elif code == 'D':
+            # Deletion: placeholders for unknown bases
+            layout.append((None,count))
+        elif code in 'HP':
+            # Hard clip or padding: nothing to do
+            pass
+        else:
+            logging.error("Unknown operation: %s%s" % (count,code))
+    layout = tuple(layout)
+    if len(_layout_cache) >= CACHE_SIZE:
+        _layout_cache.clear()
+    _layout_cache[cigar_string] = layout
+    return layout
+
+def recover_reference_sequence(aligned_seq,cigar_string,md_tag):
+    """Recover the reference sequence given data from a SAM file
+
+    Reconstructs the reference sequence given the CIGAR string, MD tag
+    and aligned sequence from a SAM file.
+
+    Developed using the examples from
+    http://davetang.org/muse/2011/01/28/perl-and-sam/
+
+    Arguments:
+      aligned_seq: the aligned sequence (SEQ field of the SAM file)
+      cigar_string: the CIGAR string (e.g. '6M1I29M')
+      md_tag: the full MD tag (e.g. 'MD:Z:1A0C0C0C1T0C0T27')
+
+    Returns:
+      Recovered reference sequence.
+    """
+    if not md_tag: return None
+    # Apply the CIGAR operations in reverse to get the first
+    # version of the reference sequence
+    pieces = []
+    for start,length in reference_layout(cigar_string):
+        if start is None:
+            pieces.append('x'*length)
+        else:
+            pieces.append(aligned_seq[start:start+length])
+    refseq = ''.join(pieces)
+    # Apply the operations in the MD tag: matching bases are
+    # kept, mismatched and deleted bases are replaced by the
+    # reference bases
+    pieces = []
+    index = 0
+    for code,value in parse_md(md_from_tag(md_tag)):
+        if code == MD_MATCH:
+            pieces.append(refseq[index:index+value])
+            index += value
+        else:
+            pieces.append(value)
+            index += len(value)
+    pieces.append(refseq[index:])
+    return ''.join(pieces)
+
+#######################################################################
+# Tests
+#######################################################################
+
+import unittest
+
+class TestParseCigar(unittest.TestCase):
+    def test_parse_cigar(self):
+        self.assertEqual(parse_cigar('76M'),((76,'M'),))
+        self.assertEqual(parse_cigar('2M1I7M6D26M'),
+                         ((2,'M'),(1,'I'),(7,'M'),(6,'D'),(26,'M')))
+        self.assertEqual(parse_cigar('5S10M2N3=1X4H'),
+                         ((5,'S'),(10,'M'),(2,'N'),(3,'='),(1,'X'),(4,'H')))
+    def test_parse_cigar_is_cached(self):
+        self.assertTrue(parse_cigar('9M9D27M') is parse_cigar('9M9D27M'))
+    def test_parse_bad_cigar(self):
+        self.assertRaises(ValueError,parse_cigar,'M5I1M27')
+        self.assertRaises(ValueError,parse_cigar,'10M5Q')
+    def test_parse_unavailable_cigar(self):
+        self.assertEqual(parse_cigar('*'),())
+
+class TestParseMD(unittest.TestCase):
+    def test_parse_md(self):
+        self.assertEqual(parse_md('75T0'),
+                         ((MD_MATCH,75),(MD_MISMATCH,'T'),(MD_MATCH,0)))
+        self.assertEqual(parse_md('3C3T1^GCTCAG25T0'),
+                         ((MD_MATCH,3),(MD_MISMATCH,'C'),(MD_MATCH,3),
+                          (MD_MISMATCH,'T'),(MD_MATCH,1),(MD_DELETION,'GCTCAG'),
+                          (MD_MATCH,25),(MD_MISMATCH,'T'),(MD_MATCH,0)))
+    def test_md_from_tag(self):
+        self.assertEqual(md_from_tag('MD:Z:1A0C0C0C1T0C0T27'),'1A0C0C0C1T0C0T27')
+
+class TestReferenceLength(unittest.TestCase):
+    def test_reference_length(self):
+        self.assertEqual(reference_length('76M'),76)
+        self.assertEqual(reference_length('2M1I7M6D26M'),41)
+        self.assertEqual(reference_length('5S10M200N10M'),220)
+
+class TestReferenceLayout(unittest.TestCase):
+    def test_reference_layout(self):
+        self.assertEqual(reference_layout('2M1I7M6D26M'),
+                         ((0,2),(3,7),(None,6),(10,26)))
+        self.assertEqual(reference_layout('3S10M'),((3,10),))
+
+class TestRecoverReferenceSequence(unittest.TestCase):
+    def test_mutations_only(self):
+        self.assertEqual(recover_reference_sequence(
+                "CGATACGGGGACATCCGGCCTGCTCCTTCTCACATG",
+                "36M",
+                "MD:Z:1A0C0C0C1T0C0T27"),
+                         "CACCCCTCTGACATCCGGCCTGCTCCTTCTCACATG")
+    def test_insertions(self):
+        self.assertEqual(recover_reference_sequence(
+                "GAGACGGGGTGACATCCGGCCTGCTCCTTCTCACAT",
+                "6M1I29M",
+                "MD:Z:0C1C0C1C0T0C27"),
+                         "CACCCCTCTGACATCCGGCCTGCTCCTTCTCACAT")
+    def test_deletions(self):
+        self.assertEqual(recover_reference_sequence(
+                "AGTGATGGGGGGGTTCCAGGTGGAGACGAGGACTCC",
+                "9M9D27M",
+                "MD:Z:2G0A5^ATGATGTCA27"),
+                         "AGGAATGGGATGATGTCAGGGGTTCCAGGTGGAGACGAGGACTCC")
+    def test_insertions_and_deletions(self):
+        self.assertEqual(recover_reference_sequence(
+                "AGTGATGGGAGGATGTCTCGTCTGTGAGTTACAGCA",
+                "2M1I7M6D26M",
+                "MD:Z:3C3T1^GCTCAG25T0"),
+                         "AGGCTGGTAGCTCAGGGATGTCTCGTCTGTGAGTTACAGCT")
+    def test_soft_clipping(self):
+        self.assertEqual(recover_reference_sequence(
+                "NNNCGATACGGGGACATCCGGCCTGCTCCTTCTCACATG",
+                "3S36M",
+                "MD:Z:1A0C0C0C1T0C0T27"),
+                         "CACCCCTCTGACATCCGGCCTGCTCCTTCTCACATG")
+    def test_no_md_tag(self):
+        self.assertEqual(recover_reference_sequence("CGATACG","7M",None),None)
+
+def run_tests():
+    """Run the tests
+    """
+    logging.getLogger().setLevel(logging.CRITICAL)
+    unittest.main()
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+    # Run the tests
+    run_tests()
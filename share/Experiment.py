@@ -104,15 +104,19 @@ class ExperimentList:
     definition of each experiment.
     """
 
-    def __init__(self,solid_run_dir=None):
+    def __init__(self,solid_run_dir=None,use_snapshots=False):
         """Create a new ExperimentList instance.
 
         Arguments:
           solid_run_dir: (optional) the path of the source SOLiD run
             directory.
+          use_snapshots: (optional) if True then use (and update)
+            snapshot files in the SOLiD run directories, to avoid
+            rescanning unchanged runs (see SolidData.SolidRun)
         """
         self.experiments = []
         self.solid_run_dir = solid_run_dir
+        self.use_snapshots = use_snapshots
         self.solid_runs = []
         self.__getSolidRunData()
 
@@ -126,7 +130,11 @@ class ExperimentList:
             logging.debug("Acquiring run information")
             for solid_dir in (self.solid_run_dir,self.solid_run_dir+"_2"):
                 logging.debug("Examining %s" % solid_dir)
-                run = SolidData.SolidRun(solid_dir)
+                if self.use_snapshots:
+                    snapshot = os.path.join(solid_dir,SolidData.SNAPSHOT_FILE)
+                else:
+                    snapshot = None
+                run = SolidData.SolidRun(solid_dir,snapshot=snapshot)
                 if not run:
                     logging.debug("Unable to get run data for %s" % solid_dir)
                 else:
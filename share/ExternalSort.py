@@ -0,0 +1,651 @@
+#!/usr/bin/env python
+#
+#     ExternalSort.py: sort large tab-delimited files using temporary files
+#     Copyright (C) University of Manchester 2013 Peter Briggs
+#
+########################################################################
+#
+# ExternalSort.py
+#
+#########################################################################
+
+"""ExternalSort
+
+Classes and functions for sorting tab-delimited files which are too
+large to be sorted in memory (e.g. with TabFile.sort).
+
+The input is read in chunks which fit within a memory budget; each
+chunk is sorted and written to a temporary file (a 'run'), and then
+the runs are merged to produce the sorted output.
+
+Lines are sorted on one or more key columns, each of which can have a
+type (used to convert the values before comparing them) and can be
+sorted in ascending or descending order, using SortKey objects:
+
+>>> import ExternalSort
+>>> keys = (ExternalSort.SortKey(0),
+...         ExternalSort.SortKey('start',int),
+...         ExternalSort.SortKey('score',float,reverse=True))
+>>> ExternalSort.sort_tab_file('bins.txt','bins.sorted.txt',keys,
+...                            first_line_is_header=True)
+
+Keys which are just column names or indices sort as strings in
+ascending order.
+
+The runs can also be sorted by a pool of worker processes:
+
+>>> sorter = ExternalSort.ExternalSorter(keys,workers=4)
+>>> sorter.sort('bins.txt','bins.sorted.txt',first_line_is_header=True)
+
+Lines with equal keys are kept in the order that they appear in the
+input. Comment lines (i.e. starting with '#', ignoring any leading
+whitespace, as for TabFile) are copied to the start of the output,
+and blank lines are dropped.
+"""
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import os
+import shutil
+import tempfile
+import heapq
+import multiprocessing
+from collections import deque
+
+#######################################################################
+# Module constants
+#######################################################################
+
+# Default memory budget (approximate bytes of data held in memory)
+DEFAULT_BUFFER_SIZE = 64*1024*1024
+
+# Maximum number of runs to merge at once
+MAX_MERGE = 128
+
+#######################################################################
+# Classes
+#######################################################################
+
+class SortKey:
+    """Class describing a column to sort on
+
+    A SortKey specifies the column (name or index), the type that
+    values should be converted to before being compared (e.g. str,
+    int or float), and whether the sort on this column is in
+    ascending or descending order.
+
+    The type should be a builtin type or a module-level function if
+    the sort uses worker processes.
+    """
+    def __init__(self,column,type_=str,reverse=False):
+        """Create a new SortKey
+
+        Arguments:
+          column: name or integer index of the column
+          type_: (optional) type or function used to convert the
+            values in the column (defaults to str)
+          reverse: (optional) if True then sort the column in
+            descending order (default is ascending order)
+        """
+        self.column = column
+        self.type = type_
+        self.reverse = reverse
+
+    def __repr__(self):
+        return "SortKey(%r,%s,reverse=%s)" % (self.column,
+                                              getattr(self.type,'__name__',
+                                                      self.type),
+                                              self.reverse)
+
+class ExternalSorter:
+    """Class for sorting tab-delimited files using temporary files
+
+    Example usage:
+
+    >>> sorter = ExternalSorter((SortKey('chr'),SortKey('start',int)))
+    >>> sorter.sort('in.txt','out.txt',first_line_is_header=True)
+
+    The input is read in chunks of up to 'buffer_size' bytes which are
+    sorted and written to temporary files, and these are then merged
+    into the output. If the input fits within the buffer then it is
+    sorted entirely in memory.
+
+    With more than one worker, up to 'workers'+2 chunks can be held
+    in memory at once (those queued or being sorted by the workers,
+    plus the one being read), so 'buffer_size' is divided between
+    them to keep the total within the same budget.
+    """
+    def __init__(self,keys,delimiter='\t',buffer_size=DEFAULT_BUFFER_SIZE,
+                 workers=1,tmp_dir=None):
+        """Create a new ExternalSorter
+
+        Arguments:
+          keys: list of SortKey objects, column names or column
+            indices to sort on (the first is the primary key)
+          delimiter: (optional) delimiter character (defaults to tab)
+          buffer_size: (optional) approximate number of bytes of data
+            to hold in memory at once, shared between the chunks being
+            sorted if there are multiple workers (default
+            DEFAULT_BUFFER_SIZE)
+          workers: (optional) number of worker processes to use for
+            sorting the runs (default is 1, i.e. sort in the main
+            process)
+          tmp_dir: (optional) directory to write temporary files to
+            (defaults to the system temporary directory)
+        """
+        self.keys = []
+        for key in keys:
+            if not isinstance(key,SortKey):
+                key = SortKey(key)
+            self.keys.append(key)
+        if not self.keys:
+            raise ValueError, "No sort keys specified"
+        self.delimiter = delimiter
+        self.buffer_size = buffer_size
+        self.workers = max(1,int(workers))
+        self.tmp_dir = tmp_dir
+
+    def sort(self,filen=None,out_filen=None,fp=None,out_fp=None,
+             first_line_is_header=False):
+        """Sort a tab-delimited file
+
+        One of 'filen' or 'fp' must be given for the input, and one
+        of 'out_filen' or 'out_fp' for the output.
+
+        Arguments:
+          filen: (optional) name of file to sort; ignored if fp is
+            also specified
+          out_filen: (optional) name of file to write sorted data to;
+            ignored if out_fp is also specified
+          fp: (optional) a file-like object to read data from
+          out_fp: (optional) a file-like object to write sorted data
+            to
+          first_line_is_header: (optional) if True then the first line
+            is a header with column names (which is written out first
+            and can be used to refer to columns in the keys)
+
+        Returns:
+          Number of data lines written.
+        """
+        if fp is None:
+            fp = open(filen,'rU')
+            close_fp = True
+        else:
+            close_fp = False
+        runs = []
+        pool = None
+        work_dir = None
+        try:
+            # Deal with the header
+            header = None
+            if first_line_is_header:
+                header = fp.readline()
+            keys = self.__resolve_keys(header)
+            # Read and sort the runs
+            # If there are multiple workers then only a limited number
+            # of runs are queued at once to bound the memory used
+            comments = []
+            pending = deque()
+            spilled = False
+            if self.workers == 1:
+                chunk_size = self.buffer_size
+            else:
+                chunk_size = max(1,self.buffer_size/(self.workers+2))
+            for lines in self.__chunks(fp,comments,chunk_size):
+                if not (spilled or lines.spilled):
+                    # Everything fits in memory
+                    sort_lines(lines,keys,self.delimiter)
+                    break
+                if not spilled:
+                    # Temporary files for this sort go into their own
+                    # directory, so they can all be removed afterwards
+                    # (including any from tasks which didn't finish)
+                    work_dir = tempfile.mkdtemp(prefix='ExternalSort.',
+                                                dir=self.tmp_dir)
+                spilled = True
+                run_args = (lines,keys,self.delimiter,work_dir)
+                if self.workers == 1:
+                    runs.append(_sort_run(run_args))
+                    continue
+                if pool is None:
+                    pool = multiprocessing.Pool(self.workers)
+                pending.append(pool.apply_async(_sort_run,(run_args,)))
+                while len(pending) > self.workers:
+                    runs.append(pending.popleft().get())
+            while pending:
+                runs.append(pending.popleft().get())
+            if pool is not None:
+                pool.close()
+                pool.join()
+                pool = None
+            if spilled:
+                lines = None
+            if close_fp:
+                fp.close()
+                close_fp = False
+            # Write the output
+            if out_fp is None:
+                out_fp = open(out_filen,'w')
+                close_out_fp = True
+            else:
+                close_out_fp = False
+            try:
+                if header is not None:
+                    out_fp.write(header)
+                for line in comments:
+                    out_fp.write(line)
+                if lines is not None:
+                    out_fp.writelines(lines)
+                    nlines = len(lines)
+                else:
+                    nlines = self.__merge(runs,keys,out_fp,work_dir)
+            finally:
+                if close_out_fp:
+                    out_fp.close()
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            if close_fp:
+                fp.close()
+            if work_dir is not None:
+                shutil.rmtree(work_dir,ignore_errors=True)
+        return nlines
+
+    def __resolve_keys(self,header):
+        """Internal: convert column names in keys to indices
+
+        Returns a list of (index,type,reverse) tuples.
+        """
+        names = []
+        if header is not None:
+            names = header.rstrip('\n').strip('#').split(self.delimiter)
+        keys = []
+        for key in self.keys:
+            try:
+                i = names.index(key.column)
+            except ValueError:
+                try:
+                    i = int(key.column)
+                except ValueError:
+                    raise KeyError, "column '%s' not found" % key.column
+            keys.append((i,key.type,key.reverse))
+        return keys
+
+    def __chunks(self,fp,comments,chunk_size):
+        """Internal: generator returning chunks of lines from the input
+
+        Each chunk is a list of lines (holding up to about 'chunk_size'
+        bytes) with a 'spilled' attribute which is True if there is
+        more input still to be read. Comment lines are added to the
+        'comments' list rather than to the chunks.
+        """
+        lines = _Chunk()
+        size = 0
+        for line in fp:
+            if line.lstrip().startswith('#'):
+                comments.append(line)
+                continue
+            if not line.strip():
+                continue
+            if not line.endswith('\n'):
+                line += '\n'
+            if size >= chunk_size:
+                lines.spilled = True
+                yield lines
+                lines = _Chunk()
+                size = 0
+            lines.append(line)
+            size += len(line)
+        yield lines
+
+    def __merge(self,runs,keys,out_fp,tmp_dir):
+        """Internal: merge sorted runs into the output
+
+        If there are more than MAX_MERGE runs then groups of runs are
+        merged into intermediate files (in 'tmp_dir') first.
+
+        Returns the number of lines written.
+        """
+        while len(runs) > MAX_MERGE:
+            groups = [runs[i:i+MAX_MERGE] for i in xrange(0,len(runs),MAX_MERGE)]
+            merged = []
+            for group in groups:
+                fd,run = tempfile.mkstemp(suffix='.run',dir=tmp_dir)
+                merged.append(run)
+                fp = os.fdopen(fd,'w')
+                try:
+                    merge_runs(group,keys,fp,self.delimiter)
+                finally:
+                    fp.close()
+                for filen in group:
+                    os.remove(filen)
+            runs[:] = merged
+        return merge_runs(runs,keys,out_fp,self.delimiter)
+
+class _Chunk(list):
+    """Internal: list of lines with a 'spilled' flag
+    """
+    spilled = False
+
+class _Reversed(object):
+    """Internal: wrapper which reverses the ordering of a value
+
+    Used for descending sorts on non-numeric keys.
+    """
+    __slots__ = ('value',)
+    def __init__(self,value):
+        self.value = value
+    def __lt__(self,other):
+        return other.value < self.value
+    def __eq__(self,other):
+        return self.value == other.value
+    def __ne__(self,other):
+        return self.value != other.value
+
+#######################################################################
+# Functions
+#######################################################################
+
+def sort_tab_file(filen,out_filen,keys,first_line_is_header=False,
+                  delimiter='\t',buffer_size=DEFAULT_BUFFER_SIZE,workers=1,
+                  tmp_dir=None):
+    """Sort a tab-delimited file on one or more key columns
+
+    Convenience wrapper for ExternalSorter.
+
+    Arguments:
+      filen: name of file to sort
+      out_filen: name of file to write sorted data to
+      keys: list of SortKey objects, column names or column indices
+        to sort on (the first is the primary key)
+      first_line_is_header: (optional) if True then the first line is
+        a header with column names
+      delimiter: (optional) delimiter character (defaults to tab)
+      buffer_size: (optional) approximate number of bytes of data to
+        hold in memory at once (shared between the workers)
+      workers: (optional) number of worker processes to use for
+        sorting the runs
+      tmp_dir: (optional) directory to write temporary files to
+
+    Returns:
+      Number of data lines written.
+    """
+    return ExternalSorter(keys,delimiter=delimiter,buffer_size=buffer_size,
+                          workers=workers,tmp_dir=tmp_dir).sort(
+                              filen,out_filen,
+                              first_line_is_header=first_line_is_header)
+
+def line_key(line,keys,delimiter='\t'):
+    """Return the sort key for a line
+
+    Arguments:
+      line: line of tab-delimited data
+      keys: list of (index,type,reverse) tuples
+      delimiter: (optional) delimiter character (defaults to tab)
+
+    Returns:
+      Tuple of converted key values which can be compared.
+    """
+    fields = line.rstrip('\n').split(delimiter)
+    key = []
+    for i,type_,reverse in keys:
+        try:
+            value = type_(fields[i])
+        except IndexError:
+            raise ValueError, "too few fields in line: %s" % line.rstrip('\n')
+        except (ValueError,TypeError),ex:
+            raise ValueError, "bad value '%s' in column %d (%s) in line: %s" % \
+                (fields[i],i,ex,line.rstrip('\n'))
+        if reverse:
+            if type_ in (int,long,float):
+                value = -value
+            else:
+                value = _Reversed(value)
+        key.append(value)
+    return tuple(key)
+
+def sort_lines(lines,keys,delimiter='\t'):
+    """Sort a list of lines in place
+
+    Arguments:
+      lines: list of lines of tab-delimited data
+      keys: list of (index,type,reverse) tuples
+      delimiter: (optional) delimiter character (defaults to tab)
+    """
+    lines.sort(key=lambda line: line_key(line,keys,delimiter))
+
+def merge_runs(runs,keys,fp,delimiter='\t'):
+    """Merge sorted files into a single sorted output
+
+    Lines with equal keys are output in the order of the runs they
+    came from.
+
+    Arguments:
+      runs: list of names of files with sorted data
+      keys: list of (index,type,reverse) tuples
+      fp: file-like object to write the merged data to
+      delimiter: (optional) delimiter character (defaults to tab)
+
+    Returns:
+      Number of lines written.
+    """
+    files = [open(run,'rU') for run in runs]
+    nlines = 0
+    try:
+        heap = []
+        for i,f in enumerate(files):
+            line = f.readline()
+            if line:
+                heap.append((line_key(line,keys,delimiter),i,line))
+        heapq.heapify(heap)
+        while heap:
+            key,i,line = heap[0]
+            fp.write(line)
+            nlines += 1
+            line = files[i].readline()
+            if line:
+                heapq.heapreplace(heap,(line_key(line,keys,delimiter),i,line))
+            else:
+                heapq.heappop(heap)
+    finally:
+        for f in files:
+            f.close()
+    return nlines
+
+def _sort_run(args):
+    """Internal: sort a chunk of lines and write to a temporary file
+
+    Arguments are passed as a single tuple (lines,keys,delimiter,tmp_dir)
+    so that the function can be used with a multiprocessing pool.
+
+    Returns the name of the temporary file.
+    """
+    lines,keys,delimiter,tmp_dir = args
+    sort_lines(lines,keys,delimiter)
+    fd,run = tempfile.mkstemp(suffix='.run',dir=tmp_dir)
+    fp = os.fdopen(fd,'w')
+    try:
+        fp.writelines(lines)
+    finally:
+        fp.close()
+    return run
+
+#######################################################################
+# Tests
+#######################################################################
+
+import unittest
+import random
+
+class TestExternalSorter(unittest.TestCase):
+
+    def setUp(self):
+        # Temporary working directory
+        self.wd = tempfile.mkdtemp()
+        # Test data
+        self.header = "#chr\tstart\tend\tscore\n"
+        self.data = ["chr2\t100\t200\t1.5\n",
+                     "chr1\t1000\t1100\t0.5\n",
+                     "chr10\t50\t150\t2.5\n",
+                     "chr1\t20\t120\t1.5\n",
+                     "chr2\t30\t130\t0.5\n",
+                     "chr1\t300\t400\t2.5\n"]
+        self.filen = os.path.join(self.wd,'data.txt')
+        self.out_filen = os.path.join(self.wd,'sorted.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+
+    def write_data(self,data,header=None):
+        fp = open(self.filen,'w')
+        if header:
+            fp.write(header)
+        fp.writelines(data)
+        fp.close()
+
+    def read_output(self):
+        return open(self.out_filen).read()
+
+    def test_sort_in_memory(self):
+        """Sort data which fits in memory
+        """
+        self.write_data(self.data,self.header)
+        n = sort_tab_file(self.filen,self.out_filen,
+                          (SortKey('chr'),SortKey('start',int)),
+                          first_line_is_header=True)
+        self.assertEqual(n,6)
+        self.assertEqual(self.read_output(),self.header +
+                         "chr1\t20\t120\t1.5\n"
+                         "chr1\t300\t400\t2.5\n"
+                         "chr1\t1000\t1100\t0.5\n"
+                         "chr10\t50\t150\t2.5\n"
+                         "chr2\t30\t130\t0.5\n"
+                         "chr2\t100\t200\t1.5\n")
+
+    def test_sort_with_runs(self):
+        """Sort data using temporary files
+        """
+        self.write_data(self.data,self.header)
+        n = sort_tab_file(self.filen,self.out_filen,
+                          (SortKey('score',float,reverse=True),
+                           SortKey(1,int)),
+                          first_line_is_header=True,buffer_size=20,
+                          tmp_dir=self.wd)
+        self.assertEqual(n,6)
+        self.assertEqual(self.read_output(),self.header +
+                         "chr10\t50\t150\t2.5\n"
+                         "chr1\t300\t400\t2.5\n"
+                         "chr1\t20\t120\t1.5\n"
+                         "chr2\t100\t200\t1.5\n"
+                         "chr2\t30\t130\t0.5\n"
+                         "chr1\t1000\t1100\t0.5\n")
+        # Temporary files were removed
+        self.assertEqual(sorted(os.listdir(self.wd)),['data.txt','sorted.txt'])
+
+    def test_sort_is_stable(self):
+        """Lines with equal keys keep their input order
+        """
+        self.write_data(self.data)
+        sort_tab_file(self.filen,self.out_filen,(SortKey(3,float),),
+                      buffer_size=30)
+        self.assertEqual(self.read_output(),
+                         "chr1\t1000\t1100\t0.5\n"
+                         "chr2\t30\t130\t0.5\n"
+                         "chr2\t100\t200\t1.5\n"
+                         "chr1\t20\t120\t1.5\n"
+                         "chr10\t50\t150\t2.5\n"
+                         "chr1\t300\t400\t2.5\n")
+
+    def test_reverse_string_key(self):
+        """Sort a string column in descending order
+        """
+        self.write_data(self.data)
+        sort_tab_file(self.filen,self.out_filen,
+                      (SortKey(0,reverse=True),SortKey(1,int)),
+                      buffer_size=30)
+        self.assertEqual(self.read_output(),
+                         "chr2\t30\t130\t0.5\n"
+                         "chr2\t100\t200\t1.5\n"
+                         "chr10\t50\t150\t2.5\n"
+                         "chr1\t20\t120\t1.5\n"
+                         "chr1\t300\t400\t2.5\n"
+                         "chr1\t1000\t1100\t0.5\n")
+
+    def test_comments_and_blank_lines(self):
+        """Comment lines are output first and blank lines are dropped
+        """
+        self.write_data(["# Comment\n"] + self.data[:2] + ["\n"] + self.data[2:3])
+        sort_tab_file(self.filen,self.out_filen,(SortKey(1,int),))
+        self.assertEqual(self.read_output(),
+                         "# Comment\n"
+                         "chr10\t50\t150\t2.5\n"
+                         "chr2\t100\t200\t1.5\n"
+                         "chr1\t1000\t1100\t0.5\n")
+
+    def test_indented_comment(self):
+        """Comment lines can have leading whitespace
+        """
+        self.write_data(self.data[:2] + ["  # Indented comment\n"] + self.data[2:3])
+        n = sort_tab_file(self.filen,self.out_filen,(SortKey(1,int),),
+                          buffer_size=30)
+        self.assertEqual(n,3)
+        self.assertEqual(self.read_output(),
+                         "  # Indented comment\n"
+                         "chr10\t50\t150\t2.5\n"
+                         "chr2\t100\t200\t1.5\n"
+                         "chr1\t1000\t1100\t0.5\n")
+
+    def test_unknown_column(self):
+        """Sorting on a non-existent column raises KeyError
+        """
+        self.write_data(self.data,self.header)
+        self.assertRaises(KeyError,sort_tab_file,self.filen,self.out_filen,
+                          ('strand',),first_line_is_header=True)
+
+    def test_bad_key_value(self):
+        """A value which can't be converted gives an error with the line
+        """
+        self.write_data(self.data[:3] + ["chr3\tNA\t10\t1.0\n"] + self.data[3:])
+        try:
+            sort_tab_file(self.filen,self.out_filen,(SortKey(1,int),))
+            self.fail("ValueError not raised")
+        except ValueError,ex:
+            self.assertTrue("chr3\tNA\t10\t1.0" in str(ex))
+            self.assertTrue("column 1" in str(ex))
+
+    def test_bad_key_value_with_workers_removes_runs(self):
+        """Temporary files are removed if sorting a run fails
+        """
+        data = ["%d\t%.3f\n" % (i,random.random()) for i in xrange(500)]
+        data[250] = "NA\t0.5\n"
+        self.write_data(data)
+        sorter = ExternalSorter((SortKey(0,int),),buffer_size=100,workers=2,
+                                tmp_dir=self.wd)
+        self.assertRaises(ValueError,sorter.sort,self.filen,self.out_filen)
+        self.assertEqual(os.listdir(self.wd),['data.txt'])
+
+    def test_many_runs_with_workers(self):
+        """Sort random data with many runs and worker processes
+        """
+        data = ["%d\t%.3f\n" % (random.randint(0,1000),random.random())
+                for i in xrange(2000)]
+        self.write_data(data)
+        expected = sorted(data,key=lambda line: (int(line.split('\t')[0]),
+                                                 -float(line.split('\t')[1])))
+        n = ExternalSorter((SortKey(0,int),SortKey(1,float,reverse=True)),
+                           buffer_size=50,workers=2,
+                           tmp_dir=self.wd).sort(self.filen,self.out_filen)
+        self.assertEqual(n,2000)
+        self.assertEqual(self.read_output(),''.join(expected))
+        self.assertEqual(sorted(os.listdir(self.wd)),['data.txt','sorted.txt'])
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+    # Run tests
+    unittest.main()
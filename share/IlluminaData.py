@@ -7,7 +7,7 @@
 #
 #########################################################################
 
-__version__ = "1.1.1"
+__version__ = "1.3.1"
 
 """IlluminaData
 
@@ -29,6 +29,18 @@ import platforms
 import bcf_utils
 import TabFile
 
+#######################################################################
+# Constants
+#######################################################################
+
+# Default name for snapshot files in analysis directories
+SNAPSHOT_FILE = ".illumina_data_snapshot.json"
+
+# Default number of threads used to scan project and sample
+# directories (scanning concurrently can help on slow network
+# file systems, but is off by default)
+DISCOVERY_WORKERS = 1
+
 #######################################################################
 # Class definitions
 #######################################################################
@@ -183,10 +195,22 @@ class IlluminaData:
 
     get_project(): lookup and return an IlluminaProject object corresponding
                    to the supplied project name
+    save_snapshot(): save the directory index used to discover the
+                   projects etc to a snapshot file
+
+    The directories are examined via a bcf_utils.DirectoryIndex, which
+    can be saved to a snapshot file and reused by later IlluminaData
+    instances (via the 'snapshot' argument) as long as none of the
+    directories have been modified in the meantime.
+
+    The project and sample directories are listed concurrently on a
+    pool of threads before the IlluminaProject and IlluminaSample
+    objects are built from the cached listings.
 
     """
 
-    def __init__(self,illumina_analysis_dir,unaligned_dir="Unaligned"):
+    def __init__(self,illumina_analysis_dir,unaligned_dir="Unaligned",
+                 snapshot=None,workers=DISCOVERY_WORKERS):
         """Create and populate a new IlluminaData object
 
         Arguments:
@@ -195,6 +219,12 @@ class IlluminaData:
             'Unaligned').
           unaligned_dir: (optional) alternative name for the subdirectory
             under illumina_analysis_dir holding the fastq files
+          snapshot: (optional) name of a snapshot file; if the file
+            exists and is still valid then it is used instead of
+            rescanning the directories, otherwise the directories are
+            scanned and the snapshot is (re)written
+          workers: (optional) maximum number of directories to scan
+            at the same time (default DISCOVERY_WORKERS)
 
         """
         self.analysis_dir = os.path.abspath(illumina_analysis_dir)
@@ -205,15 +235,35 @@ class IlluminaData:
         self.unaligned_dir = os.path.join(self.analysis_dir,unaligned_dir)
         if not os.path.exists(self.unaligned_dir):
             raise IlluminaDataError, "Missing data directory %s" % self.unaligned_dir
+        # Directory lookups go via an index
+        self.__index = bcf_utils.DirectoryIndex()
+        if snapshot is not None and os.path.exists(snapshot):
+            if self.__index.load(snapshot):
+                logging.debug("Loaded snapshot from %s" % snapshot)
+        # Scan the project directories and then the sample
+        # directories, to populate the index
+        project_dirs = [os.path.join(self.unaligned_dir,f)
+                        for f in self.__index.listdir(self.unaligned_dir)
+                        if f.startswith("Project_") or
+                        f == "Undetermined_indices"]
+        self.__index.scan(project_dirs,workers=workers,types=True)
+        sample_dirs = []
+        for dirn in project_dirs:
+            if not self.__index.isdir(dirn):
+                continue
+            sample_dirs.extend([os.path.join(dirn,f)
+                                for f in self.__index.listdir(dirn)
+                                if f.startswith("Sample_")])
+        self.__index.scan(sample_dirs,workers=workers)
         # Look for projects
-        for f in os.listdir(self.unaligned_dir):
+        for f in self.__index.listdir(self.unaligned_dir):
             dirn = os.path.join(self.unaligned_dir,f)
-            if f.startswith("Project_") and os.path.isdir(dirn):
+            if f.startswith("Project_") and self.__index.isdir(dirn):
                 logging.debug("Project dirn: %s" % f)
-                self.projects.append(IlluminaProject(dirn))
+                self.projects.append(IlluminaProject(dirn,index=self.__index))
             elif f == "Undetermined_indices":
                 logging.debug("Undetermined dirn: %s" %f)
-                self.undetermined = IlluminaProject(dirn)
+                self.undetermined = IlluminaProject(dirn,index=self.__index)
         # Raise an exception if no projects found
         if not self.projects:
             raise IlluminaDataError, "No projects found"
@@ -222,6 +272,24 @@ class IlluminaData:
         # Determine whether data is paired end
         for p in self.projects:
             self.paired_end = (self.paired_end and p.paired_end)
+        # Update the snapshot
+        if snapshot is not None and self.__index.changed:
+            try:
+                self.save_snapshot(snapshot)
+            except (IOError,OSError),ex:
+                logging.warning("Unable to write snapshot %s: %s" %
+                                (snapshot,ex))
+
+    def save_snapshot(self,snapshot):
+        """Save the directory index to a snapshot file
+
+        The snapshot file can be passed to a new IlluminaData via its
+        'snapshot' argument to avoid rescanning the directories.
+
+        Arguments:
+          snapshot: name of the snapshot file to write
+        """
+        self.__index.save(snapshot)
 
     def get_project(self,name):
         """Return project that matches 'name'
@@ -263,12 +331,14 @@ class IlluminaProject:
 
     """
 
-    def __init__(self,dirn):
+    def __init__(self,dirn,index=None):
         """Create and populate a new IlluminaProject object
 
         Arguments:
           dirn: path to the directory holding the samples within the
                 project (expected to be in subdirectories "Sample_...")
+          index: (optional) bcf_utils.DirectoryIndex to use for
+                directory lookups
 
         """
         self.dirn = dirn
@@ -288,11 +358,13 @@ class IlluminaProject:
                 raise IlluminaDataError, "Bad project name '%s'" % self.dirn
         logging.debug("Project name: %s" % self.name)
         # Look for samples
+        if index is None:
+            index = bcf_utils.DirectoryIndex()
         self.sample_prefix = "Sample_"
-        for f in os.listdir(self.dirn):
+        for f in index.listdir(self.dirn):
             sample_dirn = os.path.join(self.dirn,f)
-            if f.startswith(self.sample_prefix) and os.path.isdir(sample_dirn):
-                self.samples.append(IlluminaSample(sample_dirn))
+            if f.startswith(self.sample_prefix) and index.isdir(sample_dirn):
+                self.samples.append(IlluminaSample(sample_dirn,index=index))
         # Raise an exception if no samples found
         if not self.samples:
             raise IlluminaDataError, "No samples found for project %s" % \
@@ -341,12 +413,14 @@ class IlluminaSample:
 
     """
 
-    def __init__(self,dirn):
+    def __init__(self,dirn,index=None):
         """Create and populate a new IlluminaSample object
 
         Arguments:
           dirn: path to the directory holding the fastq.gz file for the
                 sample
+          index: (optional) bcf_utils.DirectoryIndex to use for
+                directory lookups
 
         """
         self.dirn = dirn
@@ -357,7 +431,11 @@ class IlluminaSample:
         self.name = os.path.basename(dirn)[len(self.sample_prefix):]
         logging.debug("\tSample: %s" % self.name)
         # Look for fastq files
-        for f in os.listdir(self.dirn):
+        if index is not None:
+            filens = index.listdir(self.dirn)
+        else:
+            filens = os.listdir(self.dirn)
+        for f in filens:
             if f.endswith(".fastq.gz"):
                 self.add_fastq(f)
                 logging.debug("\tFastq : %s" % f)
@@ -1468,6 +1546,50 @@ class TestIlluminaData(unittest.TestCase):
         illumina_data = IlluminaData(self.mock_illumina_data.dirn)
         self.assertIlluminaData(illumina_data,self.mock_illumina_data)
 
+    def test_illumina_data_single_worker(self):
+        """Test with multiple projects, scanning with a single thread
+
+        """
+        self.makeMockIlluminaData(multiple_projects=True,multiplexed_run=True,
+                                  paired_end=True)
+        illumina_data = IlluminaData(self.mock_illumina_data.dirn,workers=1)
+        self.assertIlluminaData(illumina_data,self.mock_illumina_data)
+
+    def test_illumina_data_snapshot(self):
+        """Test with snapshot file
+
+        """
+        self.makeMockIlluminaData(multiple_projects=True,multiplexed_run=True,
+                                  paired_end=True)
+        snapshot = os.path.join(self.mock_illumina_data.dirn,SNAPSHOT_FILE)
+        illumina_data = IlluminaData(self.mock_illumina_data.dirn,
+                                     snapshot=snapshot)
+        self.assertIlluminaData(illumina_data,self.mock_illumina_data)
+        self.assertTrue(os.path.exists(snapshot))
+        # Reload from snapshot without listing any directories
+        bcf_listdir = bcf_utils.os.listdir
+        bcf_scandir = bcf_utils.scandir
+        def no_listing(*args):
+            raise AssertionError("Directory listed when snapshot is valid")
+        try:
+            bcf_utils.os.listdir = no_listing
+            bcf_utils.scandir = no_listing
+            illumina_data = IlluminaData(self.mock_illumina_data.dirn,
+                                         snapshot=snapshot)
+        finally:
+            bcf_utils.os.listdir = bcf_listdir
+            bcf_utils.scandir = bcf_scandir
+        self.assertIlluminaData(illumina_data,self.mock_illumina_data)
+        # Snapshot is ignored once the directories change
+        self.mock_illumina_data.add_fastq_batch('AB','AB1','AB1_GCCAAT',
+                                                lanes=(2,))
+        fastq = 'AB1_GCCAAT_L002_R1_001.fastq.gz'
+        open(os.path.join(self.mock_illumina_data.dirn,'Unaligned',
+                          'Project_AB','Sample_AB1',fastq),'w').write('')
+        illumina_data = IlluminaData(self.mock_illumina_data.dirn,
+                                     snapshot=snapshot)
+        self.assertTrue(fastq in illumina_data.get_project('AB').samples[0].fastq)
+
 class TestCasavaSampleSheet(unittest.TestCase):
 
     def setUp(self):
@@ -27,22 +27,41 @@ Usage:
 >>> Md5Sum.md5sum("myfile.txt")
 ... eacc9c036025f0e64fb724cacaadd8b4
 
-This module implements two methods for generating the md5 digest of a file:
-the first uses a method based on the hashlib module, while the second (used
-as a fallback for pre-2.5 Python) uses the now deprecated md5 module. Note
-however that the md5sum function determines itself which method to use.
+Digests are generated using the hashlib module (plus zlib for CRC32).
+
+Several digests can be generated from a single read of a file using the
+file_digests function, e.g.
+
+>>> Md5sum.file_digests("myfile.txt",('md5','sha256','crc32'))
+... {'md5': 'eacc9c03...', 'sha256': '1f4e7a2b...', 'crc32': '3610a686'}
+
+Checksums can also be stored in a persistent cache (an SQLite database file)
+using the Md5sumCache class, to avoid recomputing the checksums of files
+which haven't changed:
+
+>>> cache = Md5sum.Md5sumCache("md5sums.db")
+>>> Md5sum.md5sum("myfile.txt",cache=cache)
+... eacc9c036025f0e64fb724cacaadd8b4
+>>> cache.close()
 """
 
 #######################################################################
 # Import modules that this module depends on
 #######################################################################
 
+import os
+import time
+import random
+import logging
+import threading
+import struct
+import zlib
+import hashlib
 try:
-    # Preferentially use hashlib module
-    import hashlib
+    import sqlite3
 except ImportError:
-    # hashlib not available, use deprecated md5 module
-    import md5
+    # sqlite3 not available, checksum cache can't be used
+    pass
 
 #######################################################################
 # Modules constants
@@ -50,6 +69,240 @@ except ImportError:
 
 BLOCKSIZE = 1024*1024
 
+# Checksum cache modes
+CACHE_TRUST = 'trust'
+CACHE_VERIFY = 'verify'
+CACHE_REFRESH = 'refresh'
+CACHE_MODES = (CACHE_TRUST,CACHE_VERIFY,CACHE_REFRESH)
+
+# Commit new checksums to the cache file after this many updates,
+# or this many seconds since the last commit (whichever is first)
+CACHE_COMMIT_EVERY = 100
+CACHE_COMMIT_INTERVAL = 5.0
+
+#######################################################################
+# Classes
+#######################################################################
+
+class Crc32:
+    """Compute CRC32 checksum with the same interface as hashlib objects
+
+    Wraps zlib.crc32 so that a CRC32 checksum (e.g. as used in gzip
+    files) can be computed alongside hashlib digests.
+    """
+
+    name = 'crc32'
+
+    def __init__(self):
+        """Create a new Crc32 instance
+        """
+        self.__crc = 0
+
+    def update(self,data):
+        """Update the checksum with a string or buffer
+        """
+        self.__crc = zlib.crc32(data,self.__crc)
+
+    def digest(self):
+        """Return the checksum as a 4-byte big-endian string
+        """
+        return struct.pack('>I',self.__crc & 0xffffffff)
+
+    def hexdigest(self):
+        """Return the checksum as a string of 8 hex digits
+        """
+        return "%08x" % (self.__crc & 0xffffffff)
+
+class Md5sumCache:
+    """Persistent cache of MD5 sums
+
+    Stores MD5 sums in an SQLite database file, keyed on the device,
+    inode, size and modification time (in nanoseconds) of each file,
+    so that the checksums of unchanged files don't need to be
+    recomputed.
+
+    The cache can operate in one of three modes:
+
+    CACHE_TRUST: use cached checksums wherever they are available
+    CACHE_VERIFY: use cached checksums but recompute a random sample
+                  (set by 'sample_fraction') and check them against
+                  the cached values
+    CACHE_REFRESH: ignore cached checksums and recompute everything
+                   (the cache is updated with the new values)
+
+    Regardless of mode, each distinct file is only hashed once per
+    session, so hard-linked duplicates are not hashed twice.
+
+    Instances can be shared between threads.
+
+    New checksums are committed to the cache file every 'commit_every'
+    updates or 'commit_interval' seconds (whichever comes first), so
+    that most of the work done so far is kept if the program stops
+    part-way through. Call 'close' (e.g. in a 'finally' block) to
+    commit the remainder.
+
+    The following properties report cache usage:
+
+    nhits: number of checksums taken from the cache
+    nmisses: number of checksums which had to be computed
+    nverified: number of cached checksums which were recomputed
+    nmismatches: number of cached checksums found to be wrong
+    """
+
+    def __init__(self,cache_file,mode=CACHE_TRUST,sample_fraction=0.01,
+                 commit_every=CACHE_COMMIT_EVERY,
+                 commit_interval=CACHE_COMMIT_INTERVAL):
+        """Create a new Md5sumCache instance
+
+        Arguments:
+          cache_file: name of the SQLite database file to store
+            checksums in (will be created if it doesn't exist)
+          mode: (optional) one of CACHE_TRUST (the default),
+            CACHE_VERIFY or CACHE_REFRESH
+          sample_fraction: (optional) fraction of cached checksums
+            to recompute in CACHE_VERIFY mode (default 0.01)
+          commit_every: (optional) maximum number of updates to
+            make before committing them to the cache file
+          commit_interval: (optional) maximum time in seconds to
+            wait after an update before committing to the cache file
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError("Unrecognised cache mode '%s'" % mode)
+        self.mode = mode
+        self.sample_fraction = sample_fraction
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.nhits = 0
+        self.nmisses = 0
+        self.nverified = 0
+        self.nmismatches = 0
+        self.__lock = threading.Lock()
+        self.__key_locks = {}
+        self.__session = {}
+        self.__conn = sqlite3.connect(cache_file,check_same_thread=False)
+        self.__conn.execute("CREATE TABLE IF NOT EXISTS md5sums "
+                            "(device INTEGER, inode INTEGER, size INTEGER, "
+                            "mtime_ns INTEGER, md5 TEXT, "
+                            "PRIMARY KEY (device,inode,size,mtime_ns))")
+        self.__conn.commit()
+        self.__nuncommitted = 0
+        self.__last_commit = time.time()
+
+    def __commit(self):
+        """Internal: commit pending updates (lock must be held)
+        """
+        self.__conn.commit()
+        self.__nuncommitted = 0
+        self.__last_commit = time.time()
+
+    def __increment(self,counter):
+        """Internal: increment one of the usage counters
+        """
+        self.__lock.acquire()
+        try:
+            setattr(self,counter,getattr(self,counter)+1)
+        finally:
+            self.__lock.release()
+
+    def lookup(self,key):
+        """Return cached MD5 sum for a key, or None if not cached
+        """
+        self.__lock.acquire()
+        try:
+            row = self.__conn.execute("SELECT md5 FROM md5sums WHERE "
+                                      "device=? AND inode=? AND size=? AND "
+                                      "mtime_ns=?",key).fetchone()
+        finally:
+            self.__lock.release()
+        if row is None:
+            return None
+        return str(row[0])
+
+    def store(self,key,chksum):
+        """Store the MD5 sum for a key in the cache
+        """
+        self.__lock.acquire()
+        try:
+            self.__conn.execute("INSERT OR REPLACE INTO md5sums "
+                                "VALUES (?,?,?,?,?)",key+(chksum,))
+            self.__nuncommitted += 1
+            if self.__nuncommitted >= self.commit_every or \
+               time.time() - self.__last_commit >= self.commit_interval:
+                self.__commit()
+        finally:
+            self.__lock.release()
+
+    def md5sum(self,filen):
+        """Return the MD5 sum for a file, using the cache
+
+        Arguments:
+          filen: name of the file to get the checksum for
+
+        Returns:
+          Md5sum digest for the named file.
+
+        Raises:
+          IOError if the file can't be accessed.
+        """
+        try:
+            key = file_key(filen)
+        except OSError, ex:
+            raise IOError(ex.errno,ex.strerror,filen)
+        # Only one thread at a time works on each key
+        self.__lock.acquire()
+        key_lock = self.__key_locks.setdefault(key,threading.Lock())
+        self.__lock.release()
+        key_lock.acquire()
+        try:
+            # Already seen in this session (e.g. a hard link)
+            if key in self.__session:
+                self.__increment('nhits')
+                return self.__session[key]
+            chksum = None
+            if self.mode != CACHE_REFRESH:
+                chksum = self.lookup(key)
+            if chksum is not None:
+                self.__increment('nhits')
+                if self.mode == CACHE_VERIFY and \
+                   random.random() < self.sample_fraction:
+                    # Check the cached value
+                    self.__increment('nverified')
+                    new_chksum = md5sum(filen)
+                    if new_chksum != chksum:
+                        logging.warning("%s: cached MD5 sum is wrong (updated)" %
+                                        filen)
+                        self.__increment('nmismatches')
+                        chksum = new_chksum
+                        self.store(key,chksum)
+            else:
+                self.__increment('nmisses')
+                chksum = md5sum(filen)
+                # Only cache if file didn't change while being read
+                if file_key(filen) == key:
+                    self.store(key,chksum)
+            self.__session[key] = chksum
+            return chksum
+        finally:
+            key_lock.release()
+            self.__lock.acquire()
+            self.__key_locks.pop(key,None)
+            self.__lock.release()
+
+    def commit(self):
+        """Write pending updates to the cache file
+        """
+        self.__lock.acquire()
+        try:
+            self.__commit()
+        finally:
+            self.__lock.release()
+
+    def close(self):
+        """Write pending updates and close the cache file
+        """
+        self.commit()
+        self.__conn.close()
+
 #######################################################################
 # Functions
 #######################################################################
@@ -59,42 +312,103 @@ def hexify(s):
     """
     return ("%02x"*len(s)) % tuple(map(ord, s))
 
-def md5sum(filen):
+def file_key(filen):
+    """Return the key identifying a file's contents in the checksum cache
+
+    Arguments:
+      filen: name of the file
+
+    Returns:
+      Tuple (device,inode,size,mtime_ns).
+    """
+    st = os.stat(filen)
+    try:
+        mtime_ns = st.st_mtime_ns
+    except AttributeError:
+        mtime_ns = int(st.st_mtime*1000000000)
+    return (st.st_dev,st.st_ino,st.st_size,mtime_ns)
+
+def md5sum(filen,cache=None):
     """Return md5sum digest for a file
-    
-    This implements the md5sum checksum generation using both
-    the hashlib module (which should be available in Python 2.5) and
-    the deprecated md5 module (which will be used if hashlib is
-    unavailable, as is the case for Python 2.4 and earlier).
 
-    The choice of hashlib versus md5 is made automatically and there
-    is no need for the invoking subprogram to decide: the resulting
-    checksums are the same using either library regardless.
+    The file is read in blocks and the digest computed using
+    'file_digests'.
+
+    If a Md5sumCache is supplied then the checksum is taken from
+    the cache where possible.
 
     Arguments:
       filen: name of the file to generate the checksum from
+      cache: (optional) Md5sumCache instance
         
     Returns:
       Md5sum digest for the named file.
     """
-    # Initialise checksum using whatever is available
-    try:
-        chksum = hashlib.md5()
-    except NameError:
-        chksum = md5.new()
-    # Generate checksum
-    with open(filen, "rb") as f:
-        for block in iter(lambda: f.read(BLOCKSIZE), ''):
-            chksum.update(block)
-    return hexify(chksum.digest())
+    if cache is not None:
+        return cache.md5sum(filen)
+    return file_digests(filen)['md5']
+
+def new_digest(name):
+    """Return a new digest object for the named algorithm
+
+    Arguments:
+      name: name of the algorithm: 'md5', 'crc32' or any other
+        algorithm supported by hashlib (e.g. 'sha1', 'sha256')
+
+    Returns:
+      Object with 'update' and 'hexdigest' methods.
+    """
+    if name == 'crc32':
+        return Crc32()
+    return hashlib.new(name)
+
+def file_digests(filen,algorithms=('md5',),blocksize=BLOCKSIZE):
+    """Return digests for a file using several algorithms
+
+    The file is only read once: each block is read into a reusable
+    buffer and passed to all the digest objects in turn.
+
+    Arguments:
+      filen: name of the file to generate the digests from
+      algorithms: (optional) list of algorithm names (see
+        'new_digest'; default is MD5 only)
+      blocksize: (optional) size of blocks to read the file
+        in (default BLOCKSIZE)
+
+    Returns:
+      Dictionary with algorithm names as keys and the hex
+      representation of the digests as values.
+    """
+    digests = [(name,new_digest(name)) for name in algorithms]
+    updates = [digest.update for name,digest in digests]
+    with open(filen,"rb") as f:
+        try:
+            buf = bytearray(blocksize)
+        except NameError:
+            # No bytearray, fall back to reading new strings
+            buf = None
+        if buf is not None:
+            readinto = f.readinto
+            while True:
+                n = readinto(buf)
+                if not n:
+                    break
+                block = buffer(buf,0,n)
+                for update in updates:
+                    update(block)
+        else:
+            for block in iter(lambda: f.read(blocksize), ''):
+                for update in updates:
+                    update(block)
+    return dict([(name,digest.hexdigest()) for name,digest in digests])
 
 #######################################################################
 # Tests
 #######################################################################
 
 import unittest
-import os
 import tempfile
+import shutil
 
 test_text = """Md5sum is a Python module with functions for generating
 MD5 checksums for files."""
@@ -130,7 +444,150 @@ class TestMd5sum(unittest.TestCase):
         """Test handling of file name 'None'
         """
         self.assertRaises(Exception,md5sum,None)
+
+class TestFileDigests(unittest.TestCase):
+
+    def setUp(self):
+        # mkstemp returns a tuple
+        tmpfile = tempfile.mkstemp()
+        self.filen = tmpfile[1]
+        fp = open(self.filen,'w')
+        fp.write(test_text)
+        fp.close()
+
+    def tearDown(self):
+        os.remove(self.filen)
+
+    def test_file_digests(self):
+        """Test generation of multiple digests from one read
+        """
+        digests = file_digests(self.filen,('md5','sha256','crc32'))
+        self.assertEqual(digests['md5'],'08a6facee51e5435b9ef3744bd4dd5dc')
+        self.assertEqual(digests['sha256'],hashlib.sha256(test_text).hexdigest())
+        self.assertEqual(digests['crc32'],
+                         "%08x" % (zlib.crc32(test_text) & 0xffffffff))
+
+    def test_file_digests_small_blocks(self):
+        """Test digests are the same regardless of block size
+        """
+        self.assertEqual(file_digests(self.filen,('md5','sha1','crc32'),
+                                      blocksize=7),
+                         file_digests(self.filen,('md5','sha1','crc32')))
+
+    def test_crc32(self):
+        """Test Crc32 class
+        """
+        crc = Crc32()
+        crc.update("hello!")
+        self.assertEqual(crc.hexdigest(),"%08x" % (zlib.crc32("hello!") & 0xffffffff))
+        self.assertEqual(crc.digest(),struct.pack('>I',int(crc.hexdigest(),16)))
         
+class TestMd5sumCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dirn = tempfile.mkdtemp()
+        self.filen = os.path.join(self.dirn,"test.txt")
+        fp = open(self.filen,'w')
+        fp.write(test_text)
+        fp.close()
+        self.cache_file = os.path.join(self.dirn,"md5sums.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.dirn)
+
+    def test_cache(self):
+        """Test checksums are stored in and retrieved from cache
+        """
+        cache = Md5sumCache(self.cache_file)
+        self.assertEqual(md5sum(self.filen,cache=cache),
+                         '08a6facee51e5435b9ef3744bd4dd5dc')
+        self.assertEqual(cache.nmisses,1)
+        cache.close()
+        cache = Md5sumCache(self.cache_file)
+        self.assertEqual(md5sum(self.filen,cache=cache),
+                         '08a6facee51e5435b9ef3744bd4dd5dc')
+        self.assertEqual(cache.nhits,1)
+        self.assertEqual(cache.nmisses,0)
+        cache.close()
+
+    def test_cache_commits_periodically(self):
+        """Test stored checksums are committed before the cache is closed
+        """
+        cache = Md5sumCache(self.cache_file,commit_every=2,commit_interval=3600)
+        for i in range(3):
+            cache.store((0,i,0,0),'d41d8cd98f00b204e9800998ecf8427e')
+        # Another connection only sees the committed updates
+        reader = Md5sumCache(self.cache_file)
+        self.assertEqual(reader.lookup((0,1,0,0)),
+                         'd41d8cd98f00b204e9800998ecf8427e')
+        self.assertEqual(reader.lookup((0,2,0,0)),None)
+        reader.close()
+        cache.close()
+        reader = Md5sumCache(self.cache_file)
+        self.assertEqual(reader.lookup((0,2,0,0)),
+                         'd41d8cd98f00b204e9800998ecf8427e')
+        reader.close()
+
+    def test_cache_modified_file(self):
+        """Test checksum is recomputed when file changes
+        """
+        cache = Md5sumCache(self.cache_file)
+        md5sum(self.filen,cache=cache)
+        cache.close()
+        fp = open(self.filen,'a')
+        fp.write("More text")
+        fp.close()
+        cache = Md5sumCache(self.cache_file)
+        self.assertEqual(md5sum(self.filen,cache=cache),md5sum(self.filen))
+        self.assertEqual(cache.nmisses,1)
+        cache.close()
+
+    def test_cache_hard_links(self):
+        """Test hard-linked files are only hashed once
+        """
+        link = os.path.join(self.dirn,"link.txt")
+        os.link(self.filen,link)
+        cache = Md5sumCache(self.cache_file,mode=CACHE_REFRESH)
+        self.assertEqual(md5sum(self.filen,cache=cache),
+                         md5sum(link,cache=cache))
+        self.assertEqual(cache.nmisses,1)
+        self.assertEqual(cache.nhits,1)
+        cache.close()
+
+    def test_cache_refresh(self):
+        """Test checksums are recomputed in refresh mode
+        """
+        cache = Md5sumCache(self.cache_file)
+        md5sum(self.filen,cache=cache)
+        cache.close()
+        cache = Md5sumCache(self.cache_file,mode=CACHE_REFRESH)
+        md5sum(self.filen,cache=cache)
+        self.assertEqual(cache.nmisses,1)
+        self.assertEqual(cache.nhits,0)
+        cache.close()
+
+    def test_cache_verify(self):
+        """Test bad cached checksums are detected in verify mode
+        """
+        cache = Md5sumCache(self.cache_file)
+        cache.store(file_key(self.filen),'d41d8cd98f00b204e9800998ecf8427e')
+        cache.close()
+        cache = Md5sumCache(self.cache_file,mode=CACHE_VERIFY,sample_fraction=1.0)
+        self.assertEqual(md5sum(self.filen,cache=cache),
+                         '08a6facee51e5435b9ef3744bd4dd5dc')
+        self.assertEqual(cache.nverified,1)
+        self.assertEqual(cache.nmismatches,1)
+        cache.close()
+        cache = Md5sumCache(self.cache_file)
+        self.assertEqual(md5sum(self.filen,cache=cache),
+                         '08a6facee51e5435b9ef3744bd4dd5dc')
+        cache.close()
+
+    def test_bad_mode(self):
+        """Test unrecognised cache mode is rejected
+        """
+        self.assertRaises(ValueError,Md5sumCache,self.cache_file,'sometimes')
+
 ########################################################################
 # Main: test runner
 #########################################################################
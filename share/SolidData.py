@@ -59,6 +59,13 @@ import string
 import logging
 import bcf_utils
 
+#######################################################################
+# Constants
+#######################################################################
+
+# Default name for snapshot files in SOLiD run directories
+SNAPSHOT_FILE = ".solid_run_snapshot.json"
+
 #######################################################################
 # Class definitions
 #######################################################################
@@ -84,15 +91,33 @@ class SolidRun:
       the run_definition.txt file
     samples: a list of SolidSample objects representing the samples in
       the run
+
+    The run directory is examined via a bcf_utils.DirectoryIndex, so
+    each directory in the run is only listed once while the run is
+    being populated.
+
+    The index can be saved to a snapshot file (using 'save_snapshot',
+    or automatically by specifying the 'snapshot' argument when
+    creating the SolidRun) and reused by later SolidRun instances for
+    the same run, as long as none of the directories it covers have
+    been modified in the meantime. For example:
+
+    >>> solid_run = SolidRun('/path/to/solid0123_20141225_FRAG_BC',
+    ...                      snapshot=os.path.join('/path/to/solid0123_20141225_FRAG_BC',
+    ...                                            SNAPSHOT_FILE))
     """
 
-    def __init__(self,solid_run_dir):
+    def __init__(self,solid_run_dir,snapshot=None):
         """Create and populate a new SolidRun instance.
 
         Arguments:
           solid_run_dir: path to the top-level directory holding the files
           generated by the SOLiD sequencer run e.g.
           /path/to/SOLiD/data/solid0123_20130426_FRAG_BC
+          snapshot: (optional) name of a snapshot file; if the file
+          exists and is still valid then it is used instead of
+          rescanning the run directory, otherwise the run directory is
+          scanned and the snapshot is (re)written
         """
 
         # Initialise
@@ -109,16 +134,24 @@ class SolidRun:
             return
         self.run_dir = os.path.abspath(solid_run_dir)
 
+        # All lookups below the run directory go via an index, so
+        # that each directory is only listed once
+        self.__index = bcf_utils.DirectoryIndex()
+        index = self.__index
+        if snapshot is not None and os.path.exists(snapshot):
+            if index.load(snapshot):
+                logging.debug("Loaded snapshot from %s" % snapshot)
+
         # Locate and process the run definition file
         self.run_name = self.run_dir.strip(os.sep).split(os.sep)[-1]
         self.run_defn_filn = os.path.join(self.run_dir,
                                           self.run_name+"_run_definition.txt")
-        if not os.path.isfile(self.run_defn_filn):
+        if not index.isfile(self.run_defn_filn):
             # Unable to find run definition
             logging.warning("Unable to find run definition file for %s" % self.run_dir)
             # Attempt to recover: look for other possible candidates
             self.run_defn_filn = None
-            for f in os.listdir(self.run_dir):
+            for f in index.listdir(self.run_dir):
                 if f.endswith("_run_definition.txt"):
                     self.run_defn_filn = os.path.join(self.run_dir,f)
                     logging.warning("%s: using run definition file %s" % 
@@ -164,10 +197,10 @@ class SolidRun:
             # There should be a symlink "results" that will
             # point to the actual results directory
             results = os.path.join(self.run_dir,sample_name,'results')
-            if os.path.islink(results):
+            if index.islink(results):
                 libraries_dir = os.path.join(self.run_dir,
                                              sample_name,
-                                             os.readlink(results),
+                                             index.readlink(results),
                                              'libraries')
             else:
                 libraries_dir = None
@@ -178,7 +211,7 @@ class SolidRun:
                 self.samples.append(sample)
                 # Locate and process barcode statistics
                 if libraries_dir:
-                    for f in os.listdir(libraries_dir):
+                    for f in index.listdir(libraries_dir):
                         if f.startswith("BarcodeStatistics"):
                             barcode_stats_filn = os.path.join(libraries_dir,f)
                             sample.barcode_stats = \
@@ -190,16 +223,20 @@ class SolidRun:
                 # Locate and process 'unassigned' data
                 # These are csfasta/qual files in the directory
                 # <sample>/results.F1B1/libraries/unassigned
-                unassigned_dir = os.path.join(libraries_dir,"unassigned")
+                if libraries_dir:
+                    unassigned_dir = os.path.join(libraries_dir,"unassigned")
+                else:
+                    unassigned_dir = None
                 logging.debug("%s: 'unassigned' dir %s" % (sample.name,unassigned_dir))
-                if os.path.isdir(unassigned_dir):
+                if unassigned_dir and index.isdir(unassigned_dir):
                     # Collect information on unassigned read data
                     sample.unassigned = SolidLibrary("unassigned",parent_sample=sample)
-                    for d in os.listdir(unassigned_dir):
+                    for d in index.listdir(unassigned_dir):
                         reads_dir = os.path.join(unassigned_dir,d,"reads")
                         logging.debug("%s: reads dir %s" % (sample.name,reads_dir))
-                        if os.path.isdir(reads_dir):
-                            csfasta,qual = get_primary_data_file_pair(reads_dir)
+                        if index.isdir(reads_dir):
+                            csfasta,qual = get_primary_data_file_pair(reads_dir,
+                                                                      index=index)
                             if csfasta and qual:
                                 sample.unassigned.addPrimaryData(csfasta,qual)
                                 logging.debug("-----> Adding primary data (unassigned)")
@@ -227,7 +264,7 @@ class SolidRun:
             # Check for directory with result files
             if libraries_dir:
                 this_library_dir = os.path.join(libraries_dir,library.name)
-                if not os.path.isdir(this_library_dir):
+                if not index.isdir(this_library_dir):
                     this_library_dir = None
             else:
                 this_library_dir = None
@@ -236,18 +273,18 @@ class SolidRun:
             if this_library_dir:
                 logging.debug("Library dir: %s..." % this_library_dir)
                 # Iterate over available directories
-                for d in os.listdir(this_library_dir):
+                for d in index.listdir(this_library_dir):
                     logging.debug("--> Library %s subdir: %s" % (library_name,d))
                     reject = os.path.join(this_library_dir,d,"reject")
                     reads = os.path.join(this_library_dir,d,"reads")
                     reports = os.path.join(this_library_dir,d,"reports")
                     # Check that we have 'reject', 'reads' and 'reports'
-                    if os.path.isdir(reject) and \
-                            os.path.isdir(reads) and \
-                            os.path.isdir(reports):
+                    if index.isdir(reject) and \
+                            index.isdir(reads) and \
+                            index.isdir(reports):
                         logging.debug("---> has all of reads, reject and reports")
                         # Check for csfasta and qual files
-                        csfasta,qual = get_primary_data_file_pair(reads)
+                        csfasta,qual = get_primary_data_file_pair(reads,index=index)
                         # Add to list of primary data
                         if csfasta and qual:
                             library.addPrimaryData(csfasta,qual)
@@ -275,6 +312,25 @@ class SolidRun:
                             library.qual_f5    = primary_data.qual
                             f5_timestamp       = primary_data.timestamp
 
+        # Update the snapshot
+        if snapshot is not None and index.changed:
+            try:
+                self.save_snapshot(snapshot)
+            except (IOError,OSError),ex:
+                logging.warning("%s: unable to write snapshot %s: %s" %
+                                (self.run_name,snapshot,ex))
+
+    def save_snapshot(self,snapshot):
+        """Save the directory index for the run to a snapshot file
+
+        The snapshot file can be passed to a new SolidRun via its
+        'snapshot' argument to avoid rescanning the run directory.
+
+        Arguments:
+          snapshot: name of the snapshot file to write
+        """
+        self.__index.save(snapshot)
+
     @property
     def is_paired_end(self):
         """Return True if run is paired end, False if not
@@ -1165,11 +1221,13 @@ def is_paired_end(solid_run):
     """
     return (solid_run.run_definition.runType == "PAIRED-END")
 
-def get_primary_data_file_pair(dirn):
+def get_primary_data_file_pair(dirn,index=None):
     """Return csfasta/qual file pair from specified directory
 
     Arguments:
       dirn: directory to search for csfasta/qual pair
+      index: (optional) bcf_utils.DirectoryIndex to use to list
+        the directory contents
 
     Returns:
       Tuple (csfasta,qual) with full path for each file, or
@@ -1177,7 +1235,11 @@ def get_primary_data_file_pair(dirn):
     """
     csfasta = None
     qual = None
-    for filen in os.listdir(dirn):
+    if index is not None:
+        filens = index.listdir(dirn)
+    else:
+        filens = os.listdir(dirn)
+    for filen in filens:
         ext = os.path.splitext(filen)[1]
         if ext == ".csfasta":
             csfasta = os.path.abspath(os.path.join(dirn,filen))
@@ -2078,6 +2140,62 @@ class TestSolidRun(unittest.TestCase):
         solid_run = SolidRun("/i/dont/exist/solid0123_20131013_FRAG_BC")
         self.assertFalse(solid_run)
 
+class TestSolidRunSnapshot(unittest.TestCase):
+    """Unit tests for SolidRun snapshots.
+    """
+    def setUp(self):
+        # Set up a mock SOLiD directory structure
+        self.solid_test_dir = \
+            TestUtils().make_solid_dir_paired_end('solid0123_20130426_PE_BC')
+        self.snapshot = os.path.join(self.solid_test_dir,SNAPSHOT_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.solid_test_dir)
+
+    def run_structure(self,solid_run):
+        # Return a comparable summary of the samples and libraries
+        structure = []
+        for sample in solid_run.samples:
+            structure.append((sample.name,
+                              str(sample.unassigned),
+                              [(lib.name,lib.is_barcoded,
+                                lib.csfasta,lib.qual,
+                                lib.csfasta_f5,lib.qual_f5,
+                                len(lib.primary_data))
+                               for lib in sample.libraries]))
+        return structure
+
+    def test_snapshot_is_reused(self):
+        solid_run = SolidRun(self.solid_test_dir,snapshot=self.snapshot)
+        self.assertTrue(os.path.exists(self.snapshot))
+        snapshot_data = open(self.snapshot).read()
+        # Scanning again should use the snapshot without rewriting it
+        # and give the same structure
+        bcf_listdir = bcf_utils.os.listdir
+        bcf_scandir = bcf_utils.scandir
+        def no_listing(*args):
+            raise AssertionError("Directory listed when snapshot is valid")
+        try:
+            bcf_utils.os.listdir = no_listing
+            bcf_utils.scandir = no_listing
+            solid_run2 = SolidRun(self.solid_test_dir,snapshot=self.snapshot)
+        finally:
+            bcf_utils.os.listdir = bcf_listdir
+            bcf_utils.scandir = bcf_scandir
+        self.assertEqual(self.run_structure(solid_run),
+                         self.run_structure(solid_run2))
+        self.assertEqual(snapshot_data,open(self.snapshot).read())
+
+    def test_snapshot_is_invalidated(self):
+        solid_run = SolidRun(self.solid_test_dir,snapshot=self.snapshot)
+        # Remove the F5 reads for one library
+        reads_dir = os.path.dirname(solid_run.samples[0].libraries[0].csfasta_f5)
+        shutil.rmtree(reads_dir)
+        solid_run2 = SolidRun(self.solid_test_dir,snapshot=self.snapshot)
+        self.assertEqual(None,solid_run2.samples[0].libraries[0].csfasta_f5)
+        self.assertEqual(self.run_structure(SolidRun(self.solid_test_dir)),
+                         self.run_structure(solid_run2))
+
 class TestSolidRunPairedEnd(unittest.TestCase):
     """Unit tests for SolidRun class for paired-end run data.
     """
@@ -7,7 +7,7 @@
 #
 #########################################################################
 
-__version__ = "0.1.7"
+__version__ = "0.4.1"
 
 """Spreadsheet.py
 
@@ -19,6 +19,12 @@ The basic classes are 'Workbook' (representing an XLS spreadsheet) and 'Workshee
 built on top of the other two classes and offers a simplified interface to writing
 line-by-line XLS spreadsheets.
 
+The 'XLSXWorkbook' and 'XLSXWorksheet' classes offer an alternative backend which
+writes XLSX files instead. Rows are written out to temporary files as they are
+added (so memory use doesn't grow with the number of rows), and the much larger
+XLSX row limit applies. The same style markup and formulae are supported, but
+columns can't be inserted and cells can't be updated once rows have been added.
+
 Simple usage examples
 ---------------------
 
@@ -46,12 +52,30 @@ Simple usage examples
 >>> wb.addRow(['DR_1',875897,713425])
 >>> wb.write()
 
+(Using a name ending with '.xlsx' writes an XLSX file instead, although
+in this case existing files will be overwritten rather than appended to.)
+
+4. Writing a large XLSX spreadsheet using the XLSXWorkbook class
+
+>>> wb = XLSXWorkbook()
+>>> ws = wb.addSheet('peaks')
+>>> ws.addText("<style font=bold>chr</style>\t<style font=bold>start</style>\t<style font=bold>start+100</style>")
+>>> for peak in peaks:
+...    ws.addTabData(["%s\t%d\t=B?+100" % peak])
+>>> wb.save('peaks.xlsx')
+>>> wb.close()
+
+(XLSXWorkbook can also be used as a context manager, which closes the
+temporary files automatically.)
+
 Module constants
 ----------------
 
 MAX_LEN_WORKSHEET_TITLE: maximum length allowed by xlwt for worksheet titles
 MAX_LEN_WORKSHEET_CELL_VALUE: maximum number of characters allowed for cell value
 MAX_NUMBER_ROWS_PER_WORKSHEET: maximum number of rows allowed per worksheet by xlwt
+MAX_LEN_XLSX_CELL_VALUE: maximum number of characters allowed for XLSX cell value
+MAX_NUMBER_ROWS_PER_XLSX_WORKSHEET: maximum number of rows allowed per XLSX worksheet
 
 Dependencies
 ------------
@@ -92,6 +116,10 @@ import os
 import re
 import string
 import logging
+import shutil
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape,quoteattr
 
 import xlwt, xlrd
 import xlutils, xlutils.copy
@@ -111,6 +139,56 @@ MAX_LEN_WORKSHEET_CELL_VALUE = 250
 # Maximum number of rows allowed per worksheet by xlwt
 MAX_NUMBER_ROWS_PER_WORKSHEET = 65536
 
+# Maximum number of characters allowed for XLSX cell value
+MAX_LEN_XLSX_CELL_VALUE = 32767
+
+# Maximum number of rows allowed per XLSX worksheet
+MAX_NUMBER_ROWS_PER_XLSX_WORKSHEET = 1048576
+
+# Regular expression for format tags
+RE_STYLE = re.compile(r"^<style +([^>]*)>(.*)</style>$")
+
+# Leading characters for values which might convert to numbers
+NUMBER_START = frozenset("0123456789+-. \t\r\niInN")
+
+# Characters which aren't allowed in XML text
+RE_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# RGB values for the default Excel colour palette (keyed by the
+# palette indices used in xlwt's colour_map)
+EXCEL_PALETTE = {
+    8:'000000', 9:'FFFFFF', 10:'FF0000', 11:'00FF00',
+    12:'0000FF', 13:'FFFF00', 14:'FF00FF', 15:'00FFFF',
+    16:'800000', 17:'008000', 18:'000080', 19:'808000',
+    20:'800080', 21:'008080', 22:'C0C0C0', 23:'808080',
+    24:'9999FF', 25:'993366', 26:'FFFFCC', 27:'CCFFFF',
+    28:'660066', 29:'FF8080', 30:'0066CC', 31:'CCCCFF',
+    32:'000080', 33:'FF00FF', 34:'FFFF00', 35:'00FFFF',
+    36:'800080', 37:'800000', 38:'008080', 39:'0000FF',
+    40:'00CCFF', 41:'CCFFFF', 42:'CCFFCC', 43:'FFFF99',
+    44:'99CCFF', 45:'FF99CC', 46:'CC99FF', 47:'FFCC99',
+    48:'3366FF', 49:'33CCCC', 50:'99CC00', 51:'FFCC00',
+    52:'FF9900', 53:'FF6600', 54:'666699', 55:'969696',
+    56:'003366', 57:'339966', 58:'003300', 59:'333300',
+    60:'993300', 61:'993366', 62:'333399', 63:'333333' }
+
+# XLSX names for the xlwt border line styles
+XLSX_BORDER_STYLES = {
+    'thin':'thin', 'medium':'medium', 'dashed':'dashed',
+    'dotted':'dotted', 'thick':'thick', 'double':'double',
+    'hair':'hair', 'medium_dashed':'mediumDashed',
+    'thin_dash_dotted':'dashDot', 'medium_dash_dotted':'mediumDashDot',
+    'thin_dash_dot_dotted':'dashDotDot',
+    'medium_dash_dot_dotted':'mediumDashDotDot',
+    'slanted_medium_dash_dotted':'slantDashDot' }
+
+# XML namespaces and fixed parts for XLSX files
+XLSX_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+XLSX_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+XLSX_RELS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+XLSX_DOC_RELS_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.%s+xml"
+
 #######################################################################
 # Class definitions
 #######################################################################
@@ -199,7 +277,7 @@ class Workbook:
             logging.debug("Overwriting existing file: '%s'" % xls_name)
         self.workbook.save(xls_name)
 
-class Worksheet:
+class Worksheet(object):
     """Class for writing to a sheet in an XLS spreadsheet.
 
     A Worksheet object represents a sheet in an XLS spreadsheet.
@@ -286,7 +364,21 @@ class Worksheet:
     -----------------------
 
     The spreadsheet data is held internally as a list of rows, with each row
-    represented by a tab-delimited string.
+    represented by a list of cells in the 'rows' attribute. Inserting a
+    column or setting a cell value updates the row lists in place, so no
+    row is ever re-split or re-joined.
+
+    Each cell is parsed once when it is added (see the 'parse_cell'
+    function) into a tuple (value,style), where value is an integer, float
+    or string (formulae are kept as strings starting with '='), and style
+    is the text of the attributes in the style tag (or None if the item
+    wasn't styled). Each distinct style is only turned into an xlwt style
+    once, when the sheet is saved.
+
+    The 'data' attribute offers the original view of the same data as a
+    sequence of tab-delimited strings (one per row); these are built on
+    demand from the cells. Note that numbers appear in their normalised
+    form (e.g. '1.50' is shown as '1.5').
     """
 
     def __init__(self,workbook,title,xlrd_index=None,xlrd_sheet=None):
@@ -323,14 +415,22 @@ class Worksheet:
             self.is_new = False
             self.current_row = xlrd_sheet.nrows - 1
             self.ncols = xlrd_sheet.ncols
-        self.data = []
+        self.rows = []
         # Regular expressions for format tags
-        self.re_style = re.compile(r"^<style +([^>]*)>(.*)</style>$")
+        self.re_style = RE_STYLE
         # Generate and store styles
         self.styles = Styles()
+        # Styles resolved from style tag attributes
+        self.xf_styles = {}
         # Maximum column widths
         self.max_col_width = []
 
+    @property
+    def data(self):
+        """Rows of data as a sequence of tab-delimited strings
+        """
+        return TabRowsView(self.rows)
+
     def addTabData(self,rows):
         """Write a list of tab-delimited data rows to the sheet.
 
@@ -342,9 +442,10 @@ class Worksheet:
             data items
         """
         for row in rows:
-            self.data.append(row)
+            items = [parse_cell(item) for item in row.split('\t')]
+            self.rows.append(items)
             # Update number of columns
-            self.ncols = max(self.ncols,len(row.split('\t')))
+            self.ncols = max(self.ncols,len(items))
 
     def addText(self,text):
         """Append and populate rows from text.
@@ -389,63 +490,46 @@ class Worksheet:
             # No explicit title, use first item in list
             if isinstance(insert_items,list):
                 title = insert_items[0]
-                nrows = max(len(self.data),len(insert_items))
+                nrows = max(len(self.rows),len(insert_items))
             else:
                 title = insert_items
-                nrows = len(self.data)
+                nrows = len(self.rows)
             offset = 0
         else:
             # Title must be factored into row count
             if isinstance(insert_items,list):
-                nrows = max(len(self.data),len(insert_items)+1)
+                nrows = max(len(self.rows),len(insert_items)+1)
             else:
-                nrows = len(self.data)
+                nrows = len(self.rows)
             offset = -1
+        # Add empty rows if the new column is longer than the data
+        while len(self.rows) < nrows:
+            self.rows.append([])
+        # Parse a single value once for all rows
+        if not isinstance(insert_items,list):
+            insert_cell = parse_cell(str(insert_items))
+        blank = parse_cell('')
         # Loop over rows
-        insert_title = True
         for i in range(nrows):
-            # Split the existing row into items
-            try:
-                row = self.data[i]
-                items = row.split('\t')
-            except IndexError:
-                # Ran out of rows in current worksheet
-                items = []
-            # Rebuild the row
-            new_items = []
-            for j in range(max(len(items),position+1)):
-                # Insert appropriate item at this position
-                if j == position:
-                    if insert_title:
-                        # Title for new column
-                        new_items.append(title)
-                        insert_title = False
-                    else:
-                        # Data item
-                        if isinstance(insert_items,list):
-                            try:
-                                insert_item = insert_items[i+offset]
-                            except IndexError:
-                                # Ran out of items?
-                                insert_item = ''
-                        else:
-                            insert_item = insert_items
-                        new_items.append(insert_item)
-                # Append the existing row data
+            # Cell to insert into this row
+            if i == 0:
+                # Title for new column
+                cell = parse_cell(str(title))
+            elif isinstance(insert_items,list):
                 try:
-                    new_items.append(items[j])
+                    cell = parse_cell(str(insert_items[i+offset]))
                 except IndexError:
-                    if j < position:
-                        # Ran out of existing items, pad with blanks
-                        new_items.append('')
-            # Replace old row with new one
-            row = '\t'.join([str(x) for x in new_items])
-            try:
-                self.data[i] = row
-            except IndexError:
-                self.data.append(row)
+                    # Ran out of items?
+                    cell = blank
+            else:
+                cell = insert_cell
+            # Pad short rows with blanks and insert the new item
+            items = self.rows[i]
+            if len(items) < position:
+                items.extend([blank]*(position-len(items)))
+            items.insert(position,cell)
             # Update number of columns
-            self.ncols = max(self.ncols,len(row.split('\t')))
+            self.ncols = max(self.ncols,len(items))
         # Finished successfully
         return True
 
@@ -463,18 +547,17 @@ class Worksheet:
           value: new value to be written into the cell
         """
         # First: add new (empty) rows if required
-        while len(self.data) < row + 1:
-            self.data.append('')
+        blank = parse_cell('')
+        while len(self.rows) < row + 1:
+            self.rows.append([blank])
         # Then: extend the row if required
-        new_row = self.data[row].split('\t')
-        while len(new_row) < col + 1:
-            new_row.append('')
+        items = self.rows[row]
+        if len(items) < col + 1:
+            items.extend([blank]*(col+1-len(items)))
         # Update number of columns
-        self.ncols = max(self.ncols,len(new_row))
+        self.ncols = max(self.ncols,len(items))
         # Insert the new value
-        new_row[col] = str(value)
-        new_row = '\t'.join(new_row)
-        self.data[row] = new_row
+        items[col] = parse_cell(str(value))
 
     def getColumnId(self,name):
         """Lookup XLS column id from name of column.
@@ -486,7 +569,7 @@ class Worksheet:
         column with the matching name.
         """
         try:
-            i = self.data[0].split('\t').index(name)
+            i = [format_cell(cell) for cell in self.rows[0]].index(name)
             return self.column_id_from_index(i)
         except IndexError:
             # Column name not found
@@ -500,116 +583,121 @@ class Worksheet:
         'A', 'B', 'AA', 'BA' etc).
 
         """
-        name = ''
+        return column_id_from_index(i)
+
+    def getXfStyle(self,style):
+        """Return the xlwt style for a set of style tag attributes
+
+        The attributes are only parsed the first time that each distinct
+        style is seen; subsequent requests return the same object.
+
+        Arguments:
+          style: text of the attributes from a style tag (e.g.
+            'font=bold bgcolor=gray25'), or None for the default style
+        """
         try:
-            while i >= 0:
-                name += string.uppercase[i%26]
-                i = i/26-1
-            return name[::-1]
-        except IndexError, ex:
-            print "Exception getting column name for index %d: %s" % (i,ex)
-            raise
+            return self.xf_styles[style]
+        except KeyError:
+            pass
+        bold,wrap,color,bg_color,border_style,num_format_str = parse_style(style)
+        xf_style = self.styles.getXfStyle(bold=bold,color=color,bg_color=bg_color,
+                                          wrap=wrap,border_style=border_style,
+                                          num_format_str=num_format_str)
+        self.xf_styles[style] = xf_style
+        return xf_style
 
     def save(self):
         """Write the new data to the spreadsheet.
         """
-        for row in self.data:
+        max_col_width = self.max_col_width
+        for row in self.rows:
             self.current_row += 1
-            cindex = 0
-            for item in row.split('\t'):
-                # Extract any formatting data for the item and
-                # retrieve easy_xf object for styling
-                bold = False
-                color=None
-                bg_color = None
-                wrap = False
-                border_style = None
-                style_match = self.re_style.match(item)
-                num_format_str = None
-                if style_match:
-                    item = style_match.group(2)
-                    styles = style_match.group(1)
-                    for style in styles.split(' '):
-                        if style.strip().startswith('bgcolor='):
-                            bg_color = style.split('=')[1].strip()
-                        elif style.strip().startswith('color='):
-                            color = style.split('=')[1].strip()
-                        elif style.strip() == 'font=bold':
-                            bold = True
-                        elif style.strip().startswith('border='):
-                            border_style = style.split('=')[1].strip()
-                        elif style.strip() == 'wrap':
-                            wrap = True
-                        elif style.strip().startswith('number_format='):
-                            num_format_str = style.split('=')[1].strip()
-                style = self.styles.getXfStyle(bold=bold,color=color,bg_color=bg_color,
-                                               wrap=wrap,border_style=border_style,
-                                               num_format_str=num_format_str)
-                # Deal with the item
-                if str(item).startswith('='):
-                    # Formula item
-                    # Remove leading '=' which xlwt doesn't want
-                    formula = item[1:]
-                    # Substitute '?' with current line number
-                    # NB xlwt takes row numbers from zero,
-                    # while XLS starts from 1
-                    formula = formula.replace('?',str(self.current_row+1))
-                    # Substitute '#' with current column
-                    formula = formula.replace('#',self.column_id_from_index(cindex))
-                    # Create the item
-                    try:
-                        item = xlwt.Formula(formula)
-                    except Exception, ex:
-                        logging.warning("Error writing formula '%s' to cell %s%s: %s",
-                                        formula,
-                                        self.column_id_from_index(cindex),
-                                        self.current_row+1,
-                                        ex)
-                        item = "FORMULA_ERROR"
-                else:
-                    # Deal with a data item
-                    # Attempt to convert to a number type i.e. integer/float
-                    converted = str(item)
-                    try:
-                        # Try integer
-                        converted = int(converted)
-                    except ValueError:
-                        # Not an integer, try float
+            try:
+                xlwt_row = self.worksheet.row(self.current_row)
+            except ValueError, ex:
+                logging.error("couldn't write row to sheet '%s' (row %d): %s" %
+                              (self.title,self.current_row+1,ex))
+                continue
+            for cindex,cell in enumerate(row):
+                item,style = cell
+                len_item = None
+                if isinstance(item,basestring):
+                    if item.startswith('='):
+                        # Formula item
+                        # Remove leading '=' which xlwt doesn't want
+                        formula = item[1:]
+                        # Substitute '?' with current line number
+                        # NB xlwt takes row numbers from zero,
+                        # while XLS starts from 1
+                        formula = formula.replace('?',str(self.current_row+1))
+                        # Substitute '#' with current column
+                        formula = formula.replace('#',self.column_id_from_index(cindex))
+                        len_item = len(formula)
+                        # Create the item
                         try:
-                            converted = float(converted)
-                        except ValueError:
-                            # Not a float, leave as a string BUT check
-                            # the length
-                            if len(converted) > MAX_LEN_WORKSHEET_CELL_VALUE:
-                                logging.warning("Saving sheet '%s' (row %d, col %d)" %
-                                                (self.title,self.current_row,cindex))
-                                logging.warning("Truncating value '%s...' to %d characters" %
-                                                (converted[:15],
-                                                 MAX_LEN_WORKSHEET_CELL_VALUE))
-                                converted = converted[:MAX_LEN_WORKSHEET_CELL_VALUE]
-                    item = converted
+                            item = xlwt.Formula(formula)
+                        except Exception, ex:
+                            logging.warning("Error writing formula '%s' to cell %s%s: %s",
+                                            formula,
+                                            self.column_id_from_index(cindex),
+                                            self.current_row+1,
+                                            ex)
+                            item = "FORMULA_ERROR"
+                    elif len(item) > MAX_LEN_WORKSHEET_CELL_VALUE:
+                        # String value: check the length
+                        logging.warning("Saving sheet '%s' (row %d, col %d)" %
+                                        (self.title,self.current_row,cindex))
+                        logging.warning("Truncating value '%s...' to %d characters" %
+                                        (item[:15],
+                                         MAX_LEN_WORKSHEET_CELL_VALUE))
+                        item = item[:MAX_LEN_WORKSHEET_CELL_VALUE]
                 # Write the item to the current line
                 try:
-                    self.worksheet.write(self.current_row,cindex,item,style)
-                    # Set the column widths
-                    len_item = len(str(item))
-                    try:
-                        if len_item > self.max_col_width[cindex]:
-                            self.max_col_width[cindex] = len_item
-                    except IndexError:
-                        self.max_col_width.append(len_item)
-                    self.worksheet.col(cindex).width = \
-                        256*(self.max_col_width[cindex] + 5)
-                    cindex += 1
+                    xlwt_row.write(cindex,item,self.getXfStyle(style))
                 except ValueError, ex:
                     logging.error("couldn't write item to sheet '%s' (row %d col %d)" %
                                   (self.title,self.current_row+1,cindex+1))
+                    continue
+                # Track the column widths
+                if len_item is None:
+                    len_item = len(str(item))
+                try:
+                    if len_item > max_col_width[cindex]:
+                        max_col_width[cindex] = len_item
+                except IndexError:
+                    max_col_width.append(len_item)
+        # Set the column widths
+        for cindex,width in enumerate(max_col_width):
+            width = min(width,MAX_LEN_WORKSHEET_CELL_VALUE)
+            self.worksheet.col(cindex).width = 256*(width + 5)
         # Update/reset the sheet properties etc
-        self.data = []
+        self.rows = []
         self.is_new = False
         # Finished
         return
 
+class TabRowsView(object):
+    """Read-only view of worksheet rows as tab-delimited strings
+
+    Wraps a list of rows (each a list of cell values) and presents
+    each row as a single tab-delimited string, which is built only
+    when the row is accessed.
+    """
+    def __init__(self,rows):
+        self.__rows = rows
+
+    def __len__(self):
+        return len(self.__rows)
+
+    def __getitem__(self,i):
+        if isinstance(i,slice):
+            return [format_row(row) for row in self.__rows[i]]
+        return format_row(self.__rows[i])
+
+    def __iter__(self):
+        for row in self.__rows:
+            yield format_row(row)
+
 class Styles:
     """Class for creating and caching EasyXfStyle objects.
 
@@ -675,23 +763,497 @@ class Styles:
         self.styles[style_key] = xf_style
         return xf_style
 
+class XLSXWorkbook(object):
+    """Class for writing data to an XLSX spreadsheet.
+
+    An XLSXWorkbook represents an XLSX spreadsheet, which consists of
+    sheets (represented by XLSXWorksheet instances). It offers the same
+    basic interface as the Workbook class, but the data for each sheet
+    is written out to a temporary file as it is added rather than being
+    held in memory, and the final XLSX file is assembled from these when
+    the workbook is saved.
+
+    Note that unlike Workbook, XLSXWorkbook cannot append to an existing
+    spreadsheet.
+
+    The 'close' method should be called once the workbook is finished
+    with, to remove the temporary files (alternatively use the workbook
+    in a 'with' statement).
+    """
+
+    def __init__(self,tmp_dir=None):
+        """Create a new XLSXWorkbook instance.
+
+        Arguments:
+          tmp_dir: (optional) directory to write temporary files to
+            (defaults to the system temporary directory)
+        """
+        self.sheets = []
+        self.styles = XLSXStyles()
+        self.tmp_dir = tmp_dir
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+    def close(self):
+        """Close the temporary files holding the sheet data
+
+        The workbook can't be saved or have data added to it after
+        it has been closed.
+        """
+        for ws in self.sheets:
+            ws.close()
+
+    def addSheet(self,title):
+        """Add a new sheet to the spreadsheet.
+
+        Arguments:
+          title: title for the sheet
+        """
+        logging.debug("Adding sheet '%s'" % title)
+        try:
+            ws = self.getSheet(title[:MAX_LEN_WORKSHEET_TITLE])
+            logging.warning("Sheet called '%s' already exists" % title)
+            return ws
+        except KeyError:
+            # Not found
+            ws = XLSXWorksheet(title,self.styles,tmp_dir=self.tmp_dir)
+        self.sheets.append(ws)
+        return ws
+
+    def getSheet(self,title):
+        """Retrieve a sheet from the spreadsheet.
+        """
+        for s in self.sheets:
+            logging.debug("Searching: sheet '%s'" % s.title)
+            if title == s.title: return s
+        raise KeyError, "No sheet called '%s' found" % title
+
+    def save(self,xlsx_name):
+        """Write the spreadsheet to disk.
+
+        The workbook can be saved again later (e.g. after more data has
+        been added to its sheets).
+
+        Arguments:
+          xlsx_name: the file name to write the spreadsheet to. Note that
+            if a file already exists with this name then it will be
+            overwritten.
+        """
+        if os.path.exists(xlsx_name):
+            logging.debug("Overwriting existing file: '%s'" % xlsx_name)
+        nsheets = len(self.sheets)
+        zf = zipfile.ZipFile(xlsx_name,'w',zipfile.ZIP_DEFLATED)
+        try:
+            # Content types
+            content_types = ['<Types xmlns="http://schemas.openxmlformats.org/'
+                             'package/2006/content-types">',
+                             '<Default Extension="rels" ContentType="application/'
+                             'vnd.openxmlformats-package.relationships+xml"/>',
+                             '<Default Extension="xml" ContentType="application/xml"/>',
+                             '<Override PartName="/xl/workbook.xml" ContentType="%s"/>' %
+                             (XLSX_CONTENT_TYPE % 'sheet.main'),
+                             '<Override PartName="/xl/styles.xml" ContentType="%s"/>' %
+                             (XLSX_CONTENT_TYPE % 'styles')]
+            for i in range(nsheets):
+                content_types.append('<Override PartName="/xl/worksheets/sheet%d.xml" '
+                                     'ContentType="%s"/>' %
+                                     (i+1,XLSX_CONTENT_TYPE % 'worksheet'))
+            content_types.append('</Types>')
+            zf.writestr('[Content_Types].xml',
+                        XLSX_XML_DECLARATION + ''.join(content_types))
+            # Package relationships
+            zf.writestr('_rels/.rels',
+                        XLSX_XML_DECLARATION +
+                        '<Relationships xmlns="%s">'
+                        '<Relationship Id="rId1" Type="%s/officeDocument" '
+                        'Target="xl/workbook.xml"/></Relationships>' %
+                        (XLSX_RELS_NS,XLSX_DOC_RELS_NS))
+            # Workbook and its relationships (sheets first, then styles)
+            workbook = ['<workbook xmlns="%s" xmlns:r="%s"><sheets>' %
+                        (XLSX_MAIN_NS,XLSX_DOC_RELS_NS)]
+            rels = ['<Relationships xmlns="%s">' % XLSX_RELS_NS]
+            for i,ws in enumerate(self.sheets):
+                workbook.append('<sheet name=%s sheetId="%d" r:id="rId%d"/>' %
+                                (xml_text(ws.title,quote=True),i+1,i+1))
+                rels.append('<Relationship Id="rId%d" Type="%s/worksheet" '
+                            'Target="worksheets/sheet%d.xml"/>' %
+                            (i+1,XLSX_DOC_RELS_NS,i+1))
+            workbook.append('</sheets></workbook>')
+            rels.append('<Relationship Id="rId%d" Type="%s/styles" '
+                        'Target="styles.xml"/></Relationships>' %
+                        (nsheets+1,XLSX_DOC_RELS_NS))
+            zf.writestr('xl/workbook.xml',XLSX_XML_DECLARATION + ''.join(workbook))
+            zf.writestr('xl/_rels/workbook.xml.rels',
+                        XLSX_XML_DECLARATION + ''.join(rels))
+            # Worksheets
+            for i,ws in enumerate(self.sheets):
+                ws.save(zf,'xl/worksheets/sheet%d.xml' % (i+1))
+            # Styles (after the sheets, which may add to them)
+            zf.writestr('xl/styles.xml',self.styles.xml())
+        finally:
+            zf.close()
+
+class XLSXWorksheet(object):
+    """Class for writing to a sheet in an XLSX spreadsheet.
+
+    An XLSXWorksheet object represents a sheet in an XLSX spreadsheet;
+    instances should be created via the 'addSheet' method of the parent
+    XLSXWorkbook.
+
+    Data is added using the 'addTabData' and 'addText' methods in the
+    same way as for the Worksheet class, and the same style markup and
+    formulae (including the '?' and '#' substitutions) are supported.
+
+    Each row is converted to XML and written to a temporary file as soon
+    as it is added, so only the widest value seen in each column is held
+    in memory. As a consequence columns cannot be inserted and cell values
+    cannot be changed once rows have been added.
+    """
+
+    def __init__(self,title,styles,tmp_dir=None):
+        """Create a new XLSXWorksheet instance.
+
+        The title is truncated to the same length as for Worksheet
+        titles.
+
+        Arguments:
+          title: title text for the sheet
+          styles: XLSXStyles instance for the parent workbook
+          tmp_dir: (optional) directory to write temporary files to
+        """
+        self.title = title
+        if len(self.title) > MAX_LEN_WORKSHEET_TITLE:
+            # Truncate too-long title string
+            self.title = self.title[:MAX_LEN_WORKSHEET_TITLE]
+            logging.warning("Worksheet title > %d characters" % MAX_LEN_WORKSHEET_TITLE)
+            logging.warning("Truncated to '%s'" % self.title)
+        self.styles = styles
+        self.tmp_dir = tmp_dir
+        self.current_row = -1
+        self.ncols = 0
+        self.header = None
+        # Maximum column widths
+        self.max_col_width = []
+        # Column ids ('A','B',...) by column index
+        self.col_ids = []
+        # Temporary file holding the sheet data as XML
+        self.__fp = tempfile.TemporaryFile(dir=tmp_dir)
+
+    def addTabData(self,rows):
+        """Write a list of tab-delimited data rows to the sheet.
+
+        Arguments:
+          rows: Python list representing rows of tab-separated
+            data items
+        """
+        for row in rows:
+            self.__writeRow([parse_cell(item) for item in row.split('\t')])
+
+    def addText(self,text):
+        """Append and populate rows from text.
+
+        Arguments:
+          text: a string representing the data to add: rows are
+            delimited by newlines, and items by tabs
+        """
+        return self.addTabData(text.split('\n'))
+
+    def insertColumn(self,position,insert_items=None,title=None):
+        """Columns cannot be inserted into an XLSXWorksheet
+
+        Always returns False.
+        """
+        logging.error("Cannot insert data into XLSX worksheet")
+        return False
+
+    def setCellValue(self,row,col,value):
+        """Cell values cannot be changed in an XLSXWorksheet
+
+        Always returns False.
+        """
+        logging.error("Cannot set cell values in XLSX worksheet")
+        return False
+
+    def getColumnId(self,name):
+        """Lookup XLSX column id from name of column.
+
+        If there is no data, or if the name isn't in the first
+        row of the data, then an exception is raised.
+        """
+        if self.header is None:
+            raise IndexError, "Column '%s' not found" % name
+        i = [format_cell(cell) for cell in self.header].index(name)
+        return column_id_from_index(i)
+
+    def column_id_from_index(self,i):
+        """Get XLSX column id from index of column
+        """
+        return column_id_from_index(i)
+
+    def __columnId(self,i):
+        """Internal: return cached column id for index
+        """
+        try:
+            return self.col_ids[i]
+        except IndexError:
+            while len(self.col_ids) <= i:
+                self.col_ids.append(column_id_from_index(len(self.col_ids)))
+            return self.col_ids[i]
+
+    def close(self):
+        """Close (and so remove) the temporary file holding the data
+        """
+        if not self.__fp.closed:
+            self.__fp.close()
+
+    def __writeRow(self,cells):
+        """Internal: convert a row of cells to XML and write it out
+        """
+        self.current_row += 1
+        self.ncols = max(self.ncols,len(cells))
+        if self.header is None:
+            self.header = cells
+        if self.current_row >= MAX_NUMBER_ROWS_PER_XLSX_WORKSHEET:
+            logging.error("couldn't write row to sheet '%s' (row %d): too many rows" %
+                          (self.title,self.current_row+1))
+            return
+        rowx = str(self.current_row+1)
+        max_col_width = self.max_col_width
+        xml = ['<row r="%s">' % rowx]
+        for cindex,cell in enumerate(cells):
+            item,style = cell
+            col_id = self.__columnId(cindex)
+            xf_index = self.styles.getXfIndex(style)
+            if xf_index:
+                attrs = 'r="%s%s" s="%d"' % (col_id,rowx,xf_index)
+            else:
+                attrs = 'r="%s%s"' % (col_id,rowx)
+            if isinstance(item,basestring):
+                if item.startswith('='):
+                    # Formula item
+                    # Substitute '?' with current line number and
+                    # '#' with current column
+                    formula = item[1:].replace('?',rowx).replace('#',col_id)
+                    xml.append('<c %s><f>%s</f></c>' % (attrs,xml_text(formula)))
+                    len_item = len(formula)
+                elif item:
+                    if len(item) > MAX_LEN_XLSX_CELL_VALUE:
+                        logging.warning("Saving sheet '%s' (row %d, col %d)" %
+                                        (self.title,self.current_row,cindex))
+                        logging.warning("Truncating value '%s...' to %d characters" %
+                                        (item[:15],MAX_LEN_XLSX_CELL_VALUE))
+                        item = item[:MAX_LEN_XLSX_CELL_VALUE]
+                    xml.append('<c %s t="inlineStr"><is><t xml:space="preserve">%s'
+                               '</t></is></c>' % (attrs,xml_text(item)))
+                    len_item = len(item)
+                else:
+                    # Empty cell
+                    if xf_index:
+                        xml.append('<c %s/>' % attrs)
+                    len_item = 0
+            else:
+                # Number
+                if isinstance(item,float):
+                    value = repr(item)
+                else:
+                    value = str(item)
+                if value in ('nan','inf','-inf'):
+                    # Not representable as XLSX numbers
+                    xml.append('<c %s t="inlineStr"><is><t>%s</t></is></c>' %
+                               (attrs,value))
+                else:
+                    xml.append('<c %s><v>%s</v></c>' % (attrs,value))
+                len_item = len(value)
+            # Track the column widths
+            try:
+                if len_item > max_col_width[cindex]:
+                    max_col_width[cindex] = len_item
+            except IndexError:
+                max_col_width.append(len_item)
+        xml.append('</row>')
+        self.__fp.write(''.join(xml))
+
+    def save(self,zf,arcname):
+        """Write the sheet XML into an XLSX zip file.
+
+        The XML for the complete sheet is assembled in a temporary
+        file (the column widths have to precede the data) which is
+        then added to the zip file.
+
+        Arguments:
+          zf: zipfile.ZipFile instance for the XLSX file
+          arcname: name to store the sheet XML under in the zip file
+        """
+        fd,sheet_xml = tempfile.mkstemp(suffix='.xml',dir=self.tmp_dir)
+        try:
+            fp = os.fdopen(fd,'wb')
+            fp.write(XLSX_XML_DECLARATION)
+            fp.write('<worksheet xmlns="%s">' % XLSX_MAIN_NS)
+            if self.max_col_width:
+                fp.write('<cols>')
+                for cindex,width in enumerate(self.max_col_width):
+                    width = min(width,MAX_LEN_WORKSHEET_CELL_VALUE)
+                    fp.write('<col min="%d" max="%d" width="%d" customWidth="1"/>' %
+                             (cindex+1,cindex+1,width+5))
+                fp.write('</cols>')
+            fp.write('<sheetData>')
+            self.__fp.flush()
+            self.__fp.seek(0)
+            shutil.copyfileobj(self.__fp,fp)
+            fp.write('</sheetData></worksheet>')
+            fp.close()
+            zf.write(sheet_xml,arcname)
+        finally:
+            os.remove(sheet_xml)
+
+class XLSXStyles(object):
+    """Class for collecting the cell styles used in an XLSX workbook.
+
+    Each distinct set of style tag attributes is resolved once into an
+    index into the workbook's cell formats, with the fonts, fills, borders
+    and number formats that they use being shared where possible. The
+    'xml' method generates the contents of the styles part of the XLSX
+    file.
+    """
+    def __init__(self):
+        self.xf_indices = { None: 0 }
+        self.xfs = ['<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>']
+        self.fonts = ['<font><sz val="10"/><name val="Arial"/></font>']
+        self.fills = ['<fill><patternFill patternType="none"/></fill>',
+                      '<fill><patternFill patternType="gray125"/></fill>']
+        self.borders = ['<border><left/><right/><top/><bottom/><diagonal/></border>']
+        self.num_formats = []
+
+    def getXfIndex(self,style):
+        """Return the cell format index for a set of style tag attributes
+
+        Arguments:
+          style: text of the attributes from a style tag (e.g.
+            'font=bold bgcolor=gray25'), or None for the default style
+        """
+        try:
+            return self.xf_indices[style]
+        except KeyError:
+            pass
+        bold,wrap,color,bg_color,border_style,num_format_str = parse_style(style)
+        # Font
+        font = ['<font>']
+        if bold:
+            font.append('<b/>')
+        font.append('<sz val="10"/>')
+        rgb = xlsx_colour(color)
+        if rgb:
+            font.append('<color rgb="%s"/>' % rgb)
+        font.append('<name val="Arial"/></font>')
+        font_id = self.__lookup(self.fonts,''.join(font))
+        # Fill
+        rgb = xlsx_colour(bg_color)
+        if rgb:
+            fill_id = self.__lookup(self.fills,
+                                    '<fill><patternFill patternType="solid">'
+                                    '<fgColor rgb="%s"/><bgColor indexed="64"/>'
+                                    '</patternFill></fill>' % rgb)
+        else:
+            fill_id = 0
+        # Borders
+        border_id = 0
+        if border_style:
+            try:
+                line = XLSX_BORDER_STYLES[border_style]
+                border_id = self.__lookup(self.borders,
+                                          '<border>%s<diagonal/></border>' %
+                                          ''.join(['<%s style="%s"><color auto="1"/></%s>' %
+                                                   (side,line,side)
+                                                   for side in ('left','right',
+                                                                'top','bottom')]))
+            except KeyError:
+                logging.warning("Unable to get style: unknown border '%s'" %
+                                border_style)
+        # Number format
+        if num_format_str:
+            num_format_id = 164 + self.__lookup(self.num_formats,num_format_str)
+        else:
+            num_format_id = 0
+        # Cell format
+        xf = '<xf numFmtId="%d" fontId="%d" fillId="%d" borderId="%d" xfId="0"' % \
+             (num_format_id,font_id,fill_id,border_id)
+        if num_format_id:
+            xf += ' applyNumberFormat="1"'
+        if font_id:
+            xf += ' applyFont="1"'
+        if fill_id:
+            xf += ' applyFill="1"'
+        if border_id:
+            xf += ' applyBorder="1"'
+        if wrap:
+            xf += ' applyAlignment="1"><alignment wrapText="1"/></xf>'
+        else:
+            xf += '/>'
+        xf_index = self.__lookup(self.xfs,xf)
+        self.xf_indices[style] = xf_index
+        return xf_index
+
+    def __lookup(self,items,item):
+        """Internal: return index of item in list, appending if not found
+        """
+        try:
+            return items.index(item)
+        except ValueError:
+            items.append(item)
+            return len(items) - 1
+
+    def xml(self):
+        """Return the XML for the styles part of an XLSX file
+        """
+        xml = [XLSX_XML_DECLARATION,'<styleSheet xmlns="%s">' % XLSX_MAIN_NS]
+        if self.num_formats:
+            xml.append('<numFmts count="%d">' % len(self.num_formats))
+            for i,num_format in enumerate(self.num_formats):
+                xml.append('<numFmt numFmtId="%d" formatCode=%s/>' %
+                           (164+i,xml_text(num_format,quote=True)))
+            xml.append('</numFmts>')
+        for name,items in (('fonts',self.fonts),
+                           ('fills',self.fills),
+                           ('borders',self.borders)):
+            xml.append('<%s count="%d">%s</%s>' % (name,len(items),''.join(items),name))
+        xml.append('<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" '
+                   'borderId="0"/></cellStyleXfs>')
+        xml.append('<cellXfs count="%d">%s</cellXfs>' % (len(self.xfs),''.join(self.xfs)))
+        xml.append('<cellStyles count="1"><cellStyle name="Normal" xfId="0" '
+                   'builtinId="0"/></cellStyles>')
+        xml.append('</styleSheet>')
+        return ''.join(xml)
+
 class Spreadsheet:
     """Class for creating and writing a spreadsheet.
 
-    This creates a very simple single-sheet workbook.
+    This creates a very simple single-sheet workbook; if the name ends
+    with '.xlsx' then an XLSX file is written (using XLSXWorkbook),
+    otherwise an XLS file.
     """
 
     def __init__(self,name,title):
         """Create a new Spreadsheet instance.
 
-        If the named spreadsheet already exists then any new
-        data is appended to the it.
+        If the named XLS spreadsheet already exists then any new
+        data is appended to the it (existing XLSX files are
+        overwritten).
 
         Arguments:
           name: name of the XLS format spreadsheet to be created. 
           title: title for the new sheet.
         """
-        self.workbook = Workbook(name)
+        if name.lower().endswith('.xlsx'):
+            if os.path.exists(name):
+                logging.warning("Cannot append to XLSX file '%s', it will be "
+                                "overwritten" % name)
+            self.workbook = XLSXWorkbook()
+        else:
+            self.workbook = Workbook(name)
         self.name = name
         self.headers = []
         try:
@@ -783,7 +1345,149 @@ class Spreadsheet:
 # Functions
 #######################################################################
 
-# No functions defined
+def column_id_from_index(i):
+    """Get spreadsheet column id from index of column
+
+    i is the zero-based column index (an integer); this function
+    returns the matching column identifier (i.e. 'A', 'B', 'AA',
+    'BA' etc).
+    """
+    name = ''
+    try:
+        while i >= 0:
+            name += string.uppercase[i%26]
+            i = i/26-1
+        return name[::-1]
+    except IndexError, ex:
+        print "Exception getting column name for index %d: %s" % (i,ex)
+        raise
+
+def parse_style(style):
+    """Parse the attributes from a style tag
+
+    Returns a tuple (bold,wrap,color,bg_color,border_style,num_format_str)
+    with the settings from the attributes (see the Worksheet documentation
+    for the recognised attributes).
+
+    Arguments:
+      style: text of the attributes from a style tag (e.g.
+        'font=bold bgcolor=gray25'), or None
+    """
+    bold = False
+    color=None
+    bg_color = None
+    wrap = False
+    border_style = None
+    num_format_str = None
+    if style is not None:
+        for attr in style.split(' '):
+            attr = attr.strip()
+            if attr.startswith('bgcolor='):
+                bg_color = attr.split('=')[1].strip()
+            elif attr.startswith('color='):
+                color = attr.split('=')[1].strip()
+            elif attr == 'font=bold':
+                bold = True
+            elif attr.startswith('border='):
+                border_style = attr.split('=')[1].strip()
+            elif attr == 'wrap':
+                wrap = True
+            elif attr.startswith('number_format='):
+                num_format_str = attr.split('=')[1].strip()
+    return (bold,wrap,color,bg_color,border_style,num_format_str)
+
+def xlsx_colour(name):
+    """Return the ARGB value to use in XLSX for a colour name
+
+    The name should be one recognised by xlwt (e.g. 'red', 'gray25');
+    returns None (with a warning) for an unrecognised name, or if
+    name is None.
+    """
+    if name is None:
+        return None
+    try:
+        return 'FF' + EXCEL_PALETTE[xlwt.Style.colour_map[name]]
+    except KeyError:
+        logging.warning("Unable to get style: unknown colour '%s'" % name)
+        return None
+
+def xml_text(text,quote=False):
+    """Return text escaped for inclusion in XML
+
+    The text is encoded as UTF-8: byte strings are assumed to be
+    UTF-8 already, unless they aren't valid UTF-8 in which case they
+    are treated as Latin-1 (as may be the case e.g. for file names).
+    Characters which XML doesn't allow are removed.
+
+    Arguments:
+      text: the text to escape
+      quote: if True then also quote the text for use as an
+        attribute value
+    """
+    if not isinstance(text,unicode):
+        try:
+            text = text.decode('utf-8')
+        except UnicodeDecodeError:
+            text = text.decode('latin-1')
+    text = RE_XML_INVALID.sub('',text.encode('utf-8'))
+    if quote:
+        return quoteattr(text)
+    return escape(text)
+
+def parse_cell(item):
+    """Parse a data item into a cell
+
+    Splits off any style tag and converts numbers, returning a
+    tuple (value,style) where 'value' is an integer, float or string
+    (formulae are left as strings starting with '='), and 'style' is
+    the text of the style tag attributes or None if there was no tag.
+
+    Arguments:
+      item: string with the data item, as it would appear in the
+        tab-delimited data supplied to the Worksheet
+    """
+    style = None
+    if item.startswith('<style'):
+        style_match = RE_STYLE.match(item)
+        if style_match:
+            item = style_match.group(2)
+            style = style_match.group(1)
+    if item and item[0] in NUMBER_START:
+        # Attempt to convert to a number type i.e. integer/float
+        try:
+            return (int(item),style)
+        except ValueError:
+            try:
+                return (float(item),style)
+            except ValueError:
+                pass
+    return (item,style)
+
+def format_cell(cell):
+    """Return the string representation of a cell
+
+    This is the inverse of 'parse_cell', with numbers in their
+    normalised form.
+
+    Arguments:
+      cell: tuple (value,style) as returned by 'parse_cell'
+    """
+    item,style = cell
+    if isinstance(item,float):
+        item = repr(item)
+    else:
+        item = str(item)
+    if style is None:
+        return item
+    return "<style %s>%s</style>" % (style,item)
+
+def format_row(row):
+    """Return a row of cells as a tab-delimited string
+
+    Arguments:
+      row: list of cells as returned by 'parse_cell'
+    """
+    return '\t'.join([format_cell(cell) for cell in row])
 
 #######################################################################
 # Tests
@@ -792,6 +1496,42 @@ class Spreadsheet:
 import unittest
 import tempfile
 
+class TestParseCell(unittest.TestCase):
+    """Tests for the parse_cell and format_cell functions
+    """
+
+    def test_parse_plain_values(self):
+        """Parse unstyled strings, numbers and formulae
+        """
+        self.assertEqual(parse_cell("hello"),("hello",None))
+        self.assertEqual(parse_cell(""),("",None))
+        self.assertEqual(parse_cell("12"),(12,None))
+        self.assertEqual(parse_cell("-1.5"),(-1.5,None))
+        self.assertEqual(parse_cell("=A?+B?"),("=A?+B?",None))
+        self.assertTrue(isinstance(parse_cell("12")[0],int))
+        self.assertTrue(isinstance(parse_cell("1.25")[0],float))
+
+    def test_parse_styled_values(self):
+        """Parse values wrapped in style tags
+        """
+        self.assertEqual(parse_cell("<style font=bold>Title</style>"),
+                         ("Title","font=bold"))
+        self.assertEqual(parse_cell("<style bgcolor=gray25 wrap>2.5</style>"),
+                         (2.5,"bgcolor=gray25 wrap"))
+        self.assertEqual(parse_cell("<style font=bold>=A1</style>"),
+                         ("=A1","font=bold"))
+        self.assertEqual(parse_cell("<style font=bold>unterminated"),
+                         ("<style font=bold>unterminated",None))
+
+    def test_format_cell(self):
+        """Convert cells back to strings
+        """
+        for item in ("hello","","12","-1.5","=A?+B?",
+                     "<style font=bold>Title</style>",
+                     "<style bgcolor=gray25 wrap>2.5</style>"):
+            self.assertEqual(format_cell(parse_cell(item)),item)
+        self.assertEqual(format_cell(parse_cell("1.50")),"1.5")
+
 class TestWorkbook(unittest.TestCase):
     """Tests of the Workbook class
     """
@@ -896,6 +1636,27 @@ class TestWorksheet(unittest.TestCase):
         for i in range(1):
             self.assertEqual(new_data[i],ws.data[i])
 
+    def test_rows_hold_cell_lists(self):
+        """Data is held internally as lists of cell values
+        """
+        ws = self.wb.addSheet("test sheet")
+        ws.addTabData(["1\t2\t3","","4\t5"])
+        self.assertEqual(ws.rows,[[(1,None),(2,None),(3,None)],
+                                  [('',None)],
+                                  [(4,None),(5,None)]])
+        self.assertEqual(ws.ncols,3)
+        self.assertEqual(list(ws.data),["1\t2\t3","","4\t5"])
+        self.assertEqual(ws.data[1:],["","4\t5"])
+
+    def test_get_column_id(self):
+        """Look up column id from the name in the header row
+        """
+        ws = self.wb.addSheet("test sheet")
+        ws.addTabData(["chr\tstart\tend","chr1\t1\t10"])
+        self.assertEqual(ws.getColumnId('chr'),'A')
+        self.assertEqual(ws.getColumnId('end'),'C')
+        self.assertRaises(ValueError,ws.getColumnId,'missing')
+
     def test_get_column_id_from_index(self):
         """Check column id ('A','B',...,'AB' etc) for index
         """
@@ -1022,6 +1783,197 @@ class TestWorksheetInsertColumn(unittest.TestCase):
         for i in range(len(new_data)):
             self.assertEqual(new_data[i],ws.data[i])
 
+    def test_insert_several_columns(self):
+        """Insert a sequence of formula columns into a sheet with data
+        """
+        ws = self.wb.addSheet("test sheet")
+        data = ["a\tb\tc","1\t2\t3","4\t5\t6"]
+        ws.addTabData(data)
+        ws.insertColumn(1,title="x",insert_items="=A?")
+        ws.insertColumn(2,title="y",insert_items="=C?+1")
+        ws.insertColumn(6,title="z",insert_items=["7","8"])
+        self.assertEqual(len(ws.data),3)
+        self.assertEqual(ws.ncols,7)
+        new_data = ["a\tx\ty\tb\tc\t\tz",
+                    "1\t=A?\t=C?+1\t2\t3\t\t7",
+                    "4\t=A?\t=C?+1\t5\t6\t\t8"]
+        for i in range(len(new_data)):
+            self.assertEqual(new_data[i],ws.data[i])
+
+class TestWorksheetStyles(unittest.TestCase):
+    """Tests for resolving styles for cells
+    """
+
+    def setUp(self):
+        """Set up common to all tests in this class
+        """
+        self.wb = Workbook()
+
+    def test_get_xf_style_is_cached(self):
+        """Each distinct style is only resolved once
+        """
+        ws = self.wb.addSheet("test sheet")
+        style = ws.getXfStyle('font=bold bgcolor=gray25')
+        self.assertTrue(ws.getXfStyle('font=bold bgcolor=gray25') is style)
+        self.assertFalse(ws.getXfStyle(None) is style)
+        self.assertEqual(len(ws.xf_styles),2)
+
+    def test_equivalent_styles_share_xf_style(self):
+        """Styles with the same attributes in a different order are shared
+        """
+        ws = self.wb.addSheet("test sheet")
+        self.assertTrue(ws.getXfStyle('font=bold bgcolor=gray25') is
+                        ws.getXfStyle('bgcolor=gray25 font=bold'))
+
+class TestXLSXWorkbook(unittest.TestCase):
+    """Tests of the XLSXWorkbook and XLSXWorksheet classes
+    """
+
+    def setUp(self):
+        """Set up common to all tests in this class
+        """
+        self.wb = XLSXWorkbook()
+        # Make a temporary file name
+        self.xlsx = tempfile.mkstemp(suffix=".xlsx")
+        os.close(self.xlsx[0])
+        self.xlsx = self.xlsx[1]
+
+    def tearDown(self):
+        """Do clean up after tests
+        """
+        if os.path.exists(self.xlsx): os.remove(self.xlsx)
+
+    def test_make_workbook_add_sheets(self):
+        """Make a new XLSX workbook and add and retrieve sheets
+        """
+        self.assertEqual(len(self.wb.sheets),0)
+        self.assertRaises(KeyError,self.wb.getSheet,"sheet 1")
+        ws1 = self.wb.addSheet("sheet 1")
+        self.assertTrue(isinstance(ws1,XLSXWorksheet))
+        ws2 = self.wb.addSheet("sheet 2")
+        self.assertEqual(len(self.wb.sheets),2)
+        self.assertEqual(ws1,self.wb.getSheet("sheet 1"))
+        self.assertEqual(ws2,self.wb.getSheet("sheet 2"))
+        self.assertEqual(ws1,self.wb.addSheet("sheet 1"))
+        self.assertEqual(len(self.wb.sheets),2)
+
+    def test_add_data(self):
+        """Add data to an XLSX worksheet
+        """
+        ws = self.wb.addSheet("test sheet")
+        ws.addText("chr\tstart\nchr1\t100")
+        ws.addTabData(["chr2\t200\t300"])
+        self.assertEqual(ws.current_row,2)
+        self.assertEqual(ws.ncols,3)
+        self.assertEqual(ws.getColumnId('start'),'B')
+        self.assertRaises(ValueError,ws.getColumnId,'end')
+        self.assertFalse(ws.insertColumn(1,title="new",insert_items="=A?"))
+        self.assertFalse(ws.setCellValue(0,0,"value"))
+
+    def test_basic_write(self):
+        """Create and write a simple XLSX spreadsheet
+        """
+        ws = self.wb.addSheet("test <sheet>")
+        ws.addText("<style font=bold>Name</style>\t<style font=bold>Value</style>\n"
+                   "this & that\t<style number_format=0.00 bgcolor=gray25>1.5</style>\n"
+                   "other\t12\t\tend")
+        ws2 = self.wb.addSheet("notes")
+        ws2.addText("Some notes")
+        self.wb.save(self.xlsx)
+        self.assertTrue(os.path.exists(self.xlsx))
+        # Open the file with xlrd and check it contains what we expect
+        rb = xlrd.open_workbook(self.xlsx)
+        self.assertEqual(len(rb.sheets()),2)
+        s = rb.sheets()[0]
+        self.assertEqual(s.name,"test <sheet>")
+        self.assertEqual(s.nrows,3)
+        self.assertEqual(s.ncols,4)
+        self.assertEqual(s.cell(0,0).value,"Name")
+        self.assertEqual(s.cell(1,0).value,"this & that")
+        self.assertEqual(s.cell(1,1).value,1.5)
+        self.assertEqual(s.cell(2,1).value,12)
+        self.assertEqual(s.cell(2,2).value,"")
+        self.assertEqual(s.cell(2,3).value,"end")
+        self.assertEqual(rb.sheets()[1].cell(0,0).value,"Some notes")
+        # Check the styles
+        styles = zipfile.ZipFile(self.xlsx).read('xl/styles.xml')
+        self.assertTrue('<b/>' in styles)
+        self.assertTrue('<fgColor rgb="FFC0C0C0"/>' in styles)
+        self.assertTrue('formatCode="0.00"' in styles)
+
+    def test_write_formulae(self):
+        """Create and write an XLSX spreadsheet with formulae
+        """
+        ws = self.wb.addSheet("test sheet")
+        ws.addText("1\t2\t=A?+B?\n3\t4\t=#1*#2")
+        self.wb.save(self.xlsx)
+        sheet = zipfile.ZipFile(self.xlsx).read('xl/worksheets/sheet1.xml')
+        self.assertTrue('<c r="C1"><f>A1+B1</f></c>' in sheet)
+        self.assertTrue('<c r="C2"><f>C1*C2</f></c>' in sheet)
+
+    def test_save_twice(self):
+        """Save an XLSX workbook, add more data and save again
+        """
+        ws = self.wb.addSheet("test sheet")
+        ws.addText("first")
+        self.wb.save(self.xlsx)
+        ws.addText("second")
+        self.wb.save(self.xlsx)
+        s = xlrd.open_workbook(self.xlsx).sheets()[0]
+        self.assertEqual(s.nrows,2)
+        self.assertEqual(s.cell(1,0).value,"second")
+
+    def test_more_rows_than_xls(self):
+        """Write more rows to an XLSX worksheet than XLS allows
+        """
+        n_rows = MAX_NUMBER_ROWS_PER_WORKSHEET + 1
+        ws = self.wb.addSheet("test sheet")
+        for i in xrange(n_rows):
+            ws.addTabData(["value\t%d" % i])
+        self.wb.save(self.xlsx)
+        s = xlrd.open_workbook(self.xlsx).sheets()[0]
+        self.assertEqual(s.nrows,n_rows)
+        self.assertEqual(s.cell(n_rows-1,1).value,n_rows-1)
+
+    def test_non_utf8_text(self):
+        """Write byte strings which aren't valid UTF-8
+        """
+        ws = self.wb.addSheet("test sheet")
+        ws.addText("# name = /data/Caf\xe9/macs\tcaf\xc3\xa9")
+        self.wb.save(self.xlsx)
+        # Sheet XML is valid UTF-8
+        sheet = zipfile.ZipFile(self.xlsx).read('xl/worksheets/sheet1.xml')
+        sheet.decode('utf-8')
+        s = xlrd.open_workbook(self.xlsx).sheets()[0]
+        self.assertEqual(s.cell(0,0).value,u"# name = /data/Caf\xe9/macs")
+        self.assertEqual(s.cell(0,1).value,u"caf\xe9")
+
+    def test_close(self):
+        """Closing an XLSX workbook closes the sheets' temporary files
+        """
+        with XLSXWorkbook() as wb:
+            ws = wb.addSheet("test sheet")
+            ws.addText("data")
+            wb.save(self.xlsx)
+        self.assertRaises(ValueError,ws.addText,"more data")
+        # Closing again is harmless
+        wb.close()
+
+    def test_spreadsheet_writes_xlsx(self):
+        """Spreadsheet class writes XLSX for names ending in '.xlsx'
+        """
+        wb = Spreadsheet(self.xlsx,'test')
+        self.assertTrue(isinstance(wb.workbook,XLSXWorkbook))
+        wb.addTitleRow(['File','Total reads'])
+        wb.addEmptyRow()
+        wb.addRow(['DR_1',875897])
+        wb.write()
+        s = xlrd.open_workbook(self.xlsx).sheets()[0]
+        self.assertEqual(s.name,"test")
+        self.assertEqual(s.nrows,3)
+        self.assertEqual(s.cell(0,0).value,"File")
+        self.assertEqual(s.cell(2,1).value,875897)
+
 class TestWorkbookSave(unittest.TestCase):
     """Test saving the workbook to disk
     """
@@ -1072,6 +2024,23 @@ class TestWorkbookSave(unittest.TestCase):
         self.assertEqual(s.nrows,1)
         self.assertEqual(s.ncols,4)
 
+    def test_write_styled_numbers(self):
+        """Create and write a spreadsheet with styled numbers and widths
+        """
+        ws = self.wb.addSheet("test sheet")
+        ws.addText("<style font=bold>Name</style>\t<style font=bold>Value</style>\n"
+                   "longer name\t<style number_format=0.00>1.5</style>\n"
+                   "short\t<style number_format=0.00>12</style>")
+        self.wb.save(self.xls)
+        rb = xlrd.open_workbook(self.xls,formatting_info=True)
+        s = rb.sheets()[0]
+        self.assertEqual(s.nrows,3)
+        self.assertEqual(s.cell(0,0).value,"Name")
+        self.assertEqual(s.cell(1,1).value,1.5)
+        self.assertEqual(s.cell(2,1).value,12)
+        self.assertEqual(s.colinfo_map[0].width,256*(len("longer name")+5))
+        self.assertEqual(s.colinfo_map[1].width,256*(len("Value")+5))
+
     def test_too_long_cell_value(self):
         """Insert a data item into a worksheet which exceeds the xlwt length limit
         """
@@ -9,7 +9,7 @@
 #
 #########################################################################
 
-__version__ = "0.2.6"
+__version__ = "0.9.2"
 
 """TabFile
 
@@ -181,6 +181,28 @@ Use the TabFile's 'write' method to output the content to a file:
 It's also possible to reorder the columns before writing out using
 the 'reorderColumns' method.
 
+If the file name ends with '.gz' then the output is gzip-compressed.
+Lines can also be written one at a time using a TabFileWriter, which
+buffers the output, e.g. to write lines from a TabFileStream:
+
+>>> writer = TabFileWriter('newfile.txt.gz')
+>>> for line in TabFileStream('data.txt'):
+...     writer.write(line)
+>>> writer.close()
+
+Streaming Data
+==============
+
+To process a file without loading it all into memory use a
+TabFileStream instead of a TabFile; this reads the lines as they are
+needed, and supports filtering, transforming and computing columns as
+a pipeline which is applied as the lines are read, for example:
+
+>>> TabFileStream('data.txt',first_line_is_header=True).\
+...     filter(lambda line: line['chr'] == 'chr1').\
+...     computeColumn('midpoint',lambda line: (line['start']+line['end'])/2).\
+...     write('chr1.txt',include_header=True)
+
 Specifying Delimiters
 =====================
 
@@ -189,9 +211,166 @@ specifying the value of the 'delimiter' argument when creating a new
 TabFile object, for example for a comma-delimited file:
 
 >>> data = TabFile('data.txt',delimiter=',')
+
+Column Types
+============
+
+Values read from a file are converted to integers or floats where
+possible. The conversion is deferred until each value is first
+accessed, so columns which are never read don't incur any cost.
+
+Types can also be declared for specific columns using the
+'column_types' argument, which maps column names (or indices) to a type
+or conversion function, for example:
+
+>>> data = TabFile('data.txt',first_line_is_header=True,
+...                column_types={'chr':str,'start':int,'end':int})
+
+Numerical Columns
+=================
+
+If NumPy is available then the values in a column can be fetched as
+an array using the 'asArray' method, and arrays (or any sequence) can
+be stored back in a column using 'setColumn', so that arithmetic can be
+performed on whole columns at once:
+
+>>> start = data.asArray('start')
+>>> end = data.asArray('end')
+>>> data.setColumn('midpoint',(start+end)/2.0)
+
+Lines can be sorted on the values in one or more columns using
+'sortByColumns', and filtered using a boolean array (or function):
+
+>>> data.sortByColumns('chr','start')
+>>> data.filter(data.asArray('end')-data.asArray('start') > 1000)
+
+The lines themselves are not changed by 'asArray', so the normal line
+based operations and 'write' can still be used on the data.
 """
 
-class TabDataLine:
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import os
+import gzip
+import marshal
+import multiprocessing
+try:
+    import numpy
+except ImportError:
+    # numpy not available, arrays can't be used
+    numpy = None
+
+#######################################################################
+# Module constants
+#######################################################################
+
+# Minimum size of the chunks of a file parsed by each worker process
+PARSE_CHUNK_SIZE = 1024*1024
+
+# Size of the buffer used when writing data
+WRITE_BUFFER_SIZE = 1024*1024
+
+# Characters that strings representing numbers can start with
+# (int and float also allow leading whitespace, and float accepts
+# 'inf' and 'nan')
+_NUMBER_START = frozenset('0123456789+-. \t\n\r\x0b\x0ciInN')
+
+#######################################################################
+# Classes
+#######################################################################
+
+class TabColumns:
+    """Class to map column names to column indices
+
+    A TabColumns object holds an ordered list of column names
+    (the 'names' attribute) and a dictionary mapping each name to
+    its index (the 'index' attribute), so that looking up the index
+    for a column name doesn't require a search of the list.
+
+    A single TabColumns object is shared between a TabFile and all
+    its data lines, so the column names aren't duplicated for each
+    line.
+
+    If the same name appears more than once then it maps to the
+    first matching column.
+
+    TabColumns objects can also be treated as a sequence of column
+    names, e.g.
+
+        for name in columns:
+            ...
+
+    Types can also be declared for columns, via the 'types' attribute
+    (a dictionary mapping column indices to a type or function, e.g.
+    int, float or str), which are used when converting the values read
+    from a file.
+    """
+    __slots__ = ('names','index','types')
+
+    def __init__(self,names=None,types=None):
+        """Create a new TabColumns object
+
+        Arguments:
+          names: (optional) list or tuple of column names
+          types: (optional) dictionary mapping column names or
+            indices to the types (or functions) that are used to
+            convert values read into those columns
+        """
+        self.names = []
+        self.index = {}
+        self.types = {}
+        if names is not None:
+            for name in names:
+                self.append(name)
+        if types is not None:
+            for key in types:
+                self.setType(key,types[key])
+
+    def append(self,name):
+        """Add a new column name
+        """
+        try:
+            self.index.setdefault(name,len(self.names))
+        except TypeError:
+            # Unhashable name, can only be accessed by position
+            pass
+        self.names.append(name)
+
+    def setType(self,key,type_):
+        """Declare the type for a column
+
+        Arguments:
+          key: column name or integer index
+          type_: type or function used to convert raw values read
+            into the column (e.g. int, float or str)
+        """
+        i = self.index.get(key)
+        if i is None:
+            try:
+                i = int(key)
+            except ValueError:
+                raise KeyError, "column '%s' not found" % key
+        self.types[i] = type_
+
+    def copy(self):
+        """Return an independent copy
+        """
+        columns = TabColumns(self.names)
+        columns.types.update(self.types)
+        return columns
+
+    def __getitem__(self,i):
+        return self.names[i]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+class TabDataLine(object):
     """Class to store a line of data from a tab-delimited file
 
     Values can be accessed by integer index or by column names (if
@@ -223,32 +402,67 @@ class TabDataLine:
     Check if a line is empty:
 
         if not line: print "Blank line"
+
+    Column names are held in a TabColumns object, which can be shared
+    between many lines (as is the case for lines in a TabFile); the
+    'names' attribute gives the list of column names.
+
+    Values read from the input line are stored as the raw strings, and
+    are only converted when they are first accessed (the converted
+    value then replaces the raw one). Fetching the 'data' attribute
+    converts all the values in the line.
     
     """
+    __slots__ = ('__values','__raw','__columns','__owns_columns',
+                 '__delimiter','__lineno')
+
     def __init__(self,line=None,column_names=None,delimiter='\t',lineno=None):
         """Create a new TabFileLine object
 
         Arguments:
-          line: (optional) Tab-delimited line with data values
+          line: (optional) Tab-delimited line with data values, or
+            a list of the (unconverted) string values (which is
+            copied, so the caller's list isn't modified)
           column_names: (optional) tuple or list of column names
-            to assign to each value.
+            to assign to each value, or a TabColumns object (which
+            will be shared with the line rather than copied)
           delimiter: (optional) delimiter character (defaults to tab)
           lineno: (optional) Line number
         """
         # Data
-        self.data = []
-        self.delimiter(delimiter)
+        # Values from the line are stored unconverted: bits set in
+        # __raw mark the positions which haven't been converted yet
+        if delimiter is not None:
+            self.__delimiter = str(delimiter)
         self.__lineno = None
-        if line is not None:
-            for value in line.split(self.__delimiter):
-                self.data.append(self.__convert(value.rstrip('\n')))
+        if line is None:
+            values = []
+        elif isinstance(line,list):
+            values = list(line)
+        else:
+            # Strip trailing newlines from the values
+            # (fast path for the common case of a single newline at
+            # the end of the line)
+            nnewlines = line.count('\n')
+            if nnewlines == 0:
+                values = line.split(self.__delimiter)
+            elif nnewlines == 1 and line[-1] == '\n':
+                values = line[:-1].split(self.__delimiter)
+            else:
+                values = [value.rstrip('\n')
+                          for value in line.split(self.__delimiter)]
+        self.__values = values
+        self.__raw = (1 << len(values)) - 1
         # Column names
-        self.names = []
-        if column_names:
-            for name in column_names:
-                self.names.append(name)
-            while len(self.data) < len(column_names):
-                self.data.append('')
+        if isinstance(column_names,TabColumns):
+            self.__columns = column_names
+            self.__owns_columns = False
+        else:
+            self.__columns = TabColumns(column_names)
+            self.__owns_columns = True
+        npad = len(self.__columns.names) - len(values)
+        if npad > 0:
+            values.extend(['']*npad)
         # Line number
         if lineno is not None:
             invalid_lineno = False
@@ -264,6 +478,48 @@ class TabDataLine:
                 raise ValueError,"invalid line number '%s'" % lineno
         self.__lineno = lineno
 
+    @property
+    def data(self):
+        """List of (converted) data values for the line
+        """
+        if self.__raw:
+            values = self.__values
+            raw = self.__raw
+            convert = self.__convert_raw
+            for i in xrange(len(values)):
+                if raw >> i & 1:
+                    values[i] = convert(i,values[i])
+            self.__raw = 0
+        return self.__values
+
+    @property
+    def names(self):
+        """List of column names for the line
+        """
+        return self.__columns.names
+
+    def columns(self):
+        """Return the TabColumns object holding the column names
+        """
+        return self.__columns
+
+    def __column_index(self,key):
+        """Internal: return the index of the data item for a key
+
+        'key' can be a column name or an integer index.
+        """
+        # See if key is a column name
+        i = self.__columns.index.get(key)
+        if i is not None:
+            return i
+        # Not a column name
+        # See if it's an integer index
+        try:
+            return int(key)
+        except ValueError:
+            # Not an integer
+            raise KeyError, "column '%s' not found" % key
+
     def __getitem__(self,key):
         """Implement value = TabDataLine[key]
 
@@ -273,23 +529,12 @@ class TabDataLine:
         WARNING there is potential ambiguity if any column "names"
         also happen to be integers. 
         """
-        # See if key is a column name
+        i = self.__column_index(key)
         try:
-            i = self.names.index(key)
-            return self.data[i]
-        except ValueError:
-            # Not a column name
-            # See if it's an integer index
-            try:
-                i = int(key)
-            except ValueError:
-                # Not an integer
-                raise KeyError, "column '%s' not found" % key
-            try:
-                return self.data[i]
-            except IndexError:
-                # Integer but out of range
-                raise IndexError, "integer index out of range for '%s'" % key
+            return self.__value(i)
+        except IndexError:
+            # Integer but out of range
+            raise IndexError, "integer index out of range for '%s'" % key
 
     def __setitem__(self,key,value):
         """Implement TabDataLine[key] = value
@@ -302,32 +547,69 @@ class TabDataLine:
         """
         # Convert value to correct type
         converted_value = self.__convert(value)
-        # See if key is a column name
+        i = self.__column_index(key)
         try:
-            i = self.names.index(key)
-            self.data[i] = converted_value
-        except ValueError:
-            # Not a column name
-            # See if it's an integer index
-            try:
-                i = int(key)
-            except ValueError:
-                # Not an integer
-                raise KeyError, "column '%s' not found" % key
-            try:
-                self.data[i] = converted_value
-            except IndexError:
-                # Integer but out of range
-                raise IndexError, "integer index out of range for '%s'" % key
+            self.__values[i] = converted_value
+        except IndexError:
+            # Integer but out of range
+            raise IndexError, "integer index out of range for '%s'" % key
+        if self.__raw:
+            # Value no longer needs converting
+            if i < 0: i += len(self.__values)
+            self.__raw &= ~(1 << i)
 
     def __len__(self):
-        return len(self.data)
+        return len(self.__values)
 
     def __nonzero__(self):
-        for item in self.data:
+        # Converting raw values doesn't change whether they're blank
+        for item in self.__values:
             if str(item).strip(): return True
         return False
 
+    def __value(self,i):
+        """Internal: return the value at index i, converting if necessary
+
+        Raises IndexError if i is out of range.
+        """
+        value = self.__values[i]
+        if self.__raw:
+            if i < 0: i += len(self.__values)
+            bit = 1 << i
+            if self.__raw & bit:
+                value = self.__convert_raw(i,value)
+                self.__values[i] = value
+                self.__raw ^= bit
+        return value
+
+    def __convert_raw(self,i,value):
+        """Internal: convert a raw string read from the input line
+
+        If a type has been declared for the column then that is used
+        for the conversion, otherwise the value is coerced into an
+        integer or float if appropriate. Values which can't be
+        converted are left as strings.
+        """
+        convert = self.__columns.types.get(i)
+        if convert is not None:
+            try:
+                return convert(value)
+            except ValueError:
+                return value
+        if value[:1] not in _NUMBER_START or \
+           (len(value) == 1 and not value.isdigit()):
+            # Can't be a number
+            return value
+        if '.' not in value:
+            try:
+                return int(value)
+            except ValueError:
+                pass
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
     def __convert(self,value):
         """Internal: convert a value to the correct type
 
@@ -355,15 +637,29 @@ class TabDataLine:
         Should only be used when creating new data lines.
         """
         for value in values:
-            self.data.append(self.__convert(value))
+            self.__values.append(self.__convert(value))
 
-    def appendColumn(self,key,value):
+    def appendColumn(self,key,value,columns=None):
         """Append keyed values to the data line
 
         This adds a new value along with a header name (i.e. key)
+
+        If the column names are shared with other lines then the line
+        gets its own copy of the names before the new one is added,
+        unless 'columns' is given: this should be a TabColumns object
+        which already ends with the new name, and which the line will
+        share instead (so that the names can be extended once for
+        many lines).
         """
-        self.names.append(key)
-        self.data.append(self.__convert(value))
+        if columns is not None:
+            self.__columns = columns
+            self.__owns_columns = False
+        else:
+            if not self.__owns_columns:
+                self.__columns = self.__columns.copy()
+                self.__owns_columns = True
+            self.__columns.append(key)
+        self.__values.append(self.__convert(value))
 
     def subset(self,*keys):
         """Return a subset of data items
@@ -422,8 +718,19 @@ class TabDataLine:
         """
         return self.__lineno
 
+    def formatted(self,delimiter=None):
+        """Return the line as a string of delimited values
+
+        Arguments:
+          delimiter: (optional) delimiter to use between the values
+            (defaults to the delimiter for the line)
+        """
+        if delimiter is None:
+            delimiter = self.__delimiter
+        return delimiter.join(map(str,self.data))
+
     def __repr__(self):
-        return self.__delimiter.join([str(x) for x in self.data])
+        return self.formatted()
 
 class TabFile:
     """Class to get data from a tab-delimited file
@@ -449,13 +756,20 @@ class TabFile:
     """
     def __init__(self,filen=None,fp=None,column_names=None,skip_first_line=False,
                  first_line_is_header=False,tab_data_line=TabDataLine,
-                 delimiter='\t'):
+                 delimiter='\t',column_types=None,workers=1):
         """Create a new TabFile object
 
         If either of 'filen' or 'fp' arguments are given then the
         TabFile object will be populated with data from the specified
         file or stream. Otherwise an empty TabFile object is created.
 
+        If 'workers' is greater than one and the data are loaded from
+        a named file then the file is split into chunks which are
+        parsed in parallel by a pool of processes. Note that the
+        values have to be passed back to the main process, and the
+        data line objects are still created there, which limits the
+        speed up that's possible.
+
         Arguments:
           filen (optional): name of tab-delimited file to load data
               from; ignored if fp is also specified
@@ -473,25 +787,47 @@ class TabFile:
           tab_data_line: (optional) class to use for creating data
               line objects (defaults to TabDataLine).
           delimiter: (optional) delimiter character (defaults to tab)
+          column_types: (optional) dictionary mapping column names
+              or indices to the type (or function) used to convert
+              values read from the file, e.g. {'start':int,'chr':str}
+              (otherwise values are converted to integer or float
+              where possible)
+          workers: (optional) number of processes to use for parsing
+              a named file (default is 1, i.e. parse in the current
+              process); ignored if 'fp' is specified or a non-default
+              'tab_data_line' class is used
         """
         # Initialise
         self.__filen = filen
         self.__ncols = 0
-        self.__header = []
+        self.__column_types = column_types
+        self.__columns = TabColumns()
         self.__delimiter = delimiter
         self.__data = []
+        # Indexes: column key -> {value: [lines]} (None if the
+        # index needs rebuilding), and line number -> position
+        self.__indexes = {}
+        self.__lineno_index = {}
+        # Cache of column arrays: (column key,dtype) -> array
+        self.__arrays = {}
         # Class to use for data lines
         self.__tabdataline = tab_data_line
         # Set up column names
         if column_names is not None:
             self.__setHeader(column_names)
+        elif column_types and not first_line_is_header:
+            self.__columns = TabColumns(types=column_types)
         # Read in data
-        if fp is None and filen is not None:
+        close_fp = False
+        if fp is None and filen is not None and workers > 1 and \
+           issubclass(tab_data_line,TabDataLine):
+            # Parse named file in parallel
+            self.__loadParallel(filen,workers,skip_first_line=skip_first_line,
+                                first_line_is_header=first_line_is_header)
+        elif fp is None and filen is not None:
             # Open named file
             fp = open(self.__filen,'rU')
             close_fp = True
-        else:
-            close_fp = False
         if fp:
             self.__load(fp,skip_first_line=skip_first_line,
                         first_line_is_header=first_line_is_header)
@@ -514,32 +850,99 @@ class TabFile:
           first_line_is_header: (optional) if True then take column
               names from the first line of the file
         """
-        line_no = 0
-        for line in fp:
-            line_no += 1
+        if len(self.header()) > 0:
+            column_names = self.header()
+        else:
+            column_names = None
+        stream = TabFileStream(fp=fp,column_names=column_names,
+                               skip_first_line=skip_first_line,
+                               first_line_is_header=first_line_is_header,
+                               tab_data_line=self.__tabdataline,
+                               delimiter=self.__delimiter,
+                               column_types=self.__column_types)
+        self.__data.extend(stream)
+        self.__columns = stream.columns()
+        self.__ncols = stream.nColumns()
+        self.__invalidateIndexes()
+        self.__buildLineNumberIndex()
+
+    def __loadParallel(self,filen,workers,skip_first_line=False,
+                       first_line_is_header=False):
+        """Load data from a named file using multiple processes
+
+        The data part of the file is split into byte ranges aligned
+        to the ends of lines, and the lines in each range are split
+        into values by a pool of worker processes. The data lines are
+        then created from the values in the original order, with the
+        same line numbers and checks on the number of values in each
+        line as when loading serially (see __load).
+
+        Arguments:
+          filen: name of the file to read data from
+          workers: number of worker processes
+          skip_first_line: (optional) if True then ignore the first
+              line of the input file
+          first_line_is_header: (optional) if True then take column
+              names from the first line of the file
+        """
+        fp = open(filen,'rb')
+        try:
+            # Deal with leading lines
+            nlines = 0
             if skip_first_line:
-                # Skip first line
-                skip_first_line = False
-                continue
-            elif first_line_is_header and len(self.header()) == 0:
-                # Set up header from first line
-                self.__setHeader(line.strip().strip('#').split(self.__delimiter))
-                first_line_is_header = False
-                continue
-            if line.lstrip().startswith('#'):
-                # Skip commented line
-                continue
-            # Store data
-            data_line = self.__tabdataline(line,column_names=self.header(),lineno=line_no,
-                                           delimiter=self.__delimiter)
-            if self.__ncols > 0:
-                if len(data_line) != self.__ncols:
-                    # Inconsistent lines are an error
-                    raise IndexError, "wrong number of data items in line %d" % line_no
+                nlines += 1
+            if first_line_is_header and len(self.header()) == 0:
+                nlines += 1
             else:
-                # Set number of columns
-                self.__ncols = len(data_line)
-            self.__data.append(data_line)
+                first_line_is_header = False
+            leading_lines,start = _read_lines(fp,nlines)
+            line_no = len(leading_lines)
+            if first_line_is_header and len(leading_lines) == nlines:
+                # Set up header from first line
+                self.__setHeader(leading_lines[-1].strip().strip('#').\
+                                 split(self.__delimiter))
+            # Split the rest of the file into chunks
+            size = os.fstat(fp.fileno()).st_size
+            chunk_size = max(PARSE_CHUNK_SIZE,(size-start)/(workers*4)+1)
+            chunks = []
+            while start < size:
+                fp.seek(start+chunk_size)
+                fp.readline()
+                end = min(fp.tell(),size)
+                chunks.append((filen,start,end,self.__delimiter))
+                start = end
+        finally:
+            fp.close()
+        # Parse the chunks
+        if len(chunks) > 1:
+            pool = multiprocessing.Pool(min(workers,len(chunks)))
+            results = pool.imap(_parse_chunk,chunks)
+        else:
+            pool = None
+            results = map(_parse_chunk,chunks)
+        try:
+            for result in results:
+                nlines,records = marshal.loads(result)
+                for offset,values in records:
+                    data_line = self.__tabdataline(values,
+                                                   column_names=self.__columns,
+                                                   lineno=line_no+offset+1,
+                                                   delimiter=self.__delimiter)
+                    if self.__ncols > 0:
+                        if len(data_line) != self.__ncols:
+                            # Inconsistent lines are an error
+                            raise IndexError, "wrong number of data items in line %d" % \
+                                (line_no+offset+1)
+                    else:
+                        # Set number of columns
+                        self.__ncols = len(data_line)
+                    self.__data.append(data_line)
+                line_no += nlines
+        finally:
+            if pool is not None:
+                pool.terminate()
+        self.__invalidateIndexes()
+        self.__buildLineNumberIndex()
 
     def __setHeader(self,column_names):
         """Set the names for columns of data
@@ -548,18 +951,15 @@ class TabFile:
           column_names: a tuple or list with names for each column in order.
         """
         assert(len(self) == 0)
-        if len(self.__header) > 0:
-            self.__header = []
-        for name in column_names:
-            self.__header.append(name)
-        self.__ncols = len(self.__header)
+        self.__columns = TabColumns(column_names,types=self.__column_types)
+        self.__ncols = len(self.__columns)
 
     def header(self):
         """Return list of column names
 
         If no column names were set then this will be an empty list.
         """
-        return self.__header
+        return self.__columns.names
     
     def nColumns(self):
         """Return the number of columns in the file
@@ -575,9 +975,43 @@ class TabFile:
         """
         return self.__filen
     
+    def index(self,key):
+        """Build an index on a column to speed up lookups
+
+        Once a column has been indexed, 'lookup' calls for that
+        column become a dictionary access rather than a search of
+        all the lines, e.g.
+
+        >>> data.index('File')
+        >>> data.lookup('File','sample1')
+
+        The index is kept up to date when lines are added or removed,
+        or when the column is modified via 'transformColumn' or
+        'computeColumn'. If values in the column are changed directly
+        on the lines then 'index' should be called again to rebuild
+        the index.
+
+        Arguments:
+          key: name or index of the column to index on
+        """
+        self.__indexes[key] = self.__buildIndex(key)
+
     def lookup(self,key,value):
         """Return lines where the key matches the specified value
+
+        If an index has been built for the key (see the 'index'
+        method) then this is used to find the lines.
         """
+        if key in self.__indexes:
+            try:
+                index = self.__indexes[key]
+                if index is None:
+                    index = self.__buildIndex(key)
+                    self.__indexes[key] = index
+                return list(index.get(value,[]))
+            except TypeError:
+                # Unhashable value, fall back to searching
+                pass
         result = []
         for line in self.__data:
             if line[key] == value:
@@ -593,10 +1027,175 @@ class TabFile:
 
         If no matching line is found then raises an IndexError.
         """
-        for idx in range(len(self.__data)):
-            if self.__data[idx].lineno() == n:
-                return idx
-        raise IndexError,"No line number %d" % n
+        if self.__lineno_index is None:
+            self.__buildLineNumberIndex()
+        try:
+            return self.__lineno_index[n]
+        except (KeyError,TypeError):
+            raise IndexError,"No line number %d" % n
+
+    def __buildIndex(self,key):
+        """Internal: make an index of the lines for a column
+
+        Returns a dictionary where the keys are the values in the
+        column, and the values are lists of the matching lines in
+        the same order as they appear in the file.
+        """
+        index = {}
+        for line in self.__data:
+            index.setdefault(line[key],[]).append(line)
+        return index
+
+    def __buildLineNumberIndex(self):
+        """Internal: make the index of line numbers to positions
+        """
+        self.__lineno_index = {}
+        for idx in xrange(len(self.__data)):
+            self.__lineno_index.setdefault(self.__data[idx].lineno(),idx)
+
+    def __indexLine(self,line):
+        """Internal: add a line appended to the end of the data to indexes
+        """
+        for key in self.__indexes:
+            if self.__indexes[key] is not None:
+                try:
+                    self.__indexes[key].setdefault(line[key],[]).append(line)
+                except (KeyError,IndexError,TypeError):
+                    # Can't index the line, rebuild when next needed
+                    self.__indexes[key] = None
+        if self.__lineno_index is not None:
+            self.__lineno_index.setdefault(line.lineno(),len(self.__data)-1)
+
+    def __invalidateIndexes(self):
+        """Internal: mark all indexes as needing to be rebuilt
+
+        Called when lines are inserted, removed or reordered, or
+        column values change; the indexes are rebuilt the next time
+        that they're needed. Cached column arrays are also discarded.
+        """
+        for key in self.__indexes:
+            self.__indexes[key] = None
+        self.__lineno_index = None
+        self.__arrays = {}
+
+    def asArray(self,key,dtype=None):
+        """Return the values in a column as a NumPy array
+
+        The array is a copy of the values: changing it doesn't
+        change the data (use 'setColumn' to store values back into
+        the lines). Arrays are cached, so fetching the same column
+        again is cheap unless the data have changed in the meantime
+        (as for 'index', changes made directly to the lines aren't
+        detected).
+
+        Raises ImportError if NumPy isn't available.
+
+        Arguments:
+          key: name or index of the column
+          dtype: (optional) NumPy data type for the array (by default
+            the type is determined from the values)
+
+        Returns:
+          NumPy array with one value for each line.
+        """
+        if numpy is None:
+            raise ImportError, "NumPy is required for column arrays"
+        try:
+            array = self.__arrays[(key,dtype)]
+        except KeyError:
+            array = numpy.array([line[key] for line in self.__data],dtype=dtype)
+            self.__arrays[(key,dtype)] = array
+        except TypeError:
+            # Unhashable key or dtype, don't cache
+            array = numpy.array([line[key] for line in self.__data],dtype=dtype)
+        return array.copy()
+
+    def setColumn(self,key,values):
+        """Store a set of values into a column
+
+        The values are stored in the corresponding lines in order;
+        if the column doesn't exist (and the key isn't an integer
+        index) then a new column is appended first.
+
+        Arguments:
+          key: name or index of the column
+          values: list, tuple or NumPy array of values (which must
+            have the same length as the number of lines)
+        """
+        if len(values) != len(self.__data):
+            raise ValueError, "got %d values for %d lines" % (len(values),
+                                                              len(self.__data))
+        if hasattr(values,'tolist'):
+            # Convert NumPy array to Python values
+            values = values.tolist()
+        if key not in self.header():
+            try:
+                # Check to see if it's actually an integer index
+                key = int(key)
+            except ValueError:
+                # Neither existing column name nor integer index
+                self.appendColumn(key)
+        for line,value in zip(self.__data,values):
+            line[key] = value
+        self.__invalidateIndexes()
+
+    def sortByColumns(self,*keys,**kws):
+        """Sort data on the values in one or more columns
+
+        Performs an in-place sort with the first column as the
+        primary sort key, the second column breaking ties in the
+        first, and so on. Lines with equal values keep their original
+        order.
+
+        If NumPy is available and all the columns are numeric then
+        the sort is done on the column arrays; otherwise the lines
+        are sorted in Python.
+
+        Arguments:
+          keys: names or indices of the columns to sort on
+          reverse: (optional) Boolean, either False (default) to sort
+            in ascending order, or True to sort in descending order
+        """
+        reverse = kws.get('reverse',False)
+        if numpy is not None and keys and len(self.__data) > 0:
+            arrays = [self.asArray(key) for key in keys]
+            if False not in [(a.dtype.kind in 'iuf') for a in arrays]:
+                # numpy.lexsort uses the last array as the primary key
+                arrays.reverse()
+                if not reverse:
+                    order = numpy.lexsort(arrays)
+                else:
+                    # Sort reversed data then reverse the result, so
+                    # equal lines stay in their original order
+                    n = len(self.__data)
+                    order = (n - 1) - numpy.lexsort([a[::-1] for a in arrays])[::-1]
+                self.__data = [self.__data[i] for i in order.tolist()]
+                self.__invalidateIndexes()
+                return
+        self.sort(lambda line: tuple([line[key] for key in keys]),reverse=reverse)
+
+    def filter(self,condition):
+        """Remove lines which don't satisfy a condition
+
+        'condition' can either be a function, which will be invoked
+        with each line and which should return True for lines that
+        are to be kept, or a sequence of boolean values (e.g. a NumPy
+        boolean array) with one value for each line.
+
+        Arguments:
+          condition: function or sequence of booleans
+        """
+        if callable(condition):
+            self.__data = [line for line in self.__data if condition(line)]
+        else:
+            if len(condition) != len(self.__data):
+                raise ValueError, "got %d values for %d lines" % \
+                    (len(condition),len(self.__data))
+            if hasattr(condition,'tolist'):
+                condition = condition.tolist()
+            self.__data = [line for line,keep in zip(self.__data,condition)
+                           if keep]
+        self.__invalidateIndexes()
 
     def append(self,data=None,tabdata=None,tabdataline=None):
         """Create and append a new data line
@@ -622,6 +1221,8 @@ class TabFile:
         """
         if tabdataline:
             self.__data.append(tabdataline)
+            self.__indexLine(tabdataline)
+            self.__arrays = {}
             return tabdataline
         if data:
             line = self.__delimiter.join([str(x) for x in data])
@@ -629,9 +1230,11 @@ class TabFile:
             line = tabdata
         else:
             line = None
-        data_line = self.__tabdataline(line=line,column_names=self.header(),
+        data_line = self.__tabdataline(line=line,column_names=self.__columns,
                                        delimiter=self.__delimiter)
         self.__data.append(data_line)
+        self.__indexLine(data_line)
+        self.__arrays = {}
         return data_line
 
     def insert(self,i,data=None,tabdata=None,tabdataline=None):
@@ -655,6 +1258,7 @@ class TabFile:
         Returns:
           New inserted data line object.
         """
+        self.__invalidateIndexes()
         if tabdataline:
             self.__data.insert(i,tabdataline)
             return tabdataline
@@ -664,20 +1268,32 @@ class TabFile:
             line = tabdata
         else:
             line = None
-        data_line = self.__tabdataline(line=line,column_names=self.header())
+        data_line = self.__tabdataline(line=line,column_names=self.__columns)
         self.__data.insert(i,data_line)
         return data_line
 
     def appendColumn(self,name):
         """Append a new (empty) column
 
+        The column names shared by the data lines are only updated
+        once; lines with their own set of names (e.g. those added via
+        the 'tabdataline' argument of 'append' or 'insert') have the
+        name added individually.
+
         Arguments:
           name: name for the new column
         """
+        self.__columns.append(name)
         for data in self.__data:
-            data.appendColumn(name,'')
-        self.__header.append(name)
-        self.__ncols = len(self.__header)
+            try:
+                shared = (data.columns() is self.__columns)
+            except AttributeError:
+                shared = False
+            if shared:
+                data.append('')
+            else:
+                data.appendColumn(name,'')
+        self.__ncols = len(self.__columns)
 
     def reorderColumns(self,new_columns):
         """Rearrange the columns in the file
@@ -727,6 +1343,7 @@ class TabFile:
         """
         for line in self:
             line[column_name] = transform_func(line[column_name])
+        self.__invalidateIndexes()
 
     def computeColumn(self,column_name,compute_func):
         """Compute and store values in a new column
@@ -750,6 +1367,7 @@ class TabFile:
                 self.appendColumn(column_name)
         for line in self:
             line[column_name] = compute_func(line)
+        self.__invalidateIndexes()
 
     def sort(self,sort_func,reverse=False):
         """Sort data using arbitrary function
@@ -772,6 +1390,7 @@ class TabFile:
             in ascending order, or True to sort in descending order
         """
         self.__data = sorted(self.__data,key=sort_func,reverse=reverse)
+        self.__invalidateIndexes()
 
     def write(self,filen=None,fp=None,include_header=False,no_hash=False,
               delimiter=None):
@@ -781,8 +1400,9 @@ class TabFile:
         specifying the file name or stream to write the TabFile data to.
 
         Arguments:
-          filen: (optional) name of file to write to; ignored if fp is
-            also specified
+          filen: (optional) name of file to write to (which will be
+            gzip-compressed if the name ends with '.gz'); ignored if fp
+            is also specified
           fp: (optional) a file-like object opened for writing; used in
             preference to filen if set to a non-null value
               Note that the calling program must close the stream in
@@ -795,39 +1415,19 @@ class TabFile:
           delimiter: (optional) delimiter to use when writing data values
             to file (defaults to the delimiter specified on input)
         """
-        if fp is None and filen is not None:
-            # Open named file for writing
-            fp = open(filen,'w')
-            close_fp = True
-        else:
-            close_fp = False
+        writer = TabFileWriter(filen=filen,fp=fp,delimiter=delimiter)
         if include_header:
-            if not no_hash:
-                leading_hash = '#'
-            else:
-                leading_hash = ''
-            if delimiter is None:
-                delim = self.__delimiter
-            else:
-                delim = str(delimiter)
-            fp.write("%s%s\n" % (leading_hash,delim.join(self.header())))
-        # Update line delimiters for output if necessary
-        if delimiter is not None and delimiter != self.__delimiter:
-            for data in self.__data: data.delimiter(delimiter)
-        # Write the data
-        for data in self.__data:
-            fp.write("%s\n" % data)
-        # Reset line delimiters        
-        if delimiter is not None and delimiter != self.__delimiter:
-            for data in self.__data: data.delimiter(self.__delimiter)
-        # Only close the stream if it was opened locally
-        if close_fp: fp.close()
+            writer.writeHeader(self.header(),no_hash=no_hash,
+                               delimiter=(delimiter or self.__delimiter))
+        writer.writelines(self.__data)
+        writer.close()
 
     def __getitem__(self,key):
         return self.__data[key]
 
     def __delitem__(self,key):
         del(self.__data[key])
+        self.__invalidateIndexes()
 
     def __len__(self):
         return len(self.__data)
@@ -835,6 +1435,493 @@ class TabFile:
     def __repr__(self):
         return '\n'.join([str(x) for x in self.__data])
 
+def _read_lines(fp,nlines):
+    """Internal: read leading lines from a file opened in binary mode
+
+    Lines can end with any of '\\n', '\\r\\n' or '\\r' (as when
+    reading with universal newlines).
+
+    Arguments:
+      fp: file object opened in binary mode
+      nlines: number of lines to read
+
+    Returns:
+      Tuple (lines,offset) where 'lines' is a list of up to 'nlines'
+      lines (including line endings) and 'offset' is the position in
+      the file immediately after the last line.
+    """
+    if nlines == 0:
+        return ([],fp.tell())
+    start = fp.tell()
+    data = ''
+    while True:
+        block = fp.read(65536)
+        data += block
+        lines = data.splitlines(True)
+        if len(lines) > nlines or not block:
+            break
+    lines = lines[:nlines]
+    return (lines,start+sum([len(line) for line in lines]))
+
+def _parse_chunk(args):
+    """Internal: split the lines in a byte range of a file into values
+
+    Arguments are passed as a single tuple (filen,start,end,delimiter)
+    so that the function can be used with a multiprocessing pool.
+
+    Returns:
+      Tuple (nlines,records) serialised using the marshal module
+      (which is much faster than pickling for large lists of
+      strings), where 'nlines' is the total number of lines in the
+      range, and 'records' is a list of (offset,values) tuples for
+      each non-comment line (where 'offset' is the index of the line
+      within the range, and 'values' is the list of values).
+    """
+    filen,start,end,delimiter = args
+    fp = open(filen,'rb')
+    try:
+        fp.seek(start)
+        lines = fp.read(end-start).splitlines()
+    finally:
+        fp.close()
+    records = []
+    for i,line in enumerate(lines):
+        if line.lstrip().startswith('#'):
+            # Skip commented line
+            continue
+        records.append((i,line.split(delimiter)))
+    return marshal.dumps((len(lines),records))
+
+class TabFileWriter:
+    """Class for writing lines of tab-delimited data to a file
+
+    Lines are formatted and collected in a buffer which is written
+    out in large blocks. Files with names ending in '.gz' are written
+    gzip-compressed.
+
+    Example usage:
+
+        writer = TabFileWriter('data.txt.gz')
+        writer.writeHeader(('chr','start','end'))
+        for line in TabFileStream('input.txt'):
+            writer.write(line)
+        writer.close()
+
+    Lines can be TabDataLine-like objects, strings (which are written
+    as they are), or sequences of values (which are joined using the
+    delimiter).
+    """
+    def __init__(self,filen=None,fp=None,delimiter=None,compresslevel=6,
+                 bufsize=WRITE_BUFFER_SIZE):
+        """Create a new TabFileWriter
+
+        One of either the 'filen' or 'fp' arguments must be given.
+
+        Arguments:
+          filen: (optional) name of file to write to (gzip-compressed
+            if the name ends with '.gz'); ignored if fp is also
+            specified
+          fp: (optional) a file-like object opened for writing; used
+            in preference to filen. Note that the calling program must
+            close the stream in this case.
+          delimiter: (optional) delimiter to use when writing values
+            (defaults to the delimiter of each line, or tab for
+            sequences of values)
+          compresslevel: (optional) compression level for gzipped
+            output (default 6)
+          bufsize: (optional) number of bytes to collect before writing
+            them out (default WRITE_BUFFER_SIZE)
+        """
+        if fp is None:
+            if filen.endswith('.gz'):
+                fp = gzip.GzipFile(filen,'wb',compresslevel)
+            else:
+                fp = open(filen,'wb')
+            self.__close_fp = True
+        else:
+            self.__close_fp = False
+        self.__fp = fp
+        if delimiter is not None:
+            delimiter = str(delimiter)
+        self.__delimiter = delimiter
+        self.__bufsize = bufsize
+        self.__buffer = []
+        self.__size = 0
+        self.__nlines = 0
+
+    def writeHeader(self,names,no_hash=False,delimiter=None):
+        """Write a header line
+
+        Arguments:
+          names: list of column names
+          no_hash: (optional) if set to True then don't put a hash
+            character '#' at the start of the header line
+          delimiter: (optional) delimiter to use between the names
+            (defaults to the writer's delimiter, or tab)
+        """
+        if delimiter is None:
+            delimiter = self.__delimiter or '\t'
+        if not no_hash:
+            leading_hash = '#'
+        else:
+            leading_hash = ''
+        self.__add("%s%s\n" % (leading_hash,str(delimiter).join(names)))
+
+    def write(self,line):
+        """Write a line of data
+
+        Arguments:
+          line: a TabDataLine-like object, a string, or a sequence of
+            values
+        """
+        try:
+            text = line.formatted(self.__delimiter)
+        except AttributeError:
+            if isinstance(line,basestring):
+                text = line.rstrip('\n')
+            else:
+                text = (self.__delimiter or '\t').join(map(str,line))
+        self.__add(text+'\n')
+        self.__nlines += 1
+
+    def writelines(self,lines):
+        """Write multiple lines of data
+
+        Arguments:
+          lines: iterable (e.g. a TabFile or TabFileStream) supplying
+            lines to write
+        """
+        for line in lines:
+            self.write(line)
+
+    def nlines(self):
+        """Return the number of data lines written so far
+        """
+        return self.__nlines
+
+    def flush(self):
+        """Write out any buffered data
+        """
+        if self.__buffer:
+            self.__fp.write(''.join(self.__buffer))
+            self.__buffer = []
+            self.__size = 0
+
+    def close(self):
+        """Write out any buffered data and close the file
+
+        The file is only closed if it was opened by the writer.
+        """
+        self.flush()
+        if self.__close_fp:
+            self.__fp.close()
+            self.__close_fp = False
+
+    def __add(self,text):
+        """Internal: add text to the buffer, writing out if full
+        """
+        self.__buffer.append(text)
+        self.__size += len(text)
+        if self.__size >= self.__bufsize:
+            self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+class TabFileStream:
+    """Class to iterate over data in a tab-delimited file
+
+    Reads data lines from a file one at a time as they are needed,
+    rather than loading the whole file into memory as TabFile does,
+    so arbitrarily large files can be processed in constant memory.
+
+    The same rules as TabFile are used for the header, comment lines
+    and delimiters, and data lines are represented by TabDataLine-like
+    objects.
+
+    Example usage:
+
+        stream = TabFileStream(myfile,first_line_is_header=True)
+        print '%s' % stream.header()
+        for line in stream:
+            ...
+
+    Operations can also be chained together into a pipeline which is
+    applied as the lines are read, e.g.
+
+        TabFileStream(myfile,first_line_is_header=True).\
+            filter(lambda line: line['chr'] == 'chr1').\
+            transformColumn('start',lambda x: x+1).\
+            computeColumn('length',lambda line: line['end']-line['start']).\
+            write('chr1.txt',include_header=True)
+
+    Note that the lines can only be iterated over once.
+    """
+    def __init__(self,filen=None,fp=None,column_names=None,skip_first_line=False,
+                 first_line_is_header=False,tab_data_line=TabDataLine,
+                 delimiter='\t',column_types=None):
+        """Create a new TabFileStream object
+
+        The arguments are the same as for TabFile. If 'first_line_is_header'
+        is set then the header is read when the object is created.
+
+        Arguments:
+          filen (optional): name of tab-delimited file to read data
+              from; ignored if fp is also specified
+          fp: (optional) a file-like object which data can be read
+              from like a file; used in preference to filen.
+              Note that the calling program must close the stream in
+              these cases.
+          column_names: (optional) list of column names to assign to
+              columns in the file. Overrides column names in the file
+          skip_first_line: (optional) if True then ignore the first
+              line of the input file
+          first_line_is_header: (optional) if True then takes column
+              names from the first line of the file
+          tab_data_line: (optional) class to use for creating data
+              line objects (defaults to TabDataLine).
+          delimiter: (optional) delimiter character (defaults to tab)
+          column_types: (optional) dictionary mapping column names
+              or indices to the type (or function) used to convert
+              values read from the file
+        """
+        self.__filen = filen
+        self.__delimiter = delimiter
+        self.__tabdataline = tab_data_line
+        self.__line_no = 0
+        # Set up column names
+        if column_names is not None:
+            self.__columns = TabColumns(column_names,types=column_types)
+        elif column_types and not first_line_is_header:
+            self.__columns = TabColumns(types=column_types)
+        else:
+            self.__columns = TabColumns()
+        self.__ncols = len(self.__columns)
+        # Names of columns added by computeColumn
+        self.__new_columns = []
+        # Open the input
+        if fp is None and filen is not None:
+            # Open named file
+            fp = open(self.__filen,'rU')
+            self.__close_fp = True
+        else:
+            self.__close_fp = False
+        self.__fp = fp
+        if fp is not None:
+            self.__input = iter(fp)
+        else:
+            self.__input = iter([])
+        # Deal with leading lines
+        if skip_first_line:
+            self.__next_input_line()
+        if first_line_is_header and len(self.__columns) == 0:
+            # Set up header from first line
+            line = self.__next_input_line()
+            if line is not None:
+                self.__columns = TabColumns(
+                    line.strip().strip('#').split(self.__delimiter),
+                    types=column_types)
+                self.__ncols = len(self.__columns)
+        # Lines from the pipeline
+        self.__lines = self.__read()
+
+    def __next_input_line(self):
+        """Internal: fetch the next line from the input (or None)
+        """
+        try:
+            line = self.__input.next()
+        except StopIteration:
+            return None
+        self.__line_no += 1
+        return line
+
+    def __read(self):
+        """Internal: generator yielding data lines from the input
+        """
+        try:
+            for line in self.__input:
+                self.__line_no += 1
+                if line.lstrip().startswith('#'):
+                    # Skip commented line
+                    continue
+                data_line = self.__tabdataline(line,column_names=self.__columns,
+                                               lineno=self.__line_no,
+                                               delimiter=self.__delimiter)
+                if self.__ncols > 0:
+                    if len(data_line) != self.__ncols:
+                        # Inconsistent lines are an error
+                        raise IndexError, "wrong number of data items in line %d" % \
+                            self.__line_no
+                else:
+                    # Set number of columns
+                    self.__ncols = len(data_line)
+                yield data_line
+        finally:
+            self.close()
+
+    def close(self):
+        """Close the input file
+
+        The input is only closed if it was opened by the object (i.e.
+        if it was specified via the 'filen' argument); this happens
+        automatically once all the lines have been read.
+        """
+        if self.__close_fp and not self.__fp.closed:
+            self.__fp.close()
+
+    def header(self):
+        """Return list of column names
+
+        This includes any new columns added by 'computeColumn'. If no
+        column names were set then this will be an empty list.
+        """
+        return self.__columns.names + self.__new_columns
+
+    def columns(self):
+        """Return the TabColumns object shared by the lines read in
+        """
+        return self.__columns
+
+    def nColumns(self):
+        """Return the number of columns in the file
+
+        If the file had a header then this will be the number of
+        header columns; otherwise it will be the number of columns
+        found in the first line of data (zero if no lines have
+        been read yet).
+        """
+        return self.__ncols
+
+    def filename(self):
+        """Return the file name associated with the TabFileStream
+        """
+        return self.__filen
+
+    def filter(self,filter_func):
+        """Only pass on lines for which a function returns True
+
+        Arguments:
+          filter_func: callable object that will be invoked with each
+            data line object, and which should return True for lines
+            that are to be kept
+
+        Returns:
+          The TabFileStream object (so operations can be chained).
+        """
+        self.__lines = (line for line in self.__lines if filter_func(line))
+        return self
+
+    def transformColumn(self,column_name,transform_func):
+        """Apply arbitrary function to a column
+
+        Like TabFile.transformColumn except that the transformation is
+        performed on each line as it is read.
+
+        Arguments:
+          column_name: name of column to write transformation result to
+          transform_func: callable object that will be invoked to perform
+            the transformation
+
+        Returns:
+          The TabFileStream object (so operations can be chained).
+        """
+        def transform(lines):
+            for line in lines:
+                line[column_name] = transform_func(line[column_name])
+                yield line
+        self.__lines = transform(self.__lines)
+        return self
+
+    def computeColumn(self,column_name,compute_func):
+        """Compute and store values in a column
+
+        Like TabFile.computeColumn except that the computation is
+        performed on each line as it is read. If the column doesn't
+        already exist then it is added to the end of each line (the
+        extended set of column names is created once and shared by
+        the output lines).
+
+        Arguments:
+          column_name: name or index of column to write computation
+             result to
+          compute_func: callable object that will be invoked to perform
+            the computation
+
+        Returns:
+          The TabFileStream object (so operations can be chained).
+        """
+        new_column = False
+        if column_name not in self.header():
+            try:
+                # Check to see if it's actually an integer index
+                column_name = int(column_name)
+            except ValueError:
+                # Neither existing column name nor integer index
+                new_column = True
+                self.__new_columns.append(column_name)
+        def compute(lines):
+            # Column names for the output lines, extended from the
+            # names shared by the input lines
+            input_columns = None
+            output_columns = None
+            for line in lines:
+                if not new_column:
+                    line[column_name] = compute_func(line)
+                    yield line
+                    continue
+                value = compute_func(line)
+                try:
+                    columns = line.columns()
+                except AttributeError:
+                    # Line doesn't expose its column names
+                    line.appendColumn(column_name,value)
+                    yield line
+                    continue
+                if columns is not input_columns:
+                    input_columns = columns
+                    output_columns = columns.copy()
+                    output_columns.append(column_name)
+                line.appendColumn(column_name,value,columns=output_columns)
+                yield line
+        self.__lines = compute(self.__lines)
+        return self
+
+    def write(self,filen=None,fp=None,include_header=False,no_hash=False,
+              delimiter=None):
+        """Write the data lines to an output file
+
+        Reads all the remaining lines from the pipeline and writes
+        them out; the arguments are the same as for TabFile.write.
+
+        Arguments:
+          filen: (optional) name of file to write to (which will be
+            gzip-compressed if the name ends with '.gz'); ignored if fp
+            is also specified
+          fp: (optional) a file-like object opened for writing; used in
+            preference to filen if set to a non-null value
+              Note that the calling program must close the stream in
+              these cases.
+          include_header: (optional) if set to True, the first
+            line will be a 'header' line
+          no_hash: (optional) if set to True and include_header is
+            also True then don't put a hash character '#' at the
+            start of the header line in the output file.
+          delimiter: (optional) delimiter to use when writing data values
+            to file (defaults to the delimiter specified on input)
+        """
+        writer = TabFileWriter(filen=filen,fp=fp,delimiter=delimiter)
+        if include_header:
+            writer.writeHeader(self.header(),no_hash=no_hash,
+                               delimiter=(delimiter or self.__delimiter))
+        writer.writelines(self)
+        writer.close()
+
+    def __iter__(self):
+        return self.__lines
+
 ########################################################################
 #
 # Tests
@@ -843,6 +1930,8 @@ class TabFile:
 
 import unittest
 import cStringIO
+import tempfile
+import shutil
 
 class TestTabFile(unittest.TestCase):
 
@@ -1034,6 +2123,107 @@ chr2\t1234\t5678\t6.8
         self.assertEqual(tabfile.header()[4],'new')
         self.assertEqual(tabfile[0]['new'],'')
 
+    def test_append_column_mixed_lines(self):
+        """Append new column to a Tabfile with an externally created line
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        tabfile.append(tabdataline=TabDataLine('chr3\t1\t2\t3',
+                                               ('chr','start','end','data')))
+        tabfile.appendColumn('new')
+        self.assertEqual(tabfile.header(),['chr','start','end','data','new'])
+        for line in tabfile:
+            self.assertEqual(len(line),5)
+            self.assertEqual(line['new'],'')
+            self.assertEqual(line.names,['chr','start','end','data','new'])
+
+    def test_lines_share_column_names(self):
+        """Lines in a TabFile share a single set of column names
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        line = tabfile.append(data=['chr3',1,2,3])
+        for data in tabfile:
+            self.assertTrue(data.columns() is line.columns())
+            self.assertTrue(data.names is tabfile.header())
+            self.assertEqual(data['chr'],data[0])
+
+class TestTabFileIndexes(unittest.TestCase):
+    """Test the index, lookup and indexByLineNumber methods
+    """
+
+    def setUp(self):
+        # Make file-like object to read data in
+        self.fp = cStringIO.StringIO(
+"""#chr\tstart\tend\tdata
+chr1\t1\t234\t4.6
+chr2\t567\t890\t5.7
+# Comment
+chr1\t1234\t5678\t6.8
+""")
+
+    def tearDown(self):
+        # Close the open file-like input
+        self.fp.close()
+
+    def test_lookup_without_index(self):
+        """Look up lines using a column with no index
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        lines = tabfile.lookup('chr','chr1')
+        self.assertEqual([line['start'] for line in lines],[1,1234])
+        self.assertEqual(tabfile.lookup('chr','chr3'),[])
+
+    def test_lookup_with_index(self):
+        """Look up lines using an indexed column
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        tabfile.index('chr')
+        lines = tabfile.lookup('chr','chr1')
+        self.assertEqual([line['start'] for line in lines],[1,1234])
+        self.assertEqual(tabfile.lookup('chr','chr3'),[])
+        # Modifying the result doesn't affect the index
+        lines.pop()
+        self.assertEqual(len(tabfile.lookup('chr','chr1')),2)
+
+    def test_index_append_insert_delete(self):
+        """Indexes stay correct when lines are appended, inserted and deleted
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        tabfile.index('chr')
+        tabfile.append(data=('chr3',10,20,1.0))
+        self.assertEqual([line['start'] for line in tabfile.lookup('chr','chr3')],
+                         [10])
+        tabfile.insert(0,data=('chr1',5,6,0.1))
+        self.assertEqual([line['start'] for line in tabfile.lookup('chr','chr1')],
+                         [5,1,1234])
+        del(tabfile[1])
+        self.assertEqual([line['start'] for line in tabfile.lookup('chr','chr1')],
+                         [5,1234])
+
+    def test_index_after_transform_and_sort(self):
+        """Indexes stay correct when columns are transformed or lines sorted
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        tabfile.index('chr')
+        tabfile.transformColumn('chr',lambda x: x.upper())
+        self.assertEqual(tabfile.lookup('chr','chr1'),[])
+        self.assertEqual(len(tabfile.lookup('chr','CHR1')),2)
+        tabfile.sort(lambda line: line['start'],reverse=True)
+        self.assertEqual([line['start'] for line in tabfile.lookup('chr','CHR1')],
+                         [1234,1])
+
+    def test_index_by_line_number(self):
+        """Look up positions of lines from their line numbers
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        self.assertEqual(tabfile.indexByLineNumber(2),0)
+        self.assertEqual(tabfile.indexByLineNumber(5),2)
+        self.assertRaises(IndexError,tabfile.indexByLineNumber,4)
+        del(tabfile[0])
+        self.assertEqual(tabfile.indexByLineNumber(5),1)
+        self.assertRaises(IndexError,tabfile.indexByLineNumber,2)
+        tabfile.insert(0,data=('chr1',5,6,0.1))
+        self.assertEqual(tabfile.indexByLineNumber(3),1)
+
 class TestWhiteSpaceHandlingTabFile(unittest.TestCase):
 
     def setUp(self):
@@ -1398,6 +2588,96 @@ chr2\t1234\t5678\t6.8
         for i in range(len(tabfile)):
             self.assertEqual(tabfile[i]['data'],results[i])
 
+class TestTabFileColumnArrays(unittest.TestCase):
+    """Test the asArray, setColumn, sortByColumns and filter methods
+    """
+
+    def setUp(self):
+        # Make file-like object to read data in
+        self.fp = cStringIO.StringIO(
+"""#chr\tstart\tend\tdata
+chr2\t1234\t5678\t6.8
+chr1\t567\t890\t5.7
+chr1\t1\t234\t4.6
+chr2\t1\t20\t6.8
+""")
+
+    def tearDown(self):
+        # Close the open file-like input
+        self.fp.close()
+
+    @unittest.skipIf(numpy is None,"NumPy not available")
+    def test_as_array(self):
+        """Fetch column values as a NumPy array
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        start = tabfile.asArray('start')
+        self.assertEqual(start.tolist(),[1234,567,1,1])
+        self.assertEqual(tabfile.asArray('data',dtype=float).tolist(),
+                         [6.8,5.7,4.6,6.8])
+        # Changing the array doesn't change the data
+        start[0] = 0
+        self.assertEqual(tabfile[0]['start'],1234)
+        self.assertEqual(tabfile.asArray('start').tolist(),[1234,567,1,1])
+
+    @unittest.skipIf(numpy is None,"NumPy not available")
+    def test_column_arithmetic(self):
+        """Compute a new column from arrays
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        tabfile.setColumn('length',tabfile.asArray('end')-tabfile.asArray('start'))
+        self.assertEqual(tabfile.header(),['chr','start','end','data','length'])
+        self.assertEqual(str(tabfile[1]),"chr1\t567\t890\t5.7\t323")
+        self.assertEqual(tabfile.asArray('length').tolist(),[4444,323,233,19])
+        tabfile.filter(tabfile.asArray('length') > 300)
+        self.assertEqual(len(tabfile),2)
+
+    @unittest.skipIf(numpy is not None,"NumPy is available")
+    def test_as_array_no_numpy(self):
+        """asArray raises ImportError if NumPy isn't available
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        self.assertRaises(ImportError,tabfile.asArray,'start')
+
+    def test_set_column(self):
+        """Store a list of values into new and existing columns
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        tabfile.setColumn('data',[1,2,3,4])
+        tabfile.setColumn('strand',['+','-','+','-'])
+        self.assertEqual(str(tabfile[3]),"chr2\t1\t20\t4\t-")
+        self.assertRaises(ValueError,tabfile.setColumn,'data',[1,2])
+
+    def test_sort_by_columns(self):
+        """Sort on multiple columns
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        tabfile.sortByColumns('start','end')
+        self.assertEqual([line.lineno() for line in tabfile],[5,4,3,2])
+        tabfile.sortByColumns('data','start',reverse=True)
+        self.assertEqual([line.lineno() for line in tabfile],[2,5,3,4])
+        tabfile.sortByColumns('chr')
+        self.assertEqual([line.lineno() for line in tabfile],[3,4,2,5])
+
+    def test_sort_by_columns_stable(self):
+        """Sorting keeps lines with equal values in their original order
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        tabfile.sortByColumns('data')
+        self.assertEqual([line.lineno() for line in tabfile],[4,3,2,5])
+        tabfile.sortByColumns('data',reverse=True)
+        self.assertEqual([line.lineno() for line in tabfile],[2,5,3,4])
+
+    def test_filter(self):
+        """Filter lines with a function or a list of booleans
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        tabfile.filter(lambda line: line['chr'] == 'chr2')
+        self.assertEqual([line.lineno() for line in tabfile],[2,5])
+        tabfile.filter([False,True])
+        self.assertEqual([line.lineno() for line in tabfile],[5])
+        self.assertRaises(ValueError,tabfile.filter,[True,True])
+
 class TestSortTabFile(unittest.TestCase):
 
     def setUp(self):
@@ -1431,6 +2711,266 @@ chr2\t1234\t5678\t3.4
         for i in range(len(tabfile)):
             self.assertEqual(tabfile[i]['data'],sorted_data[i])
         
+class TestTabFileStream(unittest.TestCase):
+
+    def setUp(self):
+        # Make file-like object to read data in
+        self.fp = cStringIO.StringIO(
+"""#chr\tstart\tend\tdata
+chr1\t1\t234\t4.6
+# Comment line
+chr1\t567\t890\t5.7
+chr2\t1234\t5678\t6.8
+""")
+
+    def tearDown(self):
+        # Close the open file-like input
+        self.fp.close()
+
+    def test_iterate_over_lines(self):
+        """Iterate over lines read from a TabFileStream
+        """
+        stream = TabFileStream('test',self.fp,first_line_is_header=True)
+        self.assertEqual(stream.header(),['chr','start','end','data'])
+        lines = [line for line in stream]
+        self.assertEqual(len(lines),3)
+        self.assertEqual(lines[0]['start'],1)
+        self.assertEqual(lines[2]['chr'],'chr2')
+        self.assertEqual(lines[1].lineno(),4)
+        self.assertEqual(stream.nColumns(),4)
+        # Lines can only be read once
+        self.assertEqual([line for line in stream],[])
+
+    def test_lines_match_tabfile(self):
+        """Lines from TabFileStream are the same as from TabFile
+        """
+        stream_lines = [str(line) for line in
+                        TabFileStream(fp=self.fp,skip_first_line=True)]
+        self.fp.seek(0)
+        tabfile = TabFile(fp=self.fp,skip_first_line=True)
+        self.assertEqual(stream_lines,[str(line) for line in tabfile])
+
+    def test_ragged_input(self):
+        """TabFileStream raises IndexError for inconsistent lines
+        """
+        fp = cStringIO.StringIO("chr1\t1\t234\nchr1\t567\n")
+        stream = TabFileStream(fp=fp)
+        self.assertRaises(IndexError,list,stream)
+
+    def test_pipeline(self):
+        """Filter, transform and compute lines in a pipeline
+        """
+        stream = TabFileStream(fp=self.fp,first_line_is_header=True).\
+            filter(lambda line: line['chr'] == 'chr1').\
+            transformColumn('start',lambda x: x+1).\
+            computeColumn('length',lambda line: line['end']-line['start'])
+        self.assertEqual(stream.header(),['chr','start','end','data','length'])
+        lines = list(stream)
+        self.assertEqual(len(lines),2)
+        self.assertEqual(str(lines[0]),"chr1\t2\t234\t4.6\t232")
+        self.assertEqual(str(lines[1]),"chr1\t568\t890\t5.7\t322")
+        self.assertEqual(lines[1]['length'],322)
+
+    def test_compute_column_shares_names(self):
+        """Lines with a computed column share the new column names
+        """
+        stream = TabFileStream(fp=self.fp,first_line_is_header=True)
+        input_columns = stream.columns()
+        stream.computeColumn('length',lambda line: line['end']-line['start']).\
+            computeColumn('mid',lambda line: line['start']+line['length']/2)
+        lines = list(stream)
+        self.assertEqual(len(lines),3)
+        self.assertTrue(lines[0].columns() is lines[1].columns())
+        self.assertTrue(lines[0].columns() is lines[2].columns())
+        self.assertEqual(lines[0].names,
+                         ['chr','start','end','data','length','mid'])
+        self.assertEqual(str(lines[2]),"chr2\t1234\t5678\t6.8\t4444\t3456")
+        self.assertEqual(lines[2]['mid'],3456)
+        # Input names are unchanged
+        self.assertEqual(input_columns.names,['chr','start','end','data'])
+
+    def test_write(self):
+        """Write the output of a pipeline
+        """
+        fp = cStringIO.StringIO()
+        TabFileStream(fp=self.fp,first_line_is_header=True).\
+            filter(lambda line: line['start'] > 1).\
+            write(fp=fp,include_header=True,delimiter=',')
+        self.assertEqual(fp.getvalue(),
+                         "#chr,start,end,data\n"
+                         "chr1,567,890,5.7\n"
+                         "chr2,1234,5678,6.8\n")
+        fp.close()
+
+class TestTabFileParallelLoad(unittest.TestCase):
+    """Test loading TabFiles using multiple processes
+    """
+
+    def setUp(self):
+        # Temporary working directory
+        self.wd = tempfile.mkdtemp()
+        self.filen = os.path.join(self.wd,'data.txt')
+        # Use small chunks so the test data is split up
+        self.chunk_size = PARSE_CHUNK_SIZE
+        globals()['PARSE_CHUNK_SIZE'] = 64
+
+    def tearDown(self):
+        globals()['PARSE_CHUNK_SIZE'] = self.chunk_size
+        shutil.rmtree(self.wd)
+
+    def write_data(self,text):
+        fp = open(self.filen,'wb')
+        fp.write(text)
+        fp.close()
+
+    def assertSameData(self,tabfile1,tabfile2):
+        self.assertEqual(tabfile1.header(),tabfile2.header())
+        self.assertEqual(tabfile1.nColumns(),tabfile2.nColumns())
+        self.assertEqual(len(tabfile1),len(tabfile2))
+        for line1,line2 in zip(tabfile1,tabfile2):
+            self.assertEqual(str(line1),str(line2))
+            self.assertEqual(line1.lineno(),line2.lineno())
+            self.assertEqual(line1.names,line2.names)
+
+    def test_parallel_load(self):
+        """Parallel loading gives the same data as serial loading
+        """
+        text = ["#chr\tstart\tend\tdata\n"]
+        for i in xrange(200):
+            if i%17 == 0:
+                text.append("# Comment %d\n" % i)
+            text.append("chr%d\t%d\t%d\t%.1f\n" % (i%3,i,i*10,i/10.0))
+        self.write_data(''.join(text))
+        for kws in ({},
+                    {'first_line_is_header': True},
+                    {'skip_first_line': True},
+                    {'column_names': ('a','b','c','d'),
+                     'skip_first_line': True}):
+            serial = TabFile(self.filen,**kws)
+            parallel = TabFile(self.filen,workers=4,**kws)
+            self.assertSameData(serial,parallel)
+        self.assertEqual(parallel[0]['b'],0)
+        self.assertEqual(parallel.indexByLineNumber(30),26)
+
+    def test_parallel_load_line_endings(self):
+        """Parallel loading handles DOS and Mac line endings
+        """
+        for eol in ('\r\n','\r'):
+            text = ["chr\tstart\tend"]
+            for i in xrange(50):
+                text.append("chr1\t%d\t%d" % (i,i+10))
+            self.write_data(eol.join(text)+eol)
+            serial = TabFile(self.filen,first_line_is_header=True)
+            parallel = TabFile(self.filen,first_line_is_header=True,
+                               workers=2)
+            self.assertSameData(serial,parallel)
+            self.assertEqual(len(parallel),50)
+
+    def test_parallel_load_ragged_input(self):
+        """Parallel loading reports inconsistent lines like serial loading
+        """
+        text = ["chr1\t%d\t%d\n" % (i,i+10) for i in xrange(100)]
+        text[57] = "chr1\t570\n"
+        text[80] = "chr1\n"
+        self.write_data(''.join(text))
+        for workers in (1,4):
+            try:
+                TabFile(self.filen,workers=workers)
+                self.fail("IndexError not raised")
+            except IndexError,ex:
+                self.assertEqual(str(ex),"wrong number of data items in line 58")
+
+    def test_parallel_load_empty_file(self):
+        """Parallel loading of an empty file
+        """
+        self.write_data('')
+        tabfile = TabFile(self.filen,first_line_is_header=True,workers=2)
+        self.assertEqual(len(tabfile),0)
+        self.assertEqual(tabfile.header(),[])
+
+class TestTabFileWriter(unittest.TestCase):
+    """Test writing data using TabFileWriter
+    """
+
+    def setUp(self):
+        # Temporary working directory
+        self.wd = tempfile.mkdtemp()
+        # Make file-like object to read data in
+        self.fp = cStringIO.StringIO(
+"""#chr\tstart\tend\tdata
+chr1\t01\t234\t4.60
+chr1\t567\t890\t5.7
+chr2\t1234\t5678\t6.8
+""")
+
+    def tearDown(self):
+        # Close the open file-like input
+        self.fp.close()
+        shutil.rmtree(self.wd)
+
+    def test_write_lines(self):
+        """Write lines, strings and sequences of values
+        """
+        fp = cStringIO.StringIO()
+        writer = TabFileWriter(fp=fp)
+        writer.writeHeader(('chr','start','end'))
+        writer.write(TabDataLine("chr1\t1\t2"))
+        writer.write("chr2\t3\t4\n")
+        writer.write(('chr3',5,6))
+        writer.close()
+        self.assertEqual(writer.nlines(),3)
+        self.assertEqual(fp.getvalue(),
+                         "#chr\tstart\tend\n"
+                         "chr1\t1\t2\n"
+                         "chr2\t3\t4\n"
+                         "chr3\t5\t6\n")
+        fp.close()
+
+    def test_write_with_small_buffer(self):
+        """Output is the same regardless of the buffer size
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        fp = cStringIO.StringIO()
+        writer = TabFileWriter(fp=fp,delimiter=',',bufsize=10)
+        writer.writelines(tabfile)
+        # Some data has been written before closing
+        self.assertNotEqual(fp.getvalue(),'')
+        writer.close()
+        self.assertEqual(fp.getvalue(),
+                         "chr1,1,234,4.6\n"
+                         "chr1,567,890,5.7\n"
+                         "chr2,1234,5678,6.8\n")
+        # Line delimiters are unchanged
+        self.assertEqual(str(tabfile[0]),"chr1\t1\t234\t4.6")
+
+    def test_write_gzipped_tabfile(self):
+        """Write a TabFile to a gzipped file
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True)
+        filen = os.path.join(self.wd,'out.txt.gz')
+        tabfile.write(filen,include_header=True)
+        self.assertEqual(gzip.open(filen).read(),
+                         "#chr\tstart\tend\tdata\n"
+                         "chr1\t1\t234\t4.6\n"
+                         "chr1\t567\t890\t5.7\n"
+                         "chr2\t1234\t5678\t6.8\n")
+
+    def test_write_stream_incrementally(self):
+        """Write lines from a TabFileStream as they are read
+        """
+        filen = os.path.join(self.wd,'out.txt.gz')
+        stream = TabFileStream(fp=self.fp,first_line_is_header=True)
+        writer = TabFileWriter(filen)
+        writer.writeHeader(stream.header(),no_hash=True)
+        for line in stream:
+            if line['chr'] == 'chr1':
+                writer.write(line)
+        writer.close()
+        self.assertEqual(gzip.open(filen).read(),
+                         "chr\tstart\tend\tdata\n"
+                         "chr1\t1\t234\t4.6\n"
+                         "chr1\t567\t890\t5.7\n")
+
 class TestTabDataLine(unittest.TestCase):
 
     def test_new_line_no_data(self):
@@ -1530,6 +3070,28 @@ class TestTabDataLine(unittest.TestCase):
         self.assertEqual(len(subset),2,"Subset should have 2 items")
         self.assertEqual(str(subset),"3.3\t4.4","String representation should be last two columns")
 
+    def test_shared_column_names(self):
+        """Lines created from a TabColumns object share the names
+        """
+        columns = TabColumns(('one','two','three'))
+        line1 = TabDataLine('1\t2\t3',column_names=columns)
+        line2 = TabDataLine('4\t5\t6',column_names=columns)
+        self.assertTrue(line1.columns() is line2.columns())
+        self.assertEqual(line1['two'],2)
+        self.assertEqual(line2['three'],6)
+        # Appending a column to one line doesn't affect the other
+        line1.appendColumn('four',7)
+        self.assertEqual(line1['four'],7)
+        self.assertEqual(line1.names,['one','two','three','four'])
+        self.assertEqual(line2.names,['one','two','three'])
+        self.assertRaises(KeyError,line2.__getitem__,'four')
+
+    def test_no_per_line_attributes(self):
+        """TabDataLine objects don't have an instance dictionary
+        """
+        line = TabDataLine('1\t2\t3',column_names=('one','two','three'))
+        self.assertFalse(hasattr(line,'__dict__'))
+
     def test_line_number(self):
         """Create new data line with line number
         """
@@ -1562,6 +3124,17 @@ class TestTabDataLine(unittest.TestCase):
         line = TabDataLine(line=input_data)
         self.assertEqual(line[2],"This has trailing space ")
 
+    def test_list_of_values_is_copied(self):
+        """Creating a line from a list doesn't modify the list
+        """
+        values = ['1','2.5']
+        line = TabDataLine(line=values,column_names=('one','two','three'))
+        self.assertEqual(line['one'],1)
+        line['two'] = 3.5
+        line.append('x')
+        self.assertEqual(line.data,[1,3.5,'','x'])
+        self.assertEqual(values,['1','2.5'])
+
 class TestTabDataLineTypeConversion(unittest.TestCase):
 
     def test_convert_integers(self):
@@ -1612,6 +3185,90 @@ class TestTabDataLineTypeConversion(unittest.TestCase):
         for i in range(len(test_values)):
             self.assertEqual(line[i],test_values[i])
 
+    def test_conversion_is_deferred(self):
+        """Values are only converted when they are first accessed
+        """
+        converted = []
+        def convert(value):
+            converted.append(value)
+            return int(value)
+        columns = TabColumns(('one','two','three'),types={'two':convert})
+        line = TabDataLine('1\t2\t3',column_names=columns)
+        self.assertEqual(converted,[])
+        self.assertEqual(line['two'],2)
+        self.assertEqual(line['two'],2)
+        self.assertEqual(converted,['2'])
+
+    def test_output_uses_converted_values(self):
+        """Values are written out in their converted form
+        """
+        line = TabDataLine('chr1\t01\t2.50')
+        self.assertEqual(str(line),'chr1\t1\t2.5')
+        self.assertEqual(line.data,['chr1',1,2.5])
+
+    def test_declared_column_types(self):
+        """Declared column types override the default conversions
+        """
+        columns = TabColumns(('chr','start','score'),
+                             types={'chr':str,0:str,'start':float,2:str})
+        line = TabDataLine('1\t100\t2.5',column_names=columns)
+        self.assertEqual(line['chr'],'1')
+        self.assertTrue(isinstance(line['start'],float))
+        self.assertEqual(line['score'],'2.5')
+
+    def test_declared_type_conversion_failure(self):
+        """Values which can't be converted to a declared type are kept
+        """
+        columns = TabColumns(('chr','start'),types={'start':int})
+        line = TabDataLine('chr1\t',column_names=columns)
+        self.assertEqual(line['start'],'')
+
+    def test_declared_type_unknown_column(self):
+        """Declaring a type for a non-existent column raises KeyError
+        """
+        self.assertRaises(KeyError,TabColumns,('chr','start'),
+                          {'end':int})
+
+class TestTabFileColumnTypes(unittest.TestCase):
+
+    def setUp(self):
+        # Make file-like object to read data in
+        self.fp = cStringIO.StringIO(
+"""#chr\tstart\tend\tdata
+1\t1\t234\t4.6
+1\t567\t890\t5.7
+2\t1234\t5678\t6.8
+""")
+
+    def tearDown(self):
+        # Close the open file-like input
+        self.fp.close()
+
+    def test_column_types_from_header(self):
+        """Declare column types by name for a file with a header
+        """
+        tabfile = TabFile('test',self.fp,first_line_is_header=True,
+                          column_types={'chr':str,'end':float})
+        self.assertEqual(tabfile[0]['chr'],'1')
+        self.assertEqual(tabfile[0]['start'],1)
+        self.assertTrue(isinstance(tabfile[0]['end'],float))
+        self.assertEqual(tabfile[2]['data'],6.8)
+
+    def test_column_types_by_index(self):
+        """Declare column types by index for a file without a header
+        """
+        tabfile = TabFile('test',self.fp,column_types={0:str})
+        self.assertEqual(tabfile[1][0],'1')
+        self.assertEqual(tabfile[1][1],567)
+
+    def test_column_types_with_column_names(self):
+        """Declare column types along with explicit column names
+        """
+        tabfile = TabFile('test',self.fp,column_names=('a','b','c','d'),
+                          column_types={'a':str})
+        self.assertEqual(tabfile[0]['a'],'1')
+        self.assertEqual(tabfile[0]['b'],1)
+
 class TestTabDataLineDelimiters(unittest.TestCase):
 
     def test_default_delimiters(self):
@@ -7,7 +7,7 @@
 #
 #########################################################################
 
-__version__ = "1.0.2"
+__version__ = "1.5.4"
 
 """bcf_utils
 
@@ -15,6 +15,7 @@ Utility classes and functions shared between BCF codes.
 
 Basic file system wrappers and utilities:
 
+  DirectoryIndex
   mkdir
   mklink
   chmod
@@ -33,6 +34,13 @@ Sample name utilities:
 File manipulations:
 
   concatenate_fastq_files
+  append_file_data
+  copy_and_checksum
+  gzip_member
+
+Parallel gzip compression:
+
+  ParallelGzipFile
 
 """
 
@@ -45,12 +53,539 @@ import logging
 import string
 import gzip
 import shutil
+import hashlib
+import zlib
+import struct
+import time
+import stat
+import json
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from collections import deque
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Default size of uncompressed blocks for ParallelGzipFile
+GZIP_BLOCK_SIZE = 1024*1024
+
+# Maximum size of uncompressed data in a BGZF block
+# (same as used by samtools)
+BGZF_BLOCK_SIZE = 0xff00
 
 #######################################################################
 # Class definitions
 #######################################################################
 
-# None defined
+class ChecksumWriter:
+    """File-like wrapper which computes MD5 sum of data as it's written
+
+    Wraps a file object opened for writing; data written via the
+    wrapper is passed to the underlying file and also used to update
+    an MD5 digest, available via the 'hexdigest' method.
+    """
+
+    def __init__(self,fp):
+        """Create a new ChecksumWriter
+
+        Arguments:
+          fp: file-like object opened for writing
+        """
+        self.__fp = fp
+        self.__md5 = hashlib.md5()
+        self.name = getattr(fp,'name','')
+
+    def write(self,data):
+        self.__md5.update(data)
+        self.__fp.write(data)
+
+    def flush(self):
+        self.__fp.flush()
+
+    def close(self):
+        self.__fp.close()
+
+    def hexdigest(self):
+        """Return the MD5 sum of the data written so far
+        """
+        return self.__md5.hexdigest()
+
+class DirectoryIndex:
+    """Cached view of the contents of directories
+
+    A DirectoryIndex lists each directory at most once, and caches
+    the names and types of the entries it finds, so that repeated
+    'listdir', 'isdir', 'isfile', 'islink' and 'readlink' queries
+    against the same part of a directory tree don't go back to the
+    file system (which can be slow, for example over NFS).
+
+    Where os.scandir (or the 'scandir' package) is available, entry
+    types are taken from the directory listing itself; otherwise
+    each entry is stat'ed the first time its type is needed.
+
+    Queries on a path are resolved by listing its parent directory,
+    so the index should only be used for paths below a directory
+    that is known to exist.
+
+    Example usage:
+
+    >>> index = DirectoryIndex()
+    >>> for d in index.listdir('/path/to/run'):
+    ...     if index.isdir(os.path.join('/path/to/run',d)): ...
+
+    Note that the index is a snapshot: subsequent changes to the
+    file system aren't reflected.
+
+    A set of directories can be listed concurrently using the 'scan'
+    method; the index can be safely shared between threads (updates
+    to the cached listings are made while holding a lock, although
+    two threads querying the same new directory at the same time may
+    both list it).
+
+    The index can be saved to a JSON file using the 'save' method and
+    restored later using 'load'. The modification time, status change
+    time and link count of each listed directory are stored with the
+    listing, and the saved index is only restored if none of these
+    has changed, so a restored index gives the same results as listing
+    the directories again. (The status change time can't be set back
+    by tools which preserve modification times, e.g. 'touch -r' or
+    'rsync -t', and the link count catches subdirectories being added
+    or removed.)
+    """
+
+    def __init__(self):
+        """Create a new empty DirectoryIndex
+        """
+        # Dictionary of directory path -> (names,entries,stamp) where
+        # entries maps name -> (is_dir,is_file,is_link) (or None
+        # if not yet determined) and stamp is from _dir_stamp
+        self.__dirs = {}
+        self.__links = {}
+        self.__lock = threading.Lock()
+        self.changed = False
+
+    def save(self,filen):
+        """Save the index to a JSON file
+
+        The file is written to a temporary '.part' file first and
+        then moved into place.
+
+        The file can be written into one of the indexed directories
+        (for example the top-level directory of a run): creating it
+        will update the directory's modification time, so if the
+        directory was otherwise unchanged since it was listed then
+        the stored times are updated to match.
+
+        Arguments:
+          filen: name of the file to write
+        """
+        dirn = os.path.normpath(os.path.dirname(os.path.abspath(filen)))
+        if dirn in self.__dirs and \
+           _dir_stamp(dirn) == self.__dirs[dirn][2]:
+            update_dirn = dirn
+        else:
+            update_dirn = None
+        self.__write_snapshot(filen+'.part')
+        os.rename(filen+'.part',filen)
+        if update_dirn is not None:
+            # Rewriting the existing file doesn't change the
+            # directory's modification time again
+            names,entries,stamp = self.__dirs[dirn]
+            self.__dirs[dirn] = (names,entries,_dir_stamp(dirn))
+            self.__write_snapshot(filen)
+        self.changed = False
+
+    def load(self,filen):
+        """Restore the index from a JSON file written by 'save'
+
+        The index is only restored if the file can be read and the
+        modification times, status change times and link counts of
+        all the directories in it are unchanged; otherwise the index
+        is left as it was.
+
+        Arguments:
+          filen: name of the file to read
+
+        Returns:
+          True if the index was restored, False if not.
+        """
+        try:
+            snapshot = json.load(open(filen,'r'))
+            if snapshot['version'] != 2:
+                return False
+            dirs = {}
+            for dirn,stamp,names,entries in snapshot['dirs']:
+                dirn = _str(dirn)
+                stamp = tuple(stamp)
+                if _dir_stamp(dirn) != stamp:
+                    logging.debug("%s: changed since snapshot" % dirn)
+                    return False
+                names = [_str(n) for n in names]
+                entries = dict([(n,(tuple(e) if e is not None else None))
+                                for n,e in zip(names,entries)])
+                dirs[dirn] = (names,entries,stamp)
+            links = dict([(_str(l),_str(t))
+                          for l,t in snapshot['links'].items()])
+        except (IOError,OSError,ValueError,KeyError,TypeError),ex:
+            logging.debug("Unable to load snapshot from %s: %s" % (filen,ex))
+            return False
+        self.__lock.acquire()
+        try:
+            self.__dirs.update(dirs)
+            self.__links.update(links)
+        finally:
+            self.__lock.release()
+        return True
+
+    def scan(self,dirns,workers=1,types=False):
+        """List a set of directories, using a pool of threads
+
+        Adds the listings for each of the directories to the index,
+        so subsequent queries on them don't need to go back to the
+        file system. Directories which can't be listed are ignored.
+
+        Arguments:
+          dirns: list of directories to list
+          workers: (optional) number of directories to list at the
+            same time (default 1)
+          types: (optional) if True then also determine the type of
+            each entry (i.e. directory, file, link) as part of the
+            scan (this is only needed if scandir isn't available)
+        """
+        if workers > 1 and len(dirns) > 1:
+            pool = ThreadPool(min(workers,len(dirns)))
+            try:
+                pool.map(lambda d: self.__scan(d,types),dirns)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for dirn in dirns:
+                self.__scan(dirn,types)
+
+    def listdir(self,dirn):
+        """Return the names of the entries in a directory
+
+        Raises OSError if the directory can't be listed (same as
+        os.listdir).
+        """
+        return list(self.__listing(dirn)[0])
+
+    def exists(self,path):
+        """Return True if path exists
+        """
+        return self.__entry_type(path) is not None
+
+    def isdir(self,path):
+        """Return True if path is a directory (following symlinks)
+        """
+        entry = self.__entry_type(path)
+        return entry is not None and entry[0]
+
+    def isfile(self,path):
+        """Return True if path is a regular file (following symlinks)
+        """
+        entry = self.__entry_type(path)
+        return entry is not None and entry[1]
+
+    def islink(self,path):
+        """Return True if path is a symbolic link
+        """
+        entry = self.__entry_type(path)
+        return entry is not None and entry[2]
+
+    def readlink(self,path):
+        """Return the target of a symbolic link (same as os.readlink)
+        """
+        path = os.path.normpath(path)
+        try:
+            return self.__links[path]
+        except KeyError:
+            pass
+        target = os.readlink(path)
+        self.__lock.acquire()
+        try:
+            self.__links[path] = target
+            self.changed = True
+        finally:
+            self.__lock.release()
+        return target
+
+    def __listing(self,dirn):
+        # Return (names,entries,stamp) for directory, listing it if
+        # it hasn't been seen before
+        dirn = os.path.normpath(dirn)
+        try:
+            return self.__dirs[dirn]
+        except KeyError:
+            pass
+        # Get modification times before listing, so that any changes
+        # made during the listing invalidate a saved index
+        stamp = _dir_stamp(dirn)
+        names = []
+        entries = {}
+        if scandir is not None:
+            for entry in scandir(dirn):
+                names.append(entry.name)
+                try:
+                    entries[entry.name] = (entry.is_dir(),entry.is_file(),
+                                           entry.is_symlink())
+                except OSError:
+                    entries[entry.name] = None
+        else:
+            for name in os.listdir(dirn):
+                names.append(name)
+                entries[name] = None
+        self.__lock.acquire()
+        try:
+            # Keep the first listing if another thread got there
+            # before us
+            if dirn not in self.__dirs:
+                self.__dirs[dirn] = (names,entries,stamp)
+                self.changed = True
+            return self.__dirs[dirn]
+        finally:
+            self.__lock.release()
+
+    def __entry_type(self,path):
+        # Return (is_dir,is_file,is_link) for path, or None if it
+        # doesn't exist
+        path = os.path.normpath(path)
+        dirn,name = os.path.split(path)
+        try:
+            entries = self.__listing(dirn)[1]
+        except OSError:
+            return None
+        if name not in entries:
+            return None
+        if entries[name] is None:
+            try:
+                st = os.lstat(path)
+            except OSError:
+                return None
+            is_link = stat.S_ISLNK(st.st_mode)
+            if is_link:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    # Broken link
+                    st = None
+            if st is not None:
+                entry = (stat.S_ISDIR(st.st_mode),
+                         stat.S_ISREG(st.st_mode),
+                         is_link)
+            else:
+                entry = (False,False,True)
+            self.__lock.acquire()
+            try:
+                entries[name] = entry
+                self.changed = True
+            finally:
+                self.__lock.release()
+        return entries[name]
+
+    def __scan(self,dirn,types=False):
+        # List directory and optionally determine entry types,
+        # ignoring errors
+        try:
+            names = self.__listing(dirn)[0]
+        except OSError:
+            return
+        if types:
+            for name in names:
+                self.__entry_type(os.path.join(dirn,name))
+
+    def __write_snapshot(self,filen):
+        # Write the index as JSON
+        self.__lock.acquire()
+        try:
+            snapshot = { 'version': 2,
+                         'dirs': [[dirn,stamp,names,[entries[n] for n in names]]
+                                  for dirn,(names,entries,stamp)
+                                  in sorted(self.__dirs.items())],
+                         'links': dict(self.__links) }
+        finally:
+            self.__lock.release()
+        fp = open(filen,'w')
+        try:
+            json.dump(snapshot,fp,separators=(',',':'))
+        finally:
+            fp.close()
+
+class ParallelGzipFile:
+    """Write-only gzip file which compresses data on multiple processes
+
+    Data written to a ParallelGzipFile is split into blocks of
+    'blocksize' bytes, and each block is compressed independently
+    as a complete gzip member (see the 'gzip_member' function). The
+    members are written to the output in the same order as the data,
+    so that the result is a multi-member gzip file which can be read
+    by gunzip, zcat and the Python gzip module.
+
+    If 'bgzf' is True then the members are written as BGZF blocks
+    (i.e. with the 'BC' extra field giving the block size, as used
+    by BAM and tabix) and the BGZF end-of-file marker block is
+    appended when the file is closed; in this case the blocksize is
+    limited to BGZF_BLOCK_SIZE.
+
+    If 'workers' is greater than 1 then the blocks are compressed on
+    a pool of that many processes, otherwise they are compressed in
+    the current process. The number of blocks held in memory waiting
+    to be compressed or written is limited to twice the number of
+    workers, so peak memory usage is bounded at roughly
+
+    2 x workers x blocksize
+
+    regardless of the amount of data written.
+
+    Alternatively an existing multiprocessing.Pool can be supplied
+    via the 'pool' argument and is then used instead of creating a
+    new one ('workers' should still be set to the size of the pool,
+    as it sets the number of blocks in flight). The supplied pool is
+    not closed when the file is closed, so it can be shared between
+    several ParallelGzipFiles. This should be done when writing from
+    multiple threads, as the pool must be created (i.e. the worker
+    processes forked) before any of the threads are started.
+
+    Example usage:
+
+    >>> gz = ParallelGzipFile('reads.fastq.gz',workers=4)
+    >>> gz.write(data)
+    >>> gz.close()
+    """
+
+    def __init__(self,filename=None,mode='wb',compresslevel=9,workers=1,
+                 blocksize=GZIP_BLOCK_SIZE,bgzf=False,fileobj=None,
+                 pool=None):
+        """Create a new ParallelGzipFile
+
+        Arguments:
+          filename: name of the file to write to (ignored if
+            'fileobj' is specified)
+          mode: (optional) either 'wb' (the default) to overwrite,
+            or 'ab' to append to an existing file
+          compresslevel: (optional) gzip compression level from 1
+            (fastest) to 9 (smallest output, the default)
+          workers: (optional) number of processes to use for
+            compression (default 1)
+          blocksize: (optional) size of the uncompressed blocks
+            that data is split into
+          bgzf: (optional) if True then write BGZF blocks
+          fileobj: (optional) file-like object opened for writing,
+            to use instead of 'filename'
+          pool: (optional) existing multiprocessing.Pool to use for
+            compression (won't be closed along with the file)
+        """
+        if mode not in ('w','wb','a','ab'):
+            raise ValueError, "Bad mode '%s'" % mode
+        if workers < 1:
+            raise ValueError, "Number of workers must be at least 1"
+        if bgzf:
+            blocksize = min(blocksize,BGZF_BLOCK_SIZE)
+        if fileobj is None:
+            fileobj = open(filename,mode[0]+'b')
+            self.__close_fp = True
+        else:
+            self.__close_fp = False
+        self.__fp = fileobj
+        self.name = getattr(fileobj,'name',filename)
+        self.__compresslevel = compresslevel
+        self.__blocksize = blocksize
+        self.__bgzf = bgzf
+        self.__buffer = []
+        self.__buffer_size = 0
+        self.__pending = deque()
+        self.__nmembers = 0
+        self.__max_pending = 2*workers
+        if pool is not None:
+            self.__pool = pool
+            self.__own_pool = False
+        elif workers > 1:
+            self.__pool = multiprocessing.Pool(workers)
+            self.__own_pool = True
+        else:
+            self.__pool = None
+            self.__own_pool = False
+        self.closed = False
+
+    def write(self,data):
+        """Write data to the file
+
+        Arguments:
+          data: string of (uncompressed) data to write
+        """
+        if self.closed:
+            raise ValueError, "I/O operation on closed file"
+        self.__buffer.append(data)
+        self.__buffer_size += len(data)
+        if self.__buffer_size >= self.__blocksize:
+            data = ''.join(self.__buffer)
+            nblocks = len(data)/self.__blocksize
+            for i in xrange(nblocks):
+                self.__submit(data[i*self.__blocksize:(i+1)*self.__blocksize])
+            data = data[nblocks*self.__blocksize:]
+            self.__buffer = [data]
+            self.__buffer_size = len(data)
+
+    def flush(self):
+        """Compress and write out all the data written so far
+        """
+        if self.__buffer_size:
+            self.__submit(''.join(self.__buffer))
+            self.__buffer = []
+            self.__buffer_size = 0
+        while self.__pending:
+            self.__write_next()
+        self.__fp.flush()
+
+    def close(self):
+        """Write out remaining data and close the file
+
+        If no data was written then a single empty member is
+        written, so that the output is still a valid gzip file (for
+        BGZF the end-of-file marker is itself an empty block).
+        """
+        if self.closed:
+            return
+        try:
+            self.flush()
+            if self.__bgzf:
+                self.__fp.write(gzip_member('',bgzf=True))
+            elif not self.__nmembers:
+                self.__fp.write(gzip_member('',self.__compresslevel))
+        finally:
+            self.closed = True
+            if self.__own_pool:
+                self.__pool.terminate()
+                self.__pool.join()
+            if self.__close_fp:
+                self.__fp.close()
+
+    def __submit(self,data):
+        # Queue a block for compression, writing out the oldest
+        # compressed blocks first if the queue is full
+        while len(self.__pending) >= self.__max_pending:
+            self.__write_next()
+        self.__nmembers += 1
+        if self.__pool is not None:
+            self.__pending.append(
+                self.__pool.apply_async(gzip_member,
+                                        (data,self.__compresslevel,self.__bgzf)))
+        else:
+            self.__fp.write(gzip_member(data,self.__compresslevel,self.__bgzf))
+
+    def __write_next(self):
+        # Write out the oldest compressed block
+        self.__fp.write(self.__pending.popleft().get())
 
 #######################################################################
 # Module Functions
@@ -58,6 +593,19 @@ import shutil
 
 # File system wrappers and utilities
 
+def _str(s):
+    # Convert unicode strings read from JSON back to (UTF-8) byte
+    # strings, for consistency with os.listdir etc
+    if isinstance(s,unicode):
+        return s.encode('utf-8')
+    return s
+
+def _dir_stamp(dirn):
+    # Return (mtime,ctime,nlink) for a directory, used by
+    # DirectoryIndex to check whether it has changed
+    st = os.stat(dirn)
+    return (st.st_mtime,st.st_ctime,st.st_nlink)
+
 def mkdir(dirn,mode=None):
     """Make a directory
 
@@ -302,14 +850,19 @@ def pretty_print_names(name_list):
 
 # File manipulations
 
-def concatenate_fastq_files(merged_fastq,fastq_files,bufsize=10240,
-                            overwrite=False,verbose=True):
+def concatenate_fastq_files(merged_fastq,fastq_files,bufsize=1024*1024,
+                            overwrite=False,verbose=True,compresslevel=9,
+                            workers=1):
     """Create a single FASTQ file by concatenating one or more FASTQs
 
     Given a list or tuple of FASTQ files (which can be compressed or
     uncompressed or a combination), creates a single output FASTQ by
     concatenating the contents.
 
+    Input files which have the same compression as the output are
+    appended without being decompressed (see 'append_file_data');
+    data is only compressed or decompressed for inputs which differ.
+
     Arguments:
       merged_fastq: name of output FASTQ file (mustn't exist beforehand)
       fastq_files:  list of FASTQ files to concatenate
@@ -318,62 +871,266 @@ def concatenate_fastq_files(merged_fastq,fastq_files,bufsize=10240,
         already exists (otherwise raise OSError); default is False
       verbose: (optional) if True then report operations to stdout,
         otherwise operate quietly
+      compresslevel: (optional) gzip compression level to use if the
+        output is compressed (default 9)
+      workers: (optional) number of processes to use for compressing
+        the output (default 1)
+
+    The output is written to a temporary '.part' file which is only
+    renamed to 'merged_fastq' once it is complete, and which is
+    removed if there is an error.
 
     """
     if verbose: print "Creating merged fastq file '%s'" % merged_fastq
     # Check that initial file doesn't exist
     if os.path.exists(merged_fastq) and not overwrite:
         raise OSError, "Target file '%s' already exists, stopping" % merged_fastq
+    # Check that inputs exist
+    for fastq in fastq_files:
+        if not os.path.exists(fastq):
+            raise OSError, "'%s' not found, stopping" % fastq
     # Create temporary name
     merged_fastq_part = merged_fastq+'.part'
-    # Open for writing
-    if is_gzipped_file(merged_fastq):
-        if is_gzipped_file(fastq_files[0]):
-            # Copy first file in list directly and open for append
-            if verbose: print "Copying %s" % fastq_files[0]
-            shutil.copy(fastq_files[0],merged_fastq_part)
-            first_file = 1
-            fq_merged = gzip.GzipFile(merged_fastq_part,'ab')
-        else:
-            # Open for write
-            first_file = 0
-            fq_merged = gzip.GzipFile(merged_fastq_part,'wb')
+    gzipped_output = is_gzipped_file(merged_fastq)
+    # For each fastq, append data to output: files with the same
+    # compression as the output are copied verbatim (concatenated
+    # gzip members are still a valid gzip file), others are
+    # compressed or decompressed on the fly
+    fq_merged = open(merged_fastq_part,'wb')
+    try:
+        for fastq in fastq_files:
+            if is_gzipped_file(fastq) == gzipped_output:
+                if verbose: print "Copying %s" % fastq
+                append_file_data(fastq,fq_merged,bufsize=bufsize)
+                continue
+            if verbose: print "Adding records from %s" % fastq
+            if gzipped_output:
+                fq = open(fastq,'rb')
+                fq_out = ParallelGzipFile(fileobj=fq_merged,
+                                          compresslevel=compresslevel,
+                                          workers=workers)
+            else:
+                fq = gzip.GzipFile(fastq,'rb')
+                fq_out = fq_merged
+            try:
+                while True:
+                    data = fq.read(bufsize)
+                    if not data: break
+                    fq_out.write(data)
+            finally:
+                fq.close()
+                if fq_out is not fq_merged:
+                    fq_out.close()
+        fq_merged.close()
+    except:
+        # Clean up partial output
+        fq_merged.close()
+        if os.path.exists(merged_fastq_part):
+            os.remove(merged_fastq_part)
+        raise
+    # Finished, move to final name
+    os.rename(merged_fastq_part,merged_fastq)
+
+def append_file_data(filen,fp,bufsize=1024*1024):
+    """Append the contents of a file to an open file, without decoding
+
+    The bytes of 'filen' are appended verbatim to the file object
+    'fp'. Where the OS provides them, os.copy_file_range or
+    os.sendfile are used so that the data is copied inside the
+    kernel; otherwise (or if these fail before any data has been
+    copied, for example because they're not supported by the
+    filesystem) the data is copied in blocks of 'bufsize' bytes.
+
+    Arguments:
+      filen: name of the file to copy data from
+      fp: file object opened for writing, to append data to
+      bufsize: (optional) size of blocks to copy
+
+    """
+    fin = open(filen,'rb')
+    try:
+        fp.flush()
+        nbytes = os.fstat(fin.fileno()).st_size
+        ncopied = 0
+        for copy in (_copy_file_range,_sendfile):
+            if copy is None:
+                continue
+            try:
+                while ncopied < nbytes:
+                    n = copy(fin.fileno(),fp.fileno(),
+                             min(nbytes-ncopied,0x40000000))
+                    if n == 0: break
+                    ncopied += n
+            except OSError:
+                if ncopied:
+                    raise
+                continue
+            if ncopied:
+                # Pick up any data appended since the size was taken
+                fin.seek(ncopied)
+                break
+        shutil.copyfileobj(fin,fp,bufsize)
+    finally:
+        fin.close()
+
+# Zero-copy primitives, where available (Python 3.3+/3.8+)
+if hasattr(os,'copy_file_range'):
+    def _copy_file_range(fd_in,fd_out,count):
+        return os.copy_file_range(fd_in,fd_out,count)
+else:
+    _copy_file_range = None
+if hasattr(os,'sendfile'):
+    def _sendfile(fd_in,fd_out,count):
+        return os.sendfile(fd_out,fd_in,None,count)
+else:
+    _sendfile = None
+
+def copy_and_checksum(src,copy_dst=None,gzip_dst=None,blocksize=1024*1024,
+                      compresslevel=9,workers=1,pool=None):
+    """Copy and/or gzip a file in a single pass, computing MD5 sums
+
+    Reads the source file once and, from the same data, writes a
+    plain copy (if 'copy_dst' is specified) and/or a gzipped copy (if
+    'gzip_dst' is specified), while computing the MD5 sums of the
+    source and of the outputs.
+
+    Outputs are written to temporary '.part' files which are renamed
+    to their final names only once they are complete.
+
+    Note that the MD5 sum of a plain copy is that of the data as it
+    was written, i.e. the same as the source.
+
+    With a single worker (and no pool) the gzipped copy is written
+    as a standard single-member gzip file; otherwise it is written
+    as a multi-member file by a ParallelGzipFile. When called from
+    multiple threads, create a multiprocessing.Pool before starting
+    the threads and pass it in via 'pool', rather than setting
+    'workers' alone (which would fork a new pool from each thread).
+
+    Arguments:
+      src: name of the source file
+      copy_dst: (optional) name of plain copy to create
+      gzip_dst: (optional) name of gzipped copy to create
+      blocksize: (optional) size of blocks to read source file in
+      compresslevel: (optional) gzip compression level (default 9)
+      workers: (optional) number of processes to use for compressing
+        the gzipped copy (default 1)
+      pool: (optional) existing multiprocessing.Pool of 'workers'
+        processes to compress the gzipped copy on
+
+    Returns:
+      List of (md5sum,filename) tuples, for the source file followed
+      by each of the outputs.
+
+    """
+    src_md5 = hashlib.md5()
+    outputs = []
+    fcopy = None
+    fgz = None
+    gzip_writer = None
+    try:
+        if copy_dst is not None:
+            fcopy = open(copy_dst+'.part','wb')
+            outputs.append(fcopy.write)
+        if gzip_dst is not None:
+            gzip_writer = ChecksumWriter(open(gzip_dst+'.part','wb'))
+            if workers > 1 or pool is not None:
+                fgz = ParallelGzipFile(fileobj=gzip_writer,
+                                       compresslevel=compresslevel,
+                                       workers=workers,pool=pool)
+            else:
+                fgz = gzip.GzipFile(fileobj=gzip_writer,mode='wb',
+                                    compresslevel=compresslevel)
+            outputs.append(fgz.write)
+        fp = open(src,'rb')
+        try:
+            while True:
+                data = fp.read(blocksize)
+                if not data: break
+                src_md5.update(data)
+                for write in outputs:
+                    write(data)
+        finally:
+            fp.close()
+        if fcopy is not None:
+            fcopy.close()
+            fcopy = None
+        if fgz is not None:
+            fgz.close()
+            fgz = None
+            gzip_writer.close()
+    except:
+        # Clean up partial outputs
+        for f in (fcopy,fgz,gzip_writer):
+            if f is not None:
+                f.close()
+        for dst in (copy_dst,gzip_dst):
+            if dst is not None and os.path.exists(dst+'.part'):
+                os.remove(dst+'.part')
+        raise
+    # Move outputs to final names and report checksums
+    checksums = [(src_md5.hexdigest(),src)]
+    if copy_dst is not None:
+        os.rename(copy_dst+'.part',copy_dst)
+        checksums.append((src_md5.hexdigest(),copy_dst))
+    if gzip_dst is not None:
+        os.rename(gzip_dst+'.part',gzip_dst)
+        checksums.append((gzip_writer.hexdigest(),gzip_dst))
+    return checksums
+
+def gzip_member(data,compresslevel=9,bgzf=False):
+    """Compress data as a single, complete gzip member
+
+    Returns the gzip header, deflated data and trailer (CRC32 and
+    uncompressed size) for the supplied data. Gzip members can be
+    concatenated and the result is still a valid gzip file.
+
+    If 'bgzf' is True then the member is written as a BGZF block,
+    with an extra 'BC' subfield holding the total size of the block
+    minus one; in this case the data must be no more than
+    BGZF_BLOCK_SIZE bytes long. (Compressing an empty string as a
+    BGZF block gives the BGZF end-of-file marker.)
+
+    Arguments:
+      data: string of data to compress
+      compresslevel: (optional) compression level from 1 to 9
+        (default 9)
+      bgzf: (optional) if True then write a BGZF block
+
+    Returns:
+      String with the gzip member.
+
+    """
+    compressor = zlib.compressobj(compresslevel,zlib.DEFLATED,-zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    trailer = struct.pack("<II",zlib.crc32(data) & 0xffffffffL,
+                          len(data) & 0xffffffffL)
+    if bgzf:
+        # Header is 18 bytes, trailer 8 bytes
+        bsize = 18 + len(deflated) + 8
+        if bsize > 0x10000:
+            raise ValueError, "Data too large for a BGZF block"
+        # ID1,ID2,CM,FLG(FEXTRA),MTIME,XFL,OS,XLEN,'B','C',SLEN,BSIZE-1
+        header = struct.pack("<BBBBIBBHBBHH",31,139,8,4,0,0,255,6,
+                             66,67,2,bsize-1)
     else:
-        if not is_gzipped_file(fastq_files[0]):
-            if verbose: print "Copying %s" % fastq_files[0]
-            # Copy first file in list directly and open for append
-            shutil.copy(fastq_files[0],merged_fastq_part)
-            first_file = 1
-            fq_merged = open(merged_fastq_part,'ab')
+        # ID1,ID2,CM,FLG,MTIME,XFL,OS
+        # (XFL is 2 for maximum compression, 4 for fastest)
+        if compresslevel == 9:
+            xfl = 2
+        elif compresslevel == 1:
+            xfl = 4
         else:
-            # Assume regular file
-            first_file = 1
-            fq_merged = open(merged_fastq_part,'wb')
-    # For each fastq, read data and append to output - simples!
-    for fastq in fastq_files[first_file:]:
-        if verbose: print "Adding records from %s" % fastq
-        # Check it exists
-        if not os.path.exists(fastq):
-            raise OSError, "'%s' not found, stopping" % fastq
-        # Open file for reading
-        if not is_gzipped_file(fastq):
-            fq = open(fastq,'rb')
-        else:
-            fq = gzip.GzipFile(fastq,'rb')
-        # Read and append data
-        while True:
-            data = fq.read(10240)
-            if not data: break
-            fq_merged.write(data)
-        fq.close()
-    # Finished, clean up
-    fq_merged.close()
-    os.rename(merged_fastq_part,merged_fastq)
+            xfl = 0
+        header = struct.pack("<BBBBIBB",31,139,8,0,int(time.time()),xfl,255)
+    return header + deflated + trailer
 
 #######################################################################
 # Tests
 #######################################################################
 import unittest
+import tempfile
+import cStringIO
 
 class TestFileSystemFunctions(unittest.TestCase):
     """Unit tests for file system wrapper and utility functions
@@ -394,6 +1151,132 @@ class TestFileSystemFunctions(unittest.TestCase):
         self.assertFalse(is_gzipped_file('hello.gz.part'))
         self.assertFalse(is_gzipped_file('hellogz'))
 
+class TestDirectoryIndex(unittest.TestCase):
+    """Unit tests for DirectoryIndex class
+
+    """
+    def setUp(self):
+        self.dirn = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dirn,"results.F1B1"))
+        os.symlink("results.F1B1",os.path.join(self.dirn,"results"))
+        os.symlink("missing",os.path.join(self.dirn,"broken"))
+        open(os.path.join(self.dirn,"results.F1B1","reads.csfasta"),'w').write('')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirn)
+
+    def test_listdir(self):
+        index = DirectoryIndex()
+        self.assertEqual(sorted(index.listdir(self.dirn)),
+                         ["broken","results","results.F1B1"])
+        self.assertEqual(index.listdir(os.path.join(self.dirn,"results")),
+                         ["reads.csfasta"])
+        self.assertRaises(OSError,index.listdir,os.path.join(self.dirn,"missing"))
+
+    def test_entry_types(self):
+        index = DirectoryIndex()
+        results_dir = os.path.join(self.dirn,"results.F1B1")
+        self.assertTrue(index.isdir(results_dir))
+        self.assertFalse(index.islink(results_dir))
+        self.assertTrue(index.isdir(os.path.join(self.dirn,"results")))
+        self.assertTrue(index.islink(os.path.join(self.dirn,"results")))
+        self.assertTrue(index.islink(os.path.join(self.dirn,"broken")))
+        self.assertFalse(index.isdir(os.path.join(self.dirn,"broken")))
+        self.assertTrue(index.isfile(os.path.join(results_dir,"reads.csfasta")))
+        self.assertFalse(index.isdir(os.path.join(results_dir,"reads.csfasta")))
+        self.assertFalse(index.exists(os.path.join(self.dirn,"missing")))
+        self.assertFalse(index.exists(os.path.join(self.dirn,"missing","reads")))
+        self.assertEqual(index.readlink(os.path.join(self.dirn,"results")),
+                         "results.F1B1")
+
+    def test_scan(self):
+        index = DirectoryIndex()
+        results_dir = os.path.join(self.dirn,"results.F1B1")
+        index.scan([self.dirn,results_dir,os.path.join(self.dirn,"missing")],
+                   workers=2,types=True)
+        self.assertTrue(index.changed)
+        snapshot = os.path.join(self.dirn,"..","snapshot.%s.json" %
+                                os.path.basename(self.dirn))
+        try:
+            index.save(snapshot)
+            # All the listings and types should be in the snapshot
+            index2 = DirectoryIndex()
+            index2.load(snapshot)
+            self.assertEqual(index2.listdir(results_dir),["reads.csfasta"])
+            self.assertTrue(index2.isdir(results_dir))
+            self.assertTrue(index2.islink(os.path.join(self.dirn,"broken")))
+            self.assertFalse(index2.changed)
+        finally:
+            os.remove(snapshot)
+
+    def test_save_and_load(self):
+        index = DirectoryIndex()
+        results_dir = os.path.join(self.dirn,"results")
+        index.listdir(results_dir)
+        index.isdir(os.path.join(self.dirn,"results.F1B1"))
+        index.islink(os.path.join(self.dirn,"broken"))
+        index.readlink(results_dir)
+        self.assertTrue(index.changed)
+        snapshot = os.path.join(self.dirn,"snapshot.json")
+        index.save(snapshot)
+        self.assertFalse(index.changed)
+        index2 = DirectoryIndex()
+        self.assertTrue(index2.load(snapshot))
+        self.assertFalse(index2.changed)
+        self.assertEqual(index2.listdir(results_dir),["reads.csfasta"])
+        self.assertTrue(isinstance(index2.listdir(results_dir)[0],str))
+        self.assertTrue(index2.isdir(os.path.join(self.dirn,"results.F1B1")))
+        self.assertTrue(index2.islink(os.path.join(self.dirn,"broken")))
+        self.assertEqual(index2.readlink(results_dir),"results.F1B1")
+        self.assertFalse(index2.changed)
+
+    def test_load_after_change(self):
+        index = DirectoryIndex()
+        index.listdir(self.dirn)
+        snapshot = os.path.join(self.dirn,"..","snapshot.%s.json" %
+                                os.path.basename(self.dirn))
+        try:
+            index.save(snapshot)
+            # Force a different modification time for the directory
+            os.mkdir(os.path.join(self.dirn,"new"))
+            st = os.stat(self.dirn)
+            os.utime(self.dirn,(st.st_atime,st.st_mtime+10))
+            self.assertFalse(DirectoryIndex().load(snapshot))
+        finally:
+            os.remove(snapshot)
+
+    def test_load_after_change_with_mtime_restored(self):
+        # Use a whole number of seconds so the time can be put back
+        # exactly
+        mtime = int(os.stat(self.dirn).st_mtime)
+        os.utime(self.dirn,(mtime,mtime))
+        index = DirectoryIndex()
+        index.listdir(self.dirn)
+        snapshot = os.path.join(self.dirn,"..","snapshot.%s.json" %
+                                os.path.basename(self.dirn))
+        try:
+            index.save(snapshot)
+            # Add a file but put the modification time back
+            open(os.path.join(self.dirn,"new"),'w').write('')
+            os.utime(self.dirn,(mtime,mtime))
+            self.assertEqual(os.stat(self.dirn).st_mtime,mtime)
+            self.assertFalse(DirectoryIndex().load(snapshot))
+        finally:
+            os.remove(snapshot)
+
+    def test_load_bad_snapshot(self):
+        snapshot = os.path.join(self.dirn,"snapshot.json")
+        self.assertFalse(DirectoryIndex().load(snapshot))
+        open(snapshot,'w').write("not json")
+        self.assertFalse(DirectoryIndex().load(snapshot))
+
+    def test_index_is_snapshot(self):
+        index = DirectoryIndex()
+        self.assertFalse(index.exists(os.path.join(self.dirn,"new")))
+        os.mkdir(os.path.join(self.dirn,"new"))
+        self.assertFalse(index.exists(os.path.join(self.dirn,"new")))
+        self.assertTrue(DirectoryIndex().exists(os.path.join(self.dirn,"new")))
+
 class TestFormatFileSize(unittest.TestCase):
     """Unit tests for formatting file sizes
 
@@ -478,7 +1361,8 @@ NATAAATCACCTCACTTAAGTGGCTGGAGACAAATA
     def tearDown(self):
         os.remove(self.fastq1)
         os.remove(self.fastq2)
-        os.remove(self.merged_fastq)
+        if os.path.exists(self.merged_fastq):
+            os.remove(self.merged_fastq)
 
     def make_fastq_file(self,fastq,data):
         # Create a fastq file for the testing
@@ -513,6 +1397,250 @@ NATAAATCACCTCACTTAAGTGGCTGGAGACAAATA
         merged_fastq_data = gzip.GzipFile(self.merged_fastq,'r').read()
         self.assertEqual(merged_fastq_data,self.fastq_data1+self.fastq_data2)
 
+    def test_concatenate_fastq_files_mixed_to_gzipped(self):
+        self.fastq1 = "concat.unittest.1.fastq"
+        self.fastq2 = "concat.unittest.2.fastq.gz"
+        self.make_fastq_file(self.fastq1,self.fastq_data1)
+        self.make_fastq_file(self.fastq2,self.fastq_data2)
+        self.merged_fastq = "concat.unittest.merged.fastq.gz"
+        concatenate_fastq_files(self.merged_fastq,
+                                [self.fastq1,self.fastq2],
+                                overwrite=True,
+                                verbose=False)
+        merged_fastq_data = gzip.GzipFile(self.merged_fastq,'r').read()
+        self.assertEqual(merged_fastq_data,self.fastq_data1+self.fastq_data2)
+
+    def test_concatenate_fastq_files_gzipped_to_uncompressed(self):
+        self.fastq1 = "concat.unittest.1.fastq.gz"
+        self.fastq2 = "concat.unittest.2.fastq"
+        self.make_fastq_file(self.fastq1,self.fastq_data1)
+        self.make_fastq_file(self.fastq2,self.fastq_data2)
+        self.merged_fastq = "concat.unittest.merged.fastq"
+        concatenate_fastq_files(self.merged_fastq,
+                                [self.fastq1,self.fastq2],
+                                overwrite=True,
+                                verbose=False)
+        merged_fastq_data = open(self.merged_fastq,'r').read()
+        self.assertEqual(merged_fastq_data,self.fastq_data1+self.fastq_data2)
+
+    def test_concatenate_fastq_files_gzipped_not_recompressed(self):
+        self.fastq1 = "concat.unittest.1.fastq.gz"
+        self.fastq2 = "concat.unittest.2.fastq.gz"
+        self.make_fastq_file(self.fastq1,self.fastq_data1)
+        self.make_fastq_file(self.fastq2,self.fastq_data2)
+        self.merged_fastq = "concat.unittest.merged.fastq.gz"
+        concatenate_fastq_files(self.merged_fastq,
+                                [self.fastq1,self.fastq2],
+                                overwrite=True,
+                                verbose=False)
+        self.assertEqual(open(self.merged_fastq,'rb').read(),
+                         open(self.fastq1,'rb').read()+
+                         open(self.fastq2,'rb').read())
+
+    def test_concatenate_fastq_files_bad_input_removes_partial(self):
+        self.fastq1 = "concat.unittest.1.fastq"
+        self.fastq2 = "concat.unittest.2.fastq.gz"
+        self.make_fastq_file(self.fastq1,self.fastq_data1)
+        # Not actually gzipped, so decompression will fail
+        self.make_fastq_file(self.fastq2+'.tmp',self.fastq_data2)
+        os.rename(self.fastq2+'.tmp',self.fastq2)
+        self.merged_fastq = "concat.unittest.merged.fastq"
+        self.assertRaises(IOError,concatenate_fastq_files,
+                          self.merged_fastq,[self.fastq1,self.fastq2],
+                          overwrite=True,verbose=False)
+        self.assertFalse(os.path.exists(self.merged_fastq))
+        self.assertFalse(os.path.exists(self.merged_fastq+'.part'))
+
+class TestAppendFileData(unittest.TestCase):
+    """Unit tests for append_file_data
+
+    """
+    def setUp(self):
+        self.dirn = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirn)
+
+    def test_append_file_data(self):
+        src = os.path.join(self.dirn,"src")
+        dst = os.path.join(self.dirn,"dst")
+        open(src,'wb').write("0123456789"*1000)
+        fp = open(dst,'wb')
+        fp.write("header\n")
+        append_file_data(src,fp,bufsize=100)
+        append_file_data(src,fp)
+        fp.write("footer\n")
+        fp.close()
+        self.assertEqual(open(dst,'rb').read(),
+                         "header\n"+"0123456789"*2000+"footer\n")
+
+class TestCopyAndChecksum(unittest.TestCase):
+    """Unit tests for copy_and_checksum
+
+    """
+    def setUp(self):
+        self.dirn = tempfile.mkdtemp()
+        self.src = os.path.join(self.dirn,"test.csfasta")
+        self.data = "# Title\n>1_23_45_F3\nT0123012301230123\n"*1000
+        open(self.src,'wb').write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirn)
+
+    def test_copy_and_gzip(self):
+        copy_dst = os.path.join(self.dirn,"copy.csfasta")
+        gzip_dst = os.path.join(self.dirn,"copy.csfasta.gz")
+        checksums = copy_and_checksum(self.src,copy_dst=copy_dst,
+                                      gzip_dst=gzip_dst,blocksize=1000)
+        self.assertEqual(open(copy_dst,'rb').read(),self.data)
+        self.assertEqual(gzip.GzipFile(gzip_dst,'rb').read(),self.data)
+        md5 = hashlib.md5(self.data).hexdigest()
+        self.assertEqual(checksums,
+                         [(md5,self.src),
+                          (md5,copy_dst),
+                          (hashlib.md5(open(gzip_dst,'rb').read()).hexdigest(),
+                           gzip_dst)])
+        self.assertFalse(os.path.exists(copy_dst+'.part'))
+        self.assertFalse(os.path.exists(gzip_dst+'.part'))
+
+    def test_gzip_single_member(self):
+        gzip_dst = os.path.join(self.dirn,"copy.csfasta.gz")
+        copy_and_checksum(self.src,gzip_dst=gzip_dst,blocksize=1000)
+        d = zlib.decompressobj(16+zlib.MAX_WBITS)
+        self.assertEqual(d.decompress(open(gzip_dst,'rb').read()),self.data)
+        self.assertEqual(d.unused_data,'')
+
+    def test_gzip_shared_pool(self):
+        pool = multiprocessing.Pool(2)
+        try:
+            for i in range(2):
+                gzip_dst = os.path.join(self.dirn,"copy%d.csfasta.gz" % i)
+                copy_and_checksum(self.src,gzip_dst=gzip_dst,blocksize=1000,
+                                  workers=2,pool=pool)
+                self.assertEqual(gzip.GzipFile(gzip_dst,'rb').read(),
+                                 self.data)
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_gzip_empty_source(self):
+        open(self.src,'wb').close()
+        for workers in (1,2):
+            gzip_dst = os.path.join(self.dirn,"empty%d.csfasta.gz" % workers)
+            copy_and_checksum(self.src,gzip_dst=gzip_dst,workers=workers)
+            self.assertEqual(zlib.decompress(open(gzip_dst,'rb').read(),31),'')
+
+    def test_checksum_only(self):
+        self.assertEqual(copy_and_checksum(self.src),
+                         [(hashlib.md5(self.data).hexdigest(),self.src)])
+
+    def test_missing_source(self):
+        gzip_dst = os.path.join(self.dirn,"missing.gz")
+        self.assertRaises(IOError,copy_and_checksum,
+                          os.path.join(self.dirn,"missing"),gzip_dst=gzip_dst)
+        self.assertFalse(os.path.exists(gzip_dst+'.part'))
+
+class TestGzipMember(unittest.TestCase):
+    """Unit tests for gzip_member
+
+    """
+    def test_gzip_member(self):
+        data = "@read1\nACGT\n+\nIIII\n"*100
+        member = gzip_member(data)
+        self.assertEqual(member[:3],"\x1f\x8b\x08")
+        self.assertEqual(zlib.decompress(member,16+zlib.MAX_WBITS),data)
+
+    def test_concatenated_members(self):
+        data1 = "@read1\nACGT\n+\nIIII\n"
+        data2 = "@read2\nTTTT\n+\nIIII\n"
+        fp = cStringIO.StringIO(gzip_member(data1)+gzip_member(data2,1))
+        self.assertEqual(gzip.GzipFile(fileobj=fp).read(),data1+data2)
+
+    def test_bgzf_member(self):
+        data = "@read1\nACGT\n+\nIIII\n"*100
+        member = gzip_member(data,bgzf=True)
+        self.assertEqual(member[12:14],"BC")
+        self.assertEqual(struct.unpack("<H",member[16:18])[0]+1,len(member))
+        self.assertEqual(zlib.decompress(member,16+zlib.MAX_WBITS),data)
+
+    def test_bgzf_eof_marker(self):
+        self.assertEqual(gzip_member('',bgzf=True),
+                         "\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff"
+                         "\x06\x00\x42\x43\x02\x00\x1b\x00\x03\x00"
+                         "\x00\x00\x00\x00\x00\x00\x00\x00")
+
+class TestParallelGzipFile(unittest.TestCase):
+    """Unit tests for ParallelGzipFile
+
+    """
+    def setUp(self):
+        self.dirn = tempfile.mkdtemp()
+        self.gz = os.path.join(self.dirn,"test.fastq.gz")
+        self.data = ''.join(["@read%d\nACGTACGT\n+\nIIIIIIII\n" % i
+                             for i in xrange(5000)])
+
+    def tearDown(self):
+        shutil.rmtree(self.dirn)
+
+    def write_gzip(self,**args):
+        gz = ParallelGzipFile(self.gz,**args)
+        # Write in uneven pieces to exercise the buffering
+        for i in xrange(0,len(self.data),777):
+            gz.write(self.data[i:i+777])
+        gz.close()
+        return gzip.GzipFile(self.gz,'rb').read()
+
+    def test_single_worker(self):
+        self.assertEqual(self.write_gzip(blocksize=10000),self.data)
+
+    def test_multiple_workers(self):
+        self.assertEqual(self.write_gzip(blocksize=10000,workers=3),self.data)
+
+    def test_compresslevel(self):
+        self.assertEqual(self.write_gzip(blocksize=10000,compresslevel=1),
+                         self.data)
+
+    def test_bgzf(self):
+        self.assertEqual(self.write_gzip(bgzf=True,workers=2),self.data)
+        raw = open(self.gz,'rb').read()
+        # Walk the BGZF blocks using the BSIZE fields
+        pos = 0
+        nblocks = 0
+        while pos < len(raw):
+            self.assertEqual(raw[pos+12:pos+14],"BC")
+            pos += struct.unpack("<H",raw[pos+16:pos+18])[0] + 1
+            nblocks += 1
+        self.assertEqual(pos,len(raw))
+        self.assertEqual(nblocks,len(self.data)/BGZF_BLOCK_SIZE + 2)
+        self.assertEqual(raw[-28:],gzip_member('',bgzf=True))
+
+    def test_append(self):
+        open(self.gz,'wb').write(gzip_member("@read0\n"))
+        gz = ParallelGzipFile(self.gz,'ab')
+        gz.write("@read1\n")
+        gz.close()
+        self.assertEqual(gzip.GzipFile(self.gz,'rb').read(),"@read0\n@read1\n")
+
+    def test_empty_file(self):
+        for workers in (1,2):
+            gz = ParallelGzipFile(self.gz,workers=workers)
+            gz.close()
+            # Python's gzip module also accepts a zero-length file,
+            # so check the data is a complete gzip stream
+            self.assertEqual(zlib.decompress(open(self.gz,'rb').read(),31),'')
+            self.assertEqual(gzip.GzipFile(self.gz,'rb').read(),'')
+
+    def test_empty_bgzf_file(self):
+        gz = ParallelGzipFile(self.gz,bgzf=True,workers=2)
+        gz.close()
+        self.assertEqual(open(self.gz,'rb').read(),gzip_member('',bgzf=True))
+        self.assertEqual(zlib.decompress(open(self.gz,'rb').read(),31),'')
+
+    def test_write_after_close(self):
+        gz = ParallelGzipFile(self.gz)
+        gz.close()
+        self.assertRaises(ValueError,gz.write,"data")
+
 #######################################################################
 # Main program
 #######################################################################
@@ -22,10 +22,10 @@ about the run, and suggest a layout scheme for the analysis directories.
 import sys
 import os
 import string
-import shutil
-import gzip
 import optparse
 import logging
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 logging.basicConfig(format="%(levelname)s %(message)s")
 
 # Put ../share onto Python search path for modules
@@ -35,6 +35,7 @@ SHARE_DIR = os.path.abspath(
 sys.path.append(SHARE_DIR)
 import SolidData
 import Experiment
+import bcf_utils
 
 #######################################################################
 # Class definitions
@@ -293,29 +294,57 @@ def suggest_rsync_command(solid_runs):
                 print "--exclude=" + str(library) + " \\"
         print "%s user@remote.system:/destination/parent/dir" % run.run_dir
 
-def verify_runs(solid_dirs):
-    """Do basic verification checks on SOLiD run directories
+def load_runs(solid_dirs,use_snapshots=False,workers=1):
+    """Create SolidRun objects for a set of SOLiD run directories
+
+    The run directories are scanned concurrently on a pool of
+    'workers' threads (most of the time is spent waiting for the
+    file system), but the SolidRun objects are returned in the same
+    order as the input directories.
 
-    For each SOLiD run directory, create a SolidRun object and check for the
-    expected sample and library directories, and that primary data files
-    (csfasta and qual) have been assigned and exist.
+    Arguments:
+      solid_dirs: a list of SOLiD sequencing directory names.
+      use_snapshots: (optional) if True then use snapshot files in
+        the run directories (see 'snapshot_file')
+      workers: (optional) number of runs to scan at the same time
+        (default 1)
+
+    Returns:
+      List of SolidRun objects.
+    """
+    return thread_map(lambda solid_dir:
+                      SolidData.SolidRun(solid_dir,
+                                         snapshot=snapshot_file(solid_dir,
+                                                                use_snapshots)),
+                      solid_dirs,workers)
+
+def verify_runs(solid_runs,workers=1):
+    """Do basic verification checks on SOLiD runs
+
+    For each SolidRun, check for the expected sample and library
+    directories, and that primary data files (csfasta and qual) have
+    been assigned and exist. The runs are checked concurrently on a
+    pool of 'workers' threads, and the results reported in the same
+    order as the input runs.
 
     Returns a UNIX-like status code: 0 indicates that the checks passed,
     1 indicates that they failed.
 
     Arguments:
-      solid_dirs: a list of SOLiD sequencing directory names.
+      solid_runs: a list of SolidRun objects.
+      workers: (optional) number of runs to check at the same time
+        (default 1)
 
     Returns:
       0 if the run is verified, 1 if there is a problem.
     """
     print "Performing verification"
     status = 0
-    for solid_dir in solid_dirs:
+    results = thread_map(lambda run: run.verify(),solid_runs,workers)
+    for run,verified in zip(solid_runs,results):
         # Initialise
         run_status = 0
-        run = SolidData.SolidRun(solid_dir)
-        if not run.verify():
+        if not verified:
             run_status = 1
         print "%s:" % run.run_name,
         if run_status == 0:
@@ -331,58 +360,48 @@ def verify_runs(solid_dirs):
         print " [FAILED]"
     return status
 
-def copy_data(solid_runs,library_defns):
-    """Copy selection of primary data files to current directory
+def thread_map(function,items,workers=1):
+    """Apply a function to each item using a pool of threads
 
-    Locates primary data files matching a sample/library specification
-    string of the form <sample_pattern>/<library_pattern>. The patterns
-    are matching against sample and library names, and can be either
-    exact or can include a trailing wildcard character (i.e. *) to match
-    multiple names. For example:
-
-    - 'SA_LH_POOL_49/LH1' matches the library called 'LH1' in the sample
-      'SA_LH_POOL_49';
-
-    - '*/LH1' matches all libraries called 'LH1' in any sample;
-
-    - '*/LH*' matches all libraries starting 'LH' in any sample;
+    Arguments:
+      function: function to apply to each item
+      items: list of items
+      workers: (optional) number of threads to use (default 1, in
+        which case the items are processed in the current thread)
 
-    - '*/*' matches all primary data files in all runs
+    Returns:
+      List of results, in the same order as the input items.
+    """
+    if workers == 1 or len(items) < 2:
+        return map(function,items)
+    pool = ThreadPool(min(workers,len(items)))
+    try:
+        return pool.map(function,items)
+    finally:
+        pool.close()
+        pool.join()
 
-    The files are copied to the current directory.
+def snapshot_file(solid_dir,use_snapshots=True):
+    """Return the name of the snapshot file for a SOLiD run directory
 
     Arguments:
-      solid_runs: list of populated SolidRun objects
-      library_defns: list of library definition strings (see above
-        for syntax/format)
+      solid_dir: SOLiD run directory
+      use_snapshots: (optional) if False then return None
+
+    Returns:
+      Path to the snapshot file in the run directory (or None if
+      'use_snapshots' is False).
     """
-    for library_defn in library_defns:
-        sample = library_defn.split('/')[0]
-        library = library_defn.split('/')[1]
-        print "Copy: look for samples matching pattern %s" % library_defn
-        print "Data files will be copied to %s" % os.getcwd()
-        for run in solid_runs:
-            for lib in run.fetchLibraries(sample,library):
-                print "-> matched %s/%s" % (lib.parent_sample.name,lib.name)
-                primary_data_files =[]
-                primary_data_files.append(lib.csfasta)
-                primary_data_files.append(lib.qual)
-                if run.is_paired_end:
-                    primary_data_files.append(lib.csfasta_f5)
-                    primary_data_files.append(lib.qual_f5)
-                for filn in primary_data_files:
-                    print "\tCopying .../%s" % os.path.basename(filn)
-                    dst = os.path.abspath(os.path.basename(filn))
-                    if os.path.exists(dst):
-                        logging.error("File %s already exists! Skipped" % dst)
-                    else:
-                        shutil.copy(filn,dst)
+    if not use_snapshots:
+        return None
+    return os.path.join(solid_dir,SolidData.SNAPSHOT_FILE)
 
-def gzip_data(solid_runs,library_defns):
-    """Make gzipped copies of a selection of primary data files in current directory
+def transfer_data(solid_runs,copy_defns=[],gzip_defns=[],manifest=None,
+                  workers=1,gzip_workers=1):
+    """Copy and/or make gzipped copies of primary data files in current directory
 
-    Locates primary data files matching a sample/library specification
-    string of the form <sample_pattern>/<library_pattern>. The patterns
+    Locates primary data files matching sample/library specification
+    strings of the form <sample_pattern>/<library_pattern>. The patterns
     are matching against sample and library names, and can be either
     exact or can include a trailing wildcard character (i.e. *) to match
     multiple names. For example:
@@ -396,50 +415,146 @@ def gzip_data(solid_runs,library_defns):
 
     - '*/*' matches all primary data files in all runs
 
-    Gzipped copies of the files are made in the current directory.
+    Files matching the 'copy_defns' patterns are copied to the current
+    directory, and gzipped copies of files matching the 'gzip_defns'
+    patterns are made in the current directory.
+
+    Each source file is only read once, even if it is both copied and
+    gzipped, and the MD5 sums of the source and the output files are
+    computed at the same time. Files are processed on a pool of
+    'workers' threads.
+
+    If 'gzip_workers' is greater than 1 then a single pool of that
+    many compression processes is created up front (before any of the
+    threads are started) and is shared by all the gzipped copies.
 
     Arguments:
       solid_runs: list of populated SolidRun objects
-      library_defns: list of library definition strings (see above
-        for syntax/format)
+      copy_defns: list of library definition strings (see above
+        for syntax/format) for files to copy
+      gzip_defns: list of library definition strings for files
+        to make gzipped copies of
+      manifest: (optional) name of file to write MD5 sums to (in
+        a format that can be checked using 'md5sum -c')
+      workers: (optional) number of files to process at the same
+        time (default 1)
+      gzip_workers: (optional) number of processes to use for
+        compressing the gzipped copies (default 1)
+
+    Returns:
+      Zero on success, 1 if errors were encountered.
     """
-    for library_defn in library_defns:
-        sample = library_defn.split('/')[0]
-        library = library_defn.split('/')[1]
-        print "Gzip: look for samples matching pattern %s" % library_defn
-        print "Gzipped copies will be created in %s" % os.getcwd()
-        for run in solid_runs:
-            for lib in run.fetchLibraries(sample,library):
-                print "-> matched %s/%s" % (lib.parent_sample.name,lib.name)
-                primary_data_files =[]
-                primary_data_files.append(lib.csfasta)
-                primary_data_files.append(lib.qual)
-                if run.is_paired_end:
-                    # Add F5 data files for paired end run
-                    primary_data_files.append(lib.csfasta_f5)
-                    primary_data_files.append(lib.qual_f5)
-                for filn in primary_data_files:
-                    print "\tGzipping .../%s" % os.path.basename(filn)
-                    # Check for final gz file
-                    gzip_filn = os.path.abspath(os.path.basename(filn)+'.gz')
-                    if os.path.exists(gzip_filn):
-                        logging.error("File %s already exists! Skipped" % gzip_filn)
-                    else:
-                        # Name for intermediate file
-                        gzip_filn_part = gzip_filn+'.part'
-                        # Buffered write to gzip file from original file
-                        fp = open(filn,'rb')
-                        fgz = gzip.GzipFile(gzip_filn_part,'wb')
-                        while True:
-                            data = fp.read(10240)
-                            if not data: break
-                            fgz.write(data)
-                        fp.close()
-                        fgz.close()
-                        # Move to final file
-                        os.rename(gzip_filn_part,gzip_filn)
-
-def md5_checksums(solid_runs,library_defns):
+    # Build list of operations for each primary data file
+    # Outputs are keyed by destination as well as by source, so that
+    # sources with the same name (e.g. from different runs) don't
+    # both get written to the same output
+    operations = {}
+    files = []
+    destinations = {}
+    for op,library_defns in (('copy',copy_defns),('gzip',gzip_defns)):
+        for library_defn in library_defns:
+            sample = library_defn.split('/')[0]
+            library = library_defn.split('/')[1]
+            print "%s: look for samples matching pattern %s" % (op.title(),
+                                                               library_defn)
+            for run in solid_runs:
+                for lib in run.fetchLibraries(sample,library):
+                    print "-> matched %s/%s" % (lib.parent_sample.name,lib.name)
+                    primary_data_files =[]
+                    primary_data_files.append(lib.csfasta)
+                    primary_data_files.append(lib.qual)
+                    if run.is_paired_end:
+                        # Add F5 data files for paired end run
+                        primary_data_files.append(lib.csfasta_f5)
+                        primary_data_files.append(lib.qual_f5)
+                    for filn in primary_data_files:
+                        if filn not in operations:
+                            operations[filn] = {}
+                            files.append(filn)
+                        if op == 'copy':
+                            dst = os.path.abspath(os.path.basename(filn))
+                        else:
+                            dst = os.path.abspath(os.path.basename(filn)+'.gz')
+                        if os.path.exists(dst) or \
+                           destinations.get(dst,filn) != filn:
+                            logging.error("File %s already exists! Skipped" % dst)
+                        else:
+                            operations[filn][op] = dst
+                            destinations[dst] = filn
+    print "Outputs will be created in %s" % os.getcwd()
+    # Process the files
+    status = 0
+    if gzip_workers > 1:
+        # Fork the compression processes now, before there are
+        # any other threads
+        gzip_pool = multiprocessing.Pool(gzip_workers)
+    else:
+        gzip_pool = None
+    tasks = [(filn,operations[filn].get('copy'),operations[filn].get('gzip'),
+              gzip_workers,gzip_pool) for filn in files if operations[filn]]
+    if manifest is not None:
+        fp = open(manifest,'w')
+    else:
+        fp = None
+    pool = ThreadPool(workers)
+    try:
+        for task,checksums,ex in pool.imap(transfer_file,tasks):
+            if ex is not None:
+                logging.error("FAILED for %s: %s" % (task[0],ex))
+                status = 1
+                continue
+            for op,dst in zip(('Copied','Gzipped'),task[1:3]):
+                if dst is not None:
+                    print "\t%s .../%s" % (op,os.path.basename(task[0]))
+            if fp is not None:
+                for chksum,filn in checksums:
+                    fp.write("%s  %s\n" % (chksum,strip_prefix(filn,os.getcwd())))
+    finally:
+        pool.close()
+        pool.join()
+        if gzip_pool is not None:
+            gzip_pool.close()
+            gzip_pool.join()
+        if fp is not None:
+            fp.close()
+    return status
+
+def transfer_file(task):
+    """Copy and/or gzip a single file, trapping errors
+
+    Wrapper for bcf_utils.copy_and_checksum for use with a pool of
+    workers. If there is an error then any outputs (complete or
+    partial, including the temporary '.part' files) are removed.
+
+    Arguments:
+      task: tuple (src,copy_dst,gzip_dst,gzip_workers,gzip_pool) where
+        copy_dst, gzip_dst and gzip_pool can be None
+
+    Returns:
+      Tuple (task,checksums,error) where 'checksums' is the list of
+      (md5sum,filename) tuples for the source and outputs (or None if
+      there was an error), and 'error' is the exception that was raised
+      (or None if there was no error).
+    """
+    src,copy_dst,gzip_dst,gzip_workers,gzip_pool = task
+    try:
+        return (task,bcf_utils.copy_and_checksum(src,copy_dst=copy_dst,
+                                                 gzip_dst=gzip_dst,
+                                                 workers=gzip_workers,
+                                                 pool=gzip_pool),None)
+    except (IOError,OSError),ex:
+        for dst in (copy_dst,gzip_dst):
+            if dst is None:
+                continue
+            for filn in (dst,dst+'.part'):
+                try:
+                    if os.path.exists(filn):
+                        os.remove(filn)
+                except OSError,cleanup_ex:
+                    logging.error("Failed to remove %s: %s" % (filn,cleanup_ex))
+        return (task,None,ex)
+
+def md5_checksums(solid_runs,library_defns,cache=None):
     """Generate md5 checksums for a selection of primary data files
 
     Locates primary data files matching a sample/library specification
@@ -463,15 +578,17 @@ def md5_checksums(solid_runs,library_defns):
       solid_runs: list of populated SolidRun objects
       library_defns: list of library definition strings (see above
         for syntax/format)
+      cache: (optional) Md5sum.Md5sumCache instance to get checksums
+        from
     """
     for library_defn in library_defns:
         sample = library_defn.split('/')[0]
         library = library_defn.split('/')[1]
         for run in solid_runs:
             for lib in run.fetchLibraries(sample,library):
-                print_md5sums(lib)
+                print_md5sums(lib,cache=cache)
 
-def print_md5sums(library):
+def print_md5sums(library,cache=None):
     """Calculate and print md5sums for primary data files in library
 
     This will generate a list of md5sums that can be passed to the
@@ -481,27 +598,29 @@ def print_md5sums(library):
 
     Arguments:
       library: SolidLibrary instance.
+      cache: (optional) Md5sum.Md5sumCache instance to get checksums
+        from
     """
     # F3 primary data
     try:
-        print "%s  %s" % (Md5sum.md5sum(library.csfasta),
+        print "%s  %s" % (Md5sum.md5sum(library.csfasta,cache=cache),
                           strip_prefix(library.csfasta,os.getcwd()))
     except Exception,ex:
         logging.error("FAILED for F3 csfasta: %s" % ex)
     try:
-        print "%s  %s" % (Md5sum.md5sum(library.qual),
+        print "%s  %s" % (Md5sum.md5sum(library.qual,cache=cache),
                           strip_prefix(library.qual,os.getcwd()))
     except Exception,ex:
         logging.error("FAILED for F3 qual: %s" % ex)
     # F5 primary data
     if library.parent_sample.parent_run.is_paired_end:
         try:
-            print "%s  %s" % (Md5sum.md5sum(library.csfasta_f5),
+            print "%s  %s" % (Md5sum.md5sum(library.csfasta_f5,cache=cache),
                               strip_prefix(library.csfasta_f5,os.getcwd()))
         except Exception,ex:
             logging.error("FAILED for F5 csfasta: %s" % ex)
         try:
-            print "%s  %s" % (Md5sum.md5sum(library.qual_f5),
+            print "%s  %s" % (Md5sum.md5sum(library.qual_f5,cache=cache),
                               strip_prefix(library.qual_f5,os.getcwd()))
         except Exception,ex:
             logging.error("FAILED for F5 qual: %s" % ex)
@@ -517,6 +636,82 @@ def strip_prefix(path,prefix):
     else:
         return path
 
+#######################################################################
+# Tests
+#######################################################################
+import unittest
+import tempfile
+import shutil
+
+class MockLibrary:
+    """Minimal stand-in for a SolidLibrary, for testing
+    """
+    def __init__(self,dirn,name):
+        self.name = name
+        self.parent_sample = MockLibrary.Sample()
+        self.csfasta = os.path.join(dirn,"%s_F3.csfasta" % name)
+        self.qual = os.path.join(dirn,"%s_F3_QV.qual" % name)
+        open(self.csfasta,'w').write(">1_23_45_F3\nT0123\n")
+        open(self.qual,'w').write(">1_23_45_F3\n10 20 30 40\n")
+
+    class Sample:
+        name = "AB_CD_EF_pool"
+
+class MockSolidRun:
+    """Minimal stand-in for a SolidRun, for testing
+    """
+    def __init__(self,libraries):
+        self.libraries = libraries
+        self.is_paired_end = False
+
+    def fetchLibraries(self,sample,library):
+        return self.libraries
+
+class TestTransferData(unittest.TestCase):
+    """Tests for the transfer_data function
+    """
+    def setUp(self):
+        self.dirn = tempfile.mkdtemp()
+        self.pwd = os.getcwd()
+        self.out_dir = os.path.join(self.dirn,"out")
+        os.mkdir(self.out_dir)
+        os.chdir(self.out_dir)
+
+    def tearDown(self):
+        os.chdir(self.pwd)
+        shutil.rmtree(self.dirn)
+
+    def make_run(self,name):
+        run_dir = os.path.join(self.dirn,name)
+        os.mkdir(run_dir)
+        return MockSolidRun([MockLibrary(run_dir,"AB1")])
+
+    def test_copy_and_gzip(self):
+        run = self.make_run("run1")
+        manifest = os.path.join(self.dirn,"manifest.txt")
+        self.assertEqual(transfer_data([run],['*/*'],['*/*'],manifest,
+                                       workers=2),0)
+        self.assertEqual(sorted(os.listdir(self.out_dir)),
+                         ["AB1_F3.csfasta","AB1_F3.csfasta.gz",
+                          "AB1_F3_QV.qual","AB1_F3_QV.qual.gz"])
+        self.assertEqual(len(open(manifest).readlines()),6)
+
+    def test_same_name_in_two_runs(self):
+        runs = [self.make_run("run1"),self.make_run("run2")]
+        open(runs[1].libraries[0].csfasta,'w').write(">2_34_56_F3\nT3210\n")
+        manifest = os.path.join(self.dirn,"manifest.txt")
+        transfer_data(runs,['*/*'],['*/*'],manifest,workers=4)
+        self.assertEqual(sorted(os.listdir(self.out_dir)),
+                         ["AB1_F3.csfasta","AB1_F3.csfasta.gz",
+                          "AB1_F3_QV.qual","AB1_F3_QV.qual.gz"])
+        # Outputs only come from the first run
+        self.assertEqual(open("AB1_F3.csfasta").read(),
+                         open(runs[0].libraries[0].csfasta).read())
+        manifest_files = [line.split()[1] for line in open(manifest)]
+        for filn in os.listdir(self.out_dir):
+            self.assertEqual(manifest_files.count(filn),1)
+        self.assertFalse([f for f in manifest_files if "run2" in f])
+
 #######################################################################
 # Main program
 #######################################################################
@@ -554,6 +749,17 @@ if __name__ == "__main__":
                  help="make gzipped copies of primary data files in pwd from specific "
                  "libraries where names match GZIP_PATTERN, which should be of the "
                  "form '<sample>/<library>'")
+    p.add_option("--manifest",action="store",dest="manifest",default=None,
+                 help="for --copy and --gzip, write md5sums for the source and "
+                 "output files to MANIFEST (which can be checked using 'md5sum -c')")
+    p.add_option("--workers",action="store",dest="workers",type="int",default=1,
+                 help="number of run directories to scan and verify at the same "
+                 "time, and for --copy and --gzip, number of files to process at "
+                 "the same time (default 1)")
+    p.add_option("--gzip-workers",action="store",dest="gzip_workers",type="int",
+                 default=1,
+                 help="for --gzip, size of the pool of processes used to compress "
+                 "the files (default 1)")
     p.add_option("--md5",action="append",dest="md5_pattern",default=[],
                  help="calculate md5sums for primary data files from specific "
                  "libraries where names match MD5_PATTERN, which should be of the "
@@ -561,17 +767,42 @@ if __name__ == "__main__":
     p.add_option("--md5sum",action="store_true",dest="md5sum",
                  help="calculate md5sums for all primary data files (equivalent to "
                  "--md5=*/*)")
+    p.add_option("--md5-cache",action="store",dest="md5_cache",default=None,
+                 help="use MD5_CACHE (an SQLite database, created if it doesn't "
+                 "exist) to cache md5sums between runs, so that unchanged files "
+                 "aren't rechecksummed")
+    p.add_option("--snapshot",action="store_true",dest="snapshot",default=False,
+                 help="reuse the scan of each SOLiD run directory from a snapshot "
+                 "file in that directory if the run hasn't changed (otherwise "
+                 "scan the run and write the snapshot)")
     p.add_option("--no-warnings",action="store_true",dest="no_warnings",
                  help="suppress warning messages")
     p.add_option("--debug",action="store_true",dest="debug",
                  help="turn on debugging output (nb overrides --no-warnings)")
+    p.add_option("--test",action="store_true",dest="run_tests",default=False,
+                 help="run unit tests")
 
     # Process the command line
     options,args = p.parse_args()
 
+    # Run the unit tests
+    if options.run_tests:
+        print "Running unit tests"
+        logging.getLogger().setLevel(logging.CRITICAL)
+        suite = unittest.TestSuite(unittest.TestLoader().\
+                                       discover(os.path.dirname(sys.argv[0]), \
+                                                    pattern=os.path.basename(sys.argv[0])))
+        unittest.TextTestRunner(verbosity=2).run(suite)
+        print "Tests finished"
+        sys.exit()
+
     # Check inputs
     if not len(args):
         p.error("Expected at least one SOLiD run directory name")
+    if options.workers < 1:
+        p.error("--workers: must be at least 1")
+    if options.gzip_workers < 1:
+        p.error("--gzip-workers: must be at least 1")
 
     # Reset logging level for --debug and --quiet
     if options.debug:
@@ -613,14 +844,12 @@ if __name__ == "__main__":
         options.report = True
 
     # Get the run information
-    solid_runs = []
-    for solid_dir in solid_dirs:
-        run = SolidData.SolidRun(solid_dir)
+    solid_runs = load_runs(solid_dirs,use_snapshots=options.snapshot,
+                           workers=options.workers)
+    for solid_dir,run in zip(solid_dirs,solid_runs):
         if not run:
             logging.error("Error extracting run data for %s" % solid_dir)
             sys.exit(1)
-        else:
-            solid_runs.append(run)
 
     # Report the runs
     if options.report:
@@ -642,13 +871,17 @@ if __name__ == "__main__":
     if options.rsync:   
         suggest_rsync_command(solid_runs)
 
-    # Copy specific primary data files
-    if options.copy_pattern:
-        copy_data(solid_runs,options.copy_pattern)
-
-    # Gzip specific primary data files
-    if options.gzip_pattern:
-        gzip_data(solid_runs,options.gzip_pattern)
+    # Copy and/or gzip specific primary data files
+    if options.copy_pattern or options.gzip_pattern:
+        status = transfer_data(solid_runs,
+                               copy_defns=options.copy_pattern,
+                               gzip_defns=options.gzip_pattern,
+                               manifest=options.manifest,
+                               workers=options.workers,
+                               gzip_workers=options.gzip_workers)
+        if status != 0:
+            logging.error("Failed to transfer some primary data files")
+            sys.exit(1)
 
     # Md5 checksums for primary data files
 
@@ -663,13 +896,21 @@ if __name__ == "__main__":
         # Calculate checksums
         try:
             import Md5sum
-            md5_checksums(solid_runs,md5_pattern)
-        except ImportError:
+            if options.md5_cache:
+                cache = Md5sum.Md5sumCache(options.md5_cache)
+            else:
+                cache = None
+            try:
+                md5_checksums(solid_runs,md5_pattern,cache=cache)
+            finally:
+                if cache is not None:
+                    cache.close()
+        except ImportError, ex:
             logging.error("Unable to generate MD5 sums: %s" % ex)
 
     # Do verification
     # Nb this should always be the last step
     # Use the verification return code as the exit status
     if options.verify:
-        status = verify_runs(solid_dirs)
+        status = verify_runs(solid_runs,workers=options.workers)
         sys.exit(status)
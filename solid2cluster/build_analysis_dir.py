@@ -80,6 +80,8 @@ if __name__ == "__main__":
         print "      either 'absolute' (default) or 'relative'"
         print "    --run-pipeline=<script>: after creating analysis directories, run"
         print "      the specified <script> on SOLiD data file pairs in each"
+        print "    --snapshot: reuse (or create) a snapshot of the scan of the"
+        print "      SOLiD run directory, to avoid rescanning an unchanged run"
         print ""
         print "Defining experiments:"
         print ""
@@ -116,7 +118,9 @@ if __name__ == "__main__":
         sys.exit(1)
 
     # Set up experiment list
-    expts = Experiment.ExperimentList(solid_run_dir=solid_run_dir)
+    expts = Experiment.ExperimentList(solid_run_dir=solid_run_dir,
+                                      use_snapshots=('--snapshot' in
+                                                     sys.argv[1:-1]))
 
     # Process command line arguments
     for arg in sys.argv[1:-1]:
@@ -162,6 +166,9 @@ if __name__ == "__main__":
             link_type = arg.split('=')[1]
         elif arg.startswith('--run-pipeline='):
             pipeline_script = arg.split('=')[1]
+        elif arg == '--snapshot':
+            # Already handled when setting up experiment list
+            pass
         else:
             # Unrecognised argument
             logging.error("Unrecognised argument: %s" % arg)
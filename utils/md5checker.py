@@ -18,7 +18,7 @@ Utility for checking files and directories using md5 checksums.
 # Module metadata
 #######################################################################
 
-__version__ = "0.2.3"
+__version__ = "0.3.1"
 
 #######################################################################
 # Import modules that this module depends on
@@ -28,6 +28,8 @@ import sys
 import os
 import optparse
 import logging
+import collections
+from multiprocessing.pool import ThreadPool
 # Put ../share onto Python search path for modules
 SHARE_DIR = os.path.abspath(
     os.path.normpath(
@@ -35,11 +37,92 @@ SHARE_DIR = os.path.abspath(
 sys.path.append(SHARE_DIR)
 import Md5sum
 
+#######################################################################
+# Module constants
+#######################################################################
+
+# Maximum number of files queued for hashing per worker thread
+QUEUE_SIZE_PER_WORKER = 4
+
 #######################################################################
 # Functions
 #######################################################################
 
-def compute_md5sums(dirn,output_file=None):
+def md5sums(filenames,workers=1,cache=None):
+    """Generate MD5 sums for a sequence of files
+
+    Computes the MD5 sum for each file in 'filenames'. If 'workers'
+    is greater than 1 then files are hashed concurrently on a pool of
+    threads (hashlib releases the GIL while hashing); only a limited
+    number of files are queued for hashing at any one time.
+
+    Results are always returned in the same order as the input file
+    names.
+
+    Arguments:
+      filenames: iterable yielding names of files to generate MD5
+        sums for
+      workers: (optional) number of threads to use (default 1)
+      cache: (optional) Md5sum.Md5sumCache instance to get
+        checksums from
+
+    Returns:
+      Generator yielding tuples (filen,chksum,error) for each input
+      file, where 'chksum' is the MD5 sum (or None if it couldn't be
+      computed) and 'error' is the IOError that was raised while
+      computing it (or None if there was no error).
+    """
+    if workers <= 1:
+        for filen in filenames:
+            yield md5sum_for_file(filen,cache)
+        return
+    pool = ThreadPool(workers)
+    pending = collections.deque()
+    max_pending = workers*QUEUE_SIZE_PER_WORKER
+    try:
+        for filen in filenames:
+            pending.append(pool.apply_async(md5sum_for_file,(filen,cache)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.close()
+        pool.join()
+
+def md5sum_for_file(filen,cache=None):
+    """Compute MD5 sum for a file, trapping IOErrors
+
+    Arguments:
+      filen: file to compute the MD5 sum for
+      cache: (optional) Md5sum.Md5sumCache instance to get
+        checksum from
+
+    Returns:
+      Tuple (filen,chksum,error) where 'chksum' is the MD5 sum (or
+      None if there was an error) and 'error' is the IOError that
+      was raised (or None if there was no error).
+    """
+    try:
+        return (filen,Md5sum.md5sum(filen,cache=cache),None)
+    except IOError, ex:
+        return (filen,None,ex)
+
+def walk_files(dirn):
+    """Return the paths of all files under a directory
+
+    Arguments:
+      dirn: directory to walk
+
+    Returns:
+      Generator yielding the normalised path for each file found
+      under 'dirn' (in the same order as os.walk).
+    """
+    for d in os.walk(dirn):
+        for f in d[2]:
+            yield os.path.normpath(os.path.join(d[0],f))
+
+def compute_md5sums(dirn,output_file=None,workers=1,cache=None):
     """Compute and write MD5 sums for all files in a directory
 
     Walks the directory tree under the specified directory and
@@ -53,6 +136,10 @@ def compute_md5sums(dirn,output_file=None):
     Arguments:
       dirn: directory to run the MD5 sum computation on
       output_file: (optional) name of file to write MD5 sums to
+      workers: (optional) number of threads to use for computing
+        the MD5 sums (default 1)
+      cache: (optional) Md5sum.Md5sumCache instance to get
+        checksums from
 
     Returns:
       Zero on success, 1 if errors were encountered
@@ -62,23 +149,21 @@ def compute_md5sums(dirn,output_file=None):
         fp = open(output_file,'w')
     else:
         fp = sys.stdout
-    for d in os.walk(dirn):
-        # Calculate md5sum for each file
-        for f in d[2]:
-            try:
-                filen = os.path.normpath(os.path.join(d[0],f))
-                chksum = Md5sum.md5sum(filen)
-                fp.write("%s  %s\n" % (chksum,filen))
-            except IOError, ex:
-                # Error accessing file, report and skip
-                logging.error("%s: error while generating MD5 sum: '%s'" % (filen,ex))
-                logging.error("%s: skipped" % filen)
-                retval = 1
+    # Calculate md5sum for each file
+    for filen,chksum,ex in md5sums(walk_files(dirn),workers=workers,
+                                     cache=cache):
+        if ex is None:
+            fp.write("%s  %s\n" % (chksum,filen))
+        else:
+            # Error accessing file, report and skip
+            logging.error("%s: error while generating MD5 sum: '%s'" % (filen,ex))
+            logging.error("%s: skipped" % filen)
+            retval = 1
     if output_file:
         fp.close()
     return retval
 
-def verify_md5sums(chksum_file,verbose=False):
+def verify_md5sums(chksum_file,verbose=False,workers=1,cache=None):
     """Check the MD5 sums for all entries specified in a file
 
     For all entries in the supplied file, check the MD5 sum is
@@ -93,6 +178,10 @@ def verify_md5sums(chksum_file,verbose=False):
       verbose: (optional) if True then report status for all
         files checked, plus a summary; otherwise only report
         failures
+      workers: (optional) number of threads to use for computing
+        the MD5 sums (default 1)
+      cache: (optional) Md5sum.Md5sumCache instance to get
+        checksums from
 
     Returns:
       Zero on success, 1 if errors were encountered
@@ -102,19 +191,27 @@ def verify_md5sums(chksum_file,verbose=False):
     failures = []
     missing = []
     badlines = []
-    # Perform the verification
+    # Read the MD5 sums
+    entries = []
     for line in open(chksum_file,'rU'):
         items = line.strip().split()
         if len(items) < 2:
+            entries.append((line,None,None))
+        else:
+            chksum = items[0]
+            entries.append((line,chksum,line[len(chksum):].strip()))
+    # Perform the verification
+    new_chksums = md5sums([entry[2] for entry in entries if entry[1] is not None],
+                          workers=workers,cache=cache)
+    for line,chksum,chkfile in entries:
+        if chksum is None:
             logging.error("Unable to read MD5 sum from line (skipped):")
             logging.error("%s" % line)
             badlines.append(line)
             retval = 1
             continue
-        chksum = items[0]
-        chkfile = line[len(chksum):].strip()
-        try:
-            new_chksum = Md5sum.md5sum(chkfile)
+        new_chksum,ex = new_chksums.next()[1:]
+        if ex is None:
             if chksum == new_chksum:
                 report("%s: OK" % chkfile,verbose)
                 nsuccess += 1
@@ -122,7 +219,7 @@ def verify_md5sums(chksum_file,verbose=False):
                 logging.error("%s: FAILED" % chkfile)
                 failures.append(chkfile)
                 retval = 1
-        except IOError, ex:
+        else:
             if not os.path.exists(chkfile):
                 logging.error("%s: FAILED (file not found)" % chkfile)
                 missing.append(chkfile)
@@ -142,7 +239,7 @@ def verify_md5sums(chksum_file,verbose=False):
     report("\t%d 'bad' MD5 checksum lines" % nbad,verbose)
     return retval
 
-def diff_directories(dirn1,dirn2,verbose=False):
+def diff_directories(dirn1,dirn2,verbose=False,workers=1,cache=None):
     """Check one directory against another using MD5 sums
 
     This compares one directory against another by computing the
@@ -163,6 +260,11 @@ def diff_directories(dirn1,dirn2,verbose=False):
       dirn2: "target" directory to be compared to dirn1
       verbose: (optional) if True then report status for all
         files checked; otherwise only report summary
+      workers: (optional) number of threads to use for computing
+        the MD5 sums (default 1); source and target copies of each
+        file are hashed at the same time when this is more than 1
+      cache: (optional) Md5sum.Md5sumCache instance to get
+        checksums from
 
     Returns:
       Zero on success, 1 if errors were encountered
@@ -173,39 +275,51 @@ def diff_directories(dirn1,dirn2,verbose=False):
     missing = []
     broken = []
     # Iterate over all files in the source directory
-    for d in os.walk(dirn1):
-        for f in d[2]:
-            # Get full paths for source and target files
-            filen1 = os.path.normpath(os.path.join(d[0],f))
-            filen2 = filen1.replace(dirn1,dirn2,1)
-            # Check that source exists
-            if not os.path.isfile(filen1):
-                logging.error("%s: FAILED (broken file)" % filen1)
-                broken.append(filen1)
-                retval = 1
-            # Check that target exists
-            elif not os.path.isfile(filen2):
-                logging.error("%s: FAILED (file not found)" % filen2)
-                missing.append(filen2)
-                retval = 1
-            else:
-                try:
-                    # Calculate and compare MD5 sums
-                    chksum1 = Md5sum.md5sum(filen1)
-                    chksum2 = Md5sum.md5sum(filen2)
-                    if chksum1 == chksum2:
-                        report("%s: OK" % filen2,verbose)
-                        nsuccess += 1
-                    else:
-                        logging.error("%s: FAILED" % filen2)
-                        failures.append(filen2)
-                        retval = 1
-                except IOError, ex:
-                    # Error accessing one or both files, report and skip
+    entries = []
+    for filen1 in walk_files(dirn1):
+        # Get full paths for source and target files
+        filen2 = filen1.replace(dirn1,dirn2,1)
+        # Check that source exists
+        if not os.path.isfile(filen1):
+            entries.append((filen1,filen2,'broken'))
+        # Check that target exists
+        elif not os.path.isfile(filen2):
+            entries.append((filen1,filen2,'missing'))
+        else:
+            entries.append((filen1,filen2,None))
+    # Calculate MD5 sums for source and target copies together
+    pairs = []
+    for filen1,filen2,status in entries:
+        if status is None:
+            pairs.extend((filen1,filen2))
+    chksums = md5sums(pairs,workers=workers,cache=cache)
+    for filen1,filen2,status in entries:
+        if status == 'broken':
+            logging.error("%s: FAILED (broken file)" % filen1)
+            broken.append(filen1)
+            retval = 1
+        elif status == 'missing':
+            logging.error("%s: FAILED (file not found)" % filen2)
+            missing.append(filen2)
+            retval = 1
+        else:
+            chksum1,ex1 = chksums.next()[1:]
+            chksum2,ex2 = chksums.next()[1:]
+            if ex1 is None and ex2 is None:
+                # Compare MD5 sums
+                if chksum1 == chksum2:
+                    report("%s: OK" % filen2,verbose)
+                    nsuccess += 1
+                else:
                     logging.error("%s: FAILED" % filen2)
-                    logging.error("Error while generating MD5 sums: '%s'" % ex)
                     failures.append(filen2)
                     retval = 1
+            else:
+                # Error accessing one or both files, report and skip
+                logging.error("%s: FAILED" % filen2)
+                logging.error("Error while generating MD5 sums: '%s'" % (ex1 or ex2))
+                failures.append(filen2)
+                retval = 1
     # Summarise
     nfailed = len(failures)
     nmissing = len(missing)
@@ -219,7 +333,7 @@ def diff_directories(dirn1,dirn2,verbose=False):
     # Return status
     return retval
 
-def compute_md5sum_for_file(filen,output_file=None):
+def compute_md5sum_for_file(filen,output_file=None,cache=None):
     """Compute and write MD5 sum for specifed file
 
     Computes the MD5 sum for a file, and writes the sum and the file
@@ -231,6 +345,8 @@ def compute_md5sum_for_file(filen,output_file=None):
     Arguments:
       filen: file to compute the MD5 sum for
       output_file: (optional) name of file to write MD5 sum to
+      cache: (optional) Md5sum.Md5sumCache instance to get
+        checksum from
 
     Returns:
       Zero on success, 1 if errors were encountered
@@ -241,7 +357,7 @@ def compute_md5sum_for_file(filen,output_file=None):
     else:
         fp = sys.stdout
     try:
-        chksum = Md5sum.md5sum(filen)
+        chksum = Md5sum.md5sum(filen,cache=cache)
         fp.write("%s  %s\n" % (chksum,filen))
     except IOError, ex:
         # Error accessing file, report and skip
@@ -251,7 +367,7 @@ def compute_md5sum_for_file(filen,output_file=None):
         fp.close()
     return retval
 
-def diff_files(filen1,filen2,verbose=False):
+def diff_files(filen1,filen2,verbose=False,workers=1,cache=None):
     """Check that the MD5 sums of two files match
 
     This compares two files by computing the MD5 sums for each.
@@ -261,22 +377,27 @@ def diff_files(filen1,filen2,verbose=False):
       filen2: "target" file to be compared with filen1
       verbose: (optional) if True then report status for all
         files checked; otherwise only report summary
+      workers: (optional) if greater than 1 then compute the MD5
+        sums for both files at the same time
+      cache: (optional) Md5sum.Md5sumCache instance to get
+        checksums from
 
     Returns:
       Zero on success, 1 if errors were encountered
     """
     # Generate Md5sum for each file
     retval = 1
-    try:
-        chksum1 = Md5sum.md5sum(filen1)
-        chksum2 = Md5sum.md5sum(filen2)
+    (f1,chksum1,ex1),(f2,chksum2,ex2) = md5sums((filen1,filen2),
+                                                workers=min(workers,2),
+                                                cache=cache)
+    if ex1 is None and ex2 is None:
         if chksum1 == chksum2:
             report("OK: MD5 sums match",verbose)
             retval = 0
         else:
             report("FAILED: MD5 sums don't match",verbose)
-    except IOError, ex:
-        report("FAILED (%s)" % ex,verbose)
+    else:
+        report("FAILED (%s)" % (ex1 or ex2),verbose)
     return retval
 
 def report(msg,verbose=False):
@@ -382,6 +503,13 @@ d0914057907f9d04dd9e68b1c1e180f0  thelma/test.txt
         checksums = open(self.checksum_file,'r').read()
         self.assertEqual(self.checksums,checksums)
 
+    def test_compute_md5sums_with_workers(self):
+        # Compute md5sums using multiple threads matches serial output
+        compute_md5sums('.',output_file=self.checksum_file)
+        checksums = open(self.checksum_file,'r').read()
+        compute_md5sums('.',output_file=self.checksum_file,workers=4)
+        self.assertEqual(checksums,open(self.checksum_file,'r').read())
+
     def test_verify_md5sums(self):
         # Verify md5sums for test directory
         fp = open(self.checksum_file,'w')
@@ -389,6 +517,33 @@ d0914057907f9d04dd9e68b1c1e180f0  thelma/test.txt
         fp.close()
         self.assertEqual(verify_md5sums(self.checksum_file),0)
 
+    def test_compute_and_verify_md5sums_with_cache(self):
+        # Compute and verify md5sums using a checksum cache
+        cache_dir = tempfile.mkdtemp()
+        cache = Md5sum.Md5sumCache(os.path.join(cache_dir,"cache.db"))
+        try:
+            compute_md5sums('.',output_file=self.checksum_file,workers=4,cache=cache)
+            self.assertEqual(cache.nmisses,6)
+            self.assertEqual(verify_md5sums(self.checksum_file,cache=cache),0)
+            self.assertEqual(cache.nmisses,6)
+            self.assertEqual(cache.nhits,6)
+        finally:
+            cache.close()
+            shutil.rmtree(cache_dir)
+
+    def test_verify_md5sums_with_workers(self):
+        # Verify md5sums for test directory using multiple threads
+        fp = open(self.checksum_file,'w')
+        fp.write(self.checksums)
+        fp.write("bad line\n")
+        fp.close()
+        self.assertEqual(verify_md5sums(self.checksum_file),1)
+        self.assertEqual(verify_md5sums(self.checksum_file,workers=4),1)
+        fp = open(self.checksum_file,'w')
+        fp.write(self.checksums)
+        fp.close()
+        self.assertEqual(verify_md5sums(self.checksum_file,workers=4),0)
+
     def test_compute_md5sum_for_file(self):
         # Compute md5sum for a single file
         compute_md5sum_for_file('test.txt',output_file=self.checksum_file)
@@ -419,6 +574,11 @@ class TestDiffFiles(unittest.TestCase):
         # Check that different files checksum to different values
         self.assertNotEqual(diff_files(self.file1,self.file3),0)
 
+    def test_files_with_workers(self):
+        # Check files when hashing concurrently
+        self.assertEqual(diff_files(self.file1,self.file2,workers=2),0)
+        self.assertNotEqual(diff_files(self.file1,self.file3,workers=2),0)
+
 class TestDiffDirectories(unittest.TestCase):
     """Test checking pairs of directories
 
@@ -478,6 +638,16 @@ class TestDiffDirectories(unittest.TestCase):
         self.assertNotEqual(diff_directories(self.diff_file_dir2,
                                              self.diff_file_dir1),0)
 
+    def test_with_workers(self):
+        # Check directories when hashing concurrently
+        self.assertEqual(diff_directories(self.dir1,self.dir2,workers=4),0)
+        self.assertEqual(diff_directories(self.dir1,self.extra_file_dir,workers=4),0)
+        self.assertNotEqual(diff_directories(self.extra_file_dir,self.dir1,workers=4),0)
+        self.assertNotEqual(diff_directories(self.diff_file_dir1,
+                                             self.diff_file_dir2,workers=4),0)
+        self.assertNotEqual(diff_directories(self.broken_link_dir,
+                                             self.dir1,workers=4),0)
+
     def test_broken_links(self):
         # Check when directories contain broken links
         self.assertNotEqual(diff_directories(self.broken_link_dir,
@@ -510,6 +680,31 @@ if __name__ == "__main__":
                  help="read MD5 sums from the specified file and check them")
     p.add_option('-q','--quiet',action="store_false",dest="verbose",default=True,
                  help="suppress output messages and only report failures")
+    p.add_option('-w','--workers',action="store",dest="workers",type='int',default=1,
+                 help="number of threads to use for computing MD5 sums (default 1); "
+                 "output is always reported in the same order")
+
+    # Checksum cache
+    group = optparse.OptionGroup(p,"Checksum cache",
+                                 "Optionally store MD5 sums in a persistent cache, so "
+                                 "that the sums for files which haven't changed (same "
+                                 "device, inode, size and modification time) aren't "
+                                 "recomputed on subsequent runs. Hard-linked duplicates "
+                                 "are only hashed once.")
+    group.add_option('--cache',action="store",dest="cache_file",default=None,
+                     help="use CACHE_FILE (an SQLite database, created if it doesn't "
+                     "exist) to cache MD5 sums")
+    group.add_option('--cache-mode',action="store",dest="cache_mode",
+                     default=Md5sum.CACHE_TRUST,
+                     help="how to use the cache: '%s' (use cached MD5 sums, the "
+                     "default), '%s' (use cached sums but recompute a random sample "
+                     "to check them) or '%s' (recompute all sums and update the cache)"
+                     % Md5sum.CACHE_MODES)
+    group.add_option('--cache-sample',action="store",dest="cache_sample",type='float',
+                     default=0.01,
+                     help="fraction of cached MD5 sums to recompute in '%s' mode "
+                     "(default 0.01)" % Md5sum.CACHE_VERIFY)
+    p.add_option_group(group)
 
     # Directory differencing
     group = optparse.OptionGroup(p,"Directory comparison (-d, --diff)",
@@ -552,64 +747,96 @@ if __name__ == "__main__":
     # Set up logging output
     logging.basicConfig(format='%(message)s')
 
-    # Unit tests
-    if options.run_tests:
-        print "Running unit tests"
-        logging.getLogger().setLevel(logging.CRITICAL)
-        suite = unittest.TestSuite(unittest.TestLoader().\
-                                       discover(os.path.dirname(sys.argv[0]), \
-                                                    pattern=os.path.basename(sys.argv[0])))
-        unittest.TextTestRunner(verbosity=2).run(suite)
-        print "Tests finished"
-        sys.exit()
-
-    # Figure out mode of operation
-    if options.check:
-        # Running in "check" mode
-        if len(arguments) != 1:
-            p.error("-c: needs single argument (file containing MD5 sums)")
-        chksum_file = arguments[0]
-        if not os.path.isfile(chksum_file):
-            p.error("Checksum '%s' file not found (or is not a file)" % chksum_file)
-        # Do the verification
-        status = verify_md5sums(chksum_file,verbose=options.verbose)
-    elif options.diff:
-        # Running in "diff" mode
-        if len(arguments) != 2:
-            p.error("-d: takes two arguments but got %s: %s"
-                    % (len(arguments),arguments))
-        # Get directories/files as absolute paths
-        source = os.path.abspath(arguments[0])
-        target = os.path.abspath(arguments[1])
-        for arg in (source,target):
-            if not os.path.exists(arg):
-                p.error("%s: not found" % arg)
-        if os.path.isdir(source) and os.path.isdir(target):
-            # Compare two directories
-            report("Recursively check copies of files in %s against originals in %s" %
-                   (target,source),
-                   options.verbose)
-            status = diff_directories(source,target,verbose=options.verbose)
-        elif os.path.isfile(source) and os.path.isfile(target):
-            # Compare two files
-            report("Checking MD5 sums for %s and %s" % (source,target),options.verbose)
-            status = diff_files(source,target,verbose=options.verbose)
-        else:
-            p.error("Supplied arguments must be a pair of directories or a pair of files")
+    # Check number of workers
+    if options.workers < 1:
+        p.error("-w: number of workers must be at least 1")
+
+    # Set up checksum cache
+    if options.cache_file:
+        if options.cache_mode not in Md5sum.CACHE_MODES:
+            p.error("--cache-mode: must be one of %s" % ', '.join(Md5sum.CACHE_MODES))
+        cache = Md5sum.Md5sumCache(options.cache_file,
+                                   mode=options.cache_mode,
+                                   sample_fraction=options.cache_sample)
     else:
-        # Running in "compute" mode
-        if len(arguments) != 1:
-            p.error("Needs a single argument (name of directory to generate MD5 sums for)")
-        # Check if output file was specified
-        output_file = None
-        if options.chksum_file:
-            output_file = options.chksum_file
-        # Generate the checksums
-        if os.path.isdir(arguments[0]):
-            status = compute_md5sums(arguments[0],output_file)
-        elif os.path.isfile(arguments[0]):
-            status = compute_md5sum_for_file(arguments[0],output_file)
+        cache = None
+
+    try:
+        # Unit tests
+        if options.run_tests:
+            print "Running unit tests"
+            logging.getLogger().setLevel(logging.CRITICAL)
+            suite = unittest.TestSuite(unittest.TestLoader().\
+                                           discover(os.path.dirname(sys.argv[0]), \
+                                                        pattern=os.path.basename(sys.argv[0])))
+            unittest.TextTestRunner(verbosity=2).run(suite)
+            print "Tests finished"
+            sys.exit()
+
+        # Figure out mode of operation
+        if options.check:
+            # Running in "check" mode
+            if len(arguments) != 1:
+                p.error("-c: needs single argument (file containing MD5 sums)")
+            chksum_file = arguments[0]
+            if not os.path.isfile(chksum_file):
+                p.error("Checksum '%s' file not found (or is not a file)" % chksum_file)
+            # Do the verification
+            status = verify_md5sums(chksum_file,verbose=options.verbose,
+                                    workers=options.workers,cache=cache)
+        elif options.diff:
+            # Running in "diff" mode
+            if len(arguments) != 2:
+                p.error("-d: takes two arguments but got %s: %s"
+                        % (len(arguments),arguments))
+            # Get directories/files as absolute paths
+            source = os.path.abspath(arguments[0])
+            target = os.path.abspath(arguments[1])
+            for arg in (source,target):
+                if not os.path.exists(arg):
+                    p.error("%s: not found" % arg)
+            if os.path.isdir(source) and os.path.isdir(target):
+                # Compare two directories
+                report("Recursively check copies of files in %s against originals in %s" %
+                       (target,source),
+                       options.verbose)
+                status = diff_directories(source,target,verbose=options.verbose,
+                                          workers=options.workers,cache=cache)
+            elif os.path.isfile(source) and os.path.isfile(target):
+                # Compare two files
+                report("Checking MD5 sums for %s and %s" % (source,target),options.verbose)
+                status = diff_files(source,target,verbose=options.verbose,
+                                    workers=options.workers,cache=cache)
+            else:
+                p.error("Supplied arguments must be a pair of directories or a pair of files")
         else:
-            p.error("Cannot generate checksums for '%s': not a directory or file" % arguments[0])
+            # Running in "compute" mode
+            if len(arguments) != 1:
+                p.error("Needs a single argument (name of directory to generate MD5 sums for)")
+            # Check if output file was specified
+            output_file = None
+            if options.chksum_file:
+                output_file = options.chksum_file
+            # Generate the checksums
+            if os.path.isdir(arguments[0]):
+                status = compute_md5sums(arguments[0],output_file,
+                                         workers=options.workers,cache=cache)
+            elif os.path.isfile(arguments[0]):
+                status = compute_md5sum_for_file(arguments[0],output_file,
+                                                  cache=cache)
+            else:
+                p.error("Cannot generate checksums for '%s': not a directory or file" % arguments[0])
+    finally:
+        # Close the cache (commits any outstanding MD5 sums)
+        if cache is not None:
+            cache.close()
+    # Report cache usage
+    if cache is not None:
+        # Report to stderr so MD5 sums written to stdout are unaffected
+        if options.verbose:
+            sys.stderr.write("Cache: %d MD5 sums from cache, %d computed, "
+                             "%d verified, %d wrong\n" %
+                             (cache.nhits,cache.nmisses,cache.nverified,
+                              cache.nmismatches))
     # Finish
     sys.exit(status)
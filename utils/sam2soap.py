@@ -11,7 +11,7 @@
 
 """sam2soap.py
 
-Convert SAM file into SOAP format:
+Convert SAM (or BAM) file into SOAP format:
 
 SAM format specification v1.4: http://samtools.sourceforge.net/SAM1.pdf
 
@@ -23,8 +23,28 @@ SOAP format specification: http://soap.genomics.org.cn/soap1/#Formatofoutput
 #######################################################################
 
 import os,sys
+import time
 import logging
 import optparse
+import collections
+import multiprocessing
+# Put ../share onto Python search path for modules
+SHARE_DIR = os.path.abspath(
+    os.path.normpath(
+        os.path.join(os.path.dirname(sys.argv[0]),'..','share')))
+sys.path.append(SHARE_DIR)
+import CigarMD
+import BAMFile
+
+#######################################################################
+# Module constants
+#######################################################################
+
+# Approximate size in bytes of each block of SAM data read in
+BATCH_SIZE = 4*1024*1024
+
+# Maximum number of batches queued for conversion per worker process
+QUEUE_SIZE_PER_WORKER = 2
 
 #######################################################################
 # Class definitions
@@ -61,26 +81,18 @@ class SAMBitwiseFlag:
           value: the decimal value of the bitwise flag which
             will be decoded and used to set the properties
         """
-        data = str(bin(int(value)))[::-1]
-        self.read_paired = self.__bitIsSet(data,0)
-        self.read_mapped_in_proper_pair = self.__bitIsSet(data,1)
-        self.read_unmapped = self.__bitIsSet(data,2)
-        self.mate_unmapped = self.__bitIsSet(data,3)
-        self.read_reverse_strand = self.__bitIsSet(data,4)
-        self.mate_reverse_strand = self.__bitIsSet(data,5)
-        self.first_in_pair = self.__bitIsSet(data,6)
-        self.second_in_pair = self.__bitIsSet(data,7)
-        self.not_primary_alignment = self.__bitIsSet(data,8)
-        self.failed_quality_checks = self.__bitIsSet(data,9)
-        self.pcr_or_optical_duplicate =  self.__bitIsSet(data,10)
-
-    def __bitIsSet(self,data,bit):
-        """Internal: return True or False based on list element value
-        """
-        try:
-            return (data[bit] == '1')
-        except IndexError:
-            return False
+        flag = int(value)
+        self.read_paired = bool(flag & 0x1)
+        self.read_mapped_in_proper_pair = bool(flag & 0x2)
+        self.read_unmapped = bool(flag & 0x4)
+        self.mate_unmapped = bool(flag & 0x8)
+        self.read_reverse_strand = bool(flag & 0x10)
+        self.mate_reverse_strand = bool(flag & 0x20)
+        self.first_in_pair = bool(flag & 0x40)
+        self.second_in_pair = bool(flag & 0x80)
+        self.not_primary_alignment = bool(flag & 0x100)
+        self.failed_quality_checks = bool(flag & 0x200)
+        self.pcr_or_optical_duplicate = bool(flag & 0x400)
 
 class SAMLine:
     """Class to represent SAM alignment data line
@@ -213,112 +225,18 @@ def recover_reference_sequence(aligned_seq,cigar_string,md_tag):
     """Recover the reference sequence given data from a SAM file
 
     Reconstructs the reference sequence given the CIGAR string, MD tag
-    and aligned sequence from a SAM file.
-
-    Developed using the examples from 
-    http://davetang.org/muse/2011/01/28/perl-and-sam/
+    and aligned sequence from a SAM file (see the
+    CigarMD.recover_reference_sequence function).
 
     Arguments:
       aligned_seq: the aligned sequence (SEQ field of the SAM file)
-      cigar_string: the CIGAR string (e.g. 'M5I1M27')
+      cigar_string: the CIGAR string (e.g. '6M1I29M')
       md_tag: the full MD tag (e.g. 'MD:Z:1A0C0C0C1T0C0T27')
 
     Returns:
       Recovered reference sequence.
     """
-    for field in md_tag:
-        if field.startswith('MD:Z:'):
-            md = field.split(':')[2]
-            break
-    if not md_tag: return None
-    # Build the reference sequence
-    # Process the CIGAR string first
-    # This consists of one or more sets of <number><letter>
-    # pairs, e.g. 76M, 4M2I27M etc
-    # each pair represents an operation
-    # Apply the reverse operations to get first version of the
-    # of the reference sequence
-    operations = []
-    logging.debug("CIGAR: %s" % cigar_string)
-    op = ''
-    for c in cigar_string:
-        op += c
-        if op and not c.isdigit():
-            # Append operation and reset
-            operations.append(op)
-            op = ''
-    # Get trailing operation
-    if op: operations.append(op)
-    logging.debug("CIGAR operations: %s" % operations)
-    # Process the operations
-    refseq = []
-    index = 0
-    for op in operations:
-        count = int(op[:-1])
-        code = op[-1]
-        if code == 'M':
-            # (Mis)match
-            # Keep aligned sequence for now
-            for i in xrange(count):
-                refseq.append(aligned_seq[index])
-                index += 1
-        elif code == 'I':
-            # Insertion
-            # Skip bases in aligned sequence
-            index += count
-        elif code == 'D':
-            # Deletion
-            # Add placeholders for unknown bases
-            for i in xrange(count):
-                refseq.append('x')
-        else:
-            logging.error('Unknown operation: %s' % op)
-    logging.debug("Reference seq after CIGAR: %s" % ''.join(refseq))
-    # Apply the operations in the MD tag
-    # These are strings of the form e.g. MD:Z:3C3T1^GCTCAG25T0
-    # Numbers indicate unchanged bases, single letters indicate the
-    # mutation of a base from the reference, and sequences starting
-    # ^ indicate deletions from the reference
-    md = md_tag.split(':')[2]
-    operations = []
-    logging.debug("MD: %s" % md)
-    op = ''
-    for c in md:
-        if op.isdigit() and not c.isdigit():
-            # End of base count operation
-            operations.append(op)
-            op = ''
-        elif op.isalpha() and not c.isalpha():
-            # End of mutation operation
-            operations.append(op)
-            op = ''
-        elif op.startswith('^') and c.isdigit():
-            # End of deletion operation
-            operations.append(op)
-            op = ''
-        op += c
-    # Get trailing operation
-    if op: operations.append(op)
-    logging.debug("MD tag operations: %s" % operations)
-    # Process the operations
-    index = 0
-    for op in operations:
-        if op.isdigit():
-            # Skip bases
-            index += int(op)
-        elif op.isalpha():
-            # Mutate base
-            refseq[index] = op
-            index += 1
-        elif op.startswith('^'):
-            # Add back deleted bases
-            for c in op[1:]:
-                refseq[index] = c
-                index += 1
-        else:
-            logging.error('Unknown operation: %s' % op)
-    logging.debug("Reference seq after MD tag: %s" % ''.join(refseq))
-    return ''.join(refseq)
+    return CigarMD.recover_reference_sequence(aligned_seq,cigar_string,md_tag)
 
 def soap_type_from_sam(aligned_seq,aligned_qual,cigar_string,md_tag):
     """Return SOAP 'type' field from data in SAM file alignment line
@@ -338,50 +256,25 @@ def soap_type_from_sam(aligned_seq,aligned_qual,cigar_string,md_tag):
     Returns:
       Recovered reference sequence.
     """
-    md = md_tag.split(':')[2]
-    operations = []
-    logging.debug("MD: %s" % md)
-    # Determine mumber of mismatches from number of mutations
-    # in MD tag
-    op = ''
-    for c in md:
-        if op.isdigit() and not c.isdigit():
-            # End of base count operation
-            operations.append(op)
-            op = ''
-        elif op.isalpha() and not c.isalpha():
-            # End of mutation operation
-            operations.append(op)
-            op = ''
-        elif op.startswith('^') and c.isdigit():
-            # End of deletion operation
-            operations.append(op)
-            op = ''
-        op += c
-    # Get trailing operation
-    if op: operations.append(op)
-    logging.debug("MD tag operations: %s" % operations)
+    md = CigarMD.md_from_tag(md_tag)
     # Convert the SAM mutation operations to the SOAP
     # equivalents
     soap_ops = []
     index = 0
-    for op in operations:
-        if op.isdigit():
+    for code,value in CigarMD.parse_md(md):
+        if code == CigarMD.MD_MATCH:
             # Unchanged bases
-            index += int(op)
-        elif op.isalpha():
+            index += value
+        elif code == CigarMD.MD_MISMATCH:
             # Mutation
             # Get the quality score: ascii encoded as quality+33 in SAM file
             quality = ord(aligned_qual[index]) - 33
-            soap_ops.append("%s->%s%s%s" % (op,index,aligned_seq[index],quality))
+            soap_ops.append("%s->%s%s%s" % (value,index,aligned_seq[index],quality))
             index += 1
-        elif op.startswith('^'):
+        else:
             # Deletion
             logging.error("Can't handle deletions")
-            index += len(op[1:])
-        else:
-            logging.error('Unknown operation: %s' % op)
-    logging.debug("SOAP operations: %s" % '\t'.join(soap_ops))
+            index += len(value)
     # Number of mismatches
     nmismatches = len(soap_ops)
     # Transform the input MD tag
@@ -432,6 +325,209 @@ def sam_to_soap(samline):
     # Return populated SOAPLine
     return soap
 
+def sam_to_soap_batch(lines):
+    """Convert a batch of SAM data lines to SOAP format
+
+    Header lines (i.e. those starting with '@') and unmapped reads
+    (which have no SOAP equivalent) are skipped, and each remaining
+    alignment line is converted to its SOAP equivalent.
+
+    This is the unit of work that is handed to each worker process
+    when running the conversion in parallel, so it must be
+    picklable (i.e. a module-level function).
+
+    Arguments:
+      lines: list of lines read from a SAM file
+
+    Returns:
+      Tuple (n,text) where n is the number of alignments that were
+      converted and text is the SOAP output for the whole batch as
+      a single string (with trailing newline).
+    """
+    soap = []
+    for line in lines:
+        if line.startswith('@'):
+            continue
+        samline = SAMLine(line)
+        if samline.bitwiseFlag.read_unmapped:
+            continue
+        soap.append(str(sam_to_soap(samline)))
+    if not soap:
+        return (0,'')
+    soap.append('')
+    return (len(soap)-1,'\n'.join(soap))
+
+def samline_from_bam_fields(fields):
+    """Create a SAMLine from fields decoded from a BAM record
+
+    Arguments:
+      fields: tuple (qname,flag,rname,pos,cigar,seq,qual,md,nh)
+        as generated by read_bam_batches
+
+    Returns:
+      Populated SAMLine object.
+    """
+    samline = SAMLine()
+    samline.qname,samline.flag,samline.rname,samline.pos,samline.cigar,\
+        samline.seq,samline.qual,samline.md,samline.nh = fields
+    samline.bitwiseFlag = SAMBitwiseFlag(samline.flag)
+    return samline
+
+def bam_fields_to_soap_batch(records):
+    """Convert a batch of decoded BAM records to SOAP format
+
+    The equivalent of sam_to_soap_batch for alignments read from a
+    BAM file: unmapped reads are skipped and each remaining record is
+    converted to its SOAP equivalent.
+
+    Arguments:
+      records: list of tuples of fields decoded from BAM records, as
+        generated by read_bam_batches
+
+    Returns:
+      Tuple (n,text) where n is the number of alignments that were
+      converted and text is the SOAP output for the whole batch as
+      a single string (with trailing newline).
+    """
+    soap = []
+    for fields in records:
+        if fields[1] & 0x4:
+            # Unmapped read
+            continue
+        soap.append(str(sam_to_soap(samline_from_bam_fields(fields))))
+    if not soap:
+        return (0,'')
+    soap.append('')
+    return (len(soap)-1,'\n'.join(soap))
+
+def read_sam_batches(samfile,batch_size=BATCH_SIZE):
+    """Read a SAM file as a series of batches of lines
+
+    Lines are read in blocks of approximately 'batch_size' bytes
+    (so that lines are never split across batches).
+
+    Arguments:
+      samfile: file-like object opened for reading SAM data
+      batch_size: (optional) approximate size in bytes of each
+        batch of lines
+
+    Returns:
+      Generator yielding lists of lines.
+    """
+    while True:
+        lines = samfile.readlines(batch_size)
+        if not lines:
+            break
+        yield lines
+
+def read_bam_batches(bamfile,batch_size=BATCH_SIZE):
+    """Read a BAM file as a series of batches of decoded records
+
+    Alignment records are decoded from the BAM file and the fields
+    needed for the SOAP conversion are grouped into batches of
+    approximately 'batch_size' bytes, as tuples:
+
+    (qname,flag,rname,pos,cigar,seq,qual,md,nh)
+
+    Arguments:
+      bamfile: BAMFile.BAMIterator instance
+      batch_size: (optional) approximate size in bytes of each
+        batch of records
+
+    Returns:
+      Generator yielding lists of tuples.
+    """
+    records = []
+    size = 0
+    for record in bamfile:
+        records.append((record.qname,record.flag,record.rname,record.pos,
+                        record.cigar,record.seq,record.qual,record.md,
+                        record.nh))
+        size += len(record.qname) + 2*len(record.seq) + len(record.cigar) + 32
+        if size >= batch_size:
+            yield records
+            records = []
+            size = 0
+    if records:
+        yield records
+
+def convert_sam_to_soap(samfile,soapfile,nprocessors=1,batch_size=BATCH_SIZE,
+                       pool=None):
+    """Convert SAM data to SOAP format
+
+    Reads SAM data from 'samfile' in batches, converts each batch
+    and writes the output for each batch to 'soapfile' in a single
+    operation. 'samfile' can also be a BAMFile.BAMIterator, in which
+    case the alignments are read directly from the BAM data.
+
+    If 'nprocessors' is greater than 1 then batches are farmed out
+    to a pool of worker processes; the converted batches are
+    written in the same order as they were read, so the output is
+    identical to that from a serial conversion. Only a limited
+    number of batches are read ahead of the output, so memory use
+    doesn't depend on the size of the input.
+
+    An existing multiprocessing.Pool can be supplied via 'pool', in
+    which case it is used instead of creating a new one (and the
+    caller is responsible for closing it). This should be done when
+    reading from a BAMIterator which uses decompression threads, as
+    the pool must be created (i.e. the worker processes forked)
+    before those threads are started.
+
+    Arguments:
+      samfile: file-like object to read SAM data from, or a
+        BAMIterator to read BAM data from
+      soapfile: file-like object to write SOAP data to
+      nprocessors: (optional) number of worker processes to use
+        (default is 1, i.e. convert in the current process)
+      batch_size: (optional) approximate size in bytes of each
+        batch of SAM data
+      pool: (optional) multiprocessing.Pool with 'nprocessors'
+        worker processes to use for the conversion
+
+    Returns:
+      Number of alignment records that were converted.
+    """
+    nrecords = 0
+    if isinstance(samfile,BAMFile.BAMIterator):
+        batches = read_bam_batches(samfile,batch_size)
+        convert_batch = bam_fields_to_soap_batch
+    else:
+        batches = read_sam_batches(samfile,batch_size)
+        convert_batch = sam_to_soap_batch
+    if pool is not None:
+        pending = collections.deque()
+        max_pending = nprocessors*QUEUE_SIZE_PER_WORKER
+        for batch in batches:
+            pending.append(pool.apply_async(convert_batch,(batch,)))
+            if len(pending) >= max_pending:
+                n,soap = pending.popleft().get()
+                soapfile.write(soap)
+                nrecords += n
+        while pending:
+            n,soap = pending.popleft().get()
+            soapfile.write(soap)
+            nrecords += n
+    elif nprocessors > 1:
+        pool = multiprocessing.Pool(nprocessors)
+        try:
+            nrecords = convert_sam_to_soap(samfile,soapfile,
+                                           nprocessors=nprocessors,
+                                           batch_size=batch_size,
+                                           pool=pool)
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for batch in batches:
+            n,soap = convert_batch(batch)
+            soapfile.write(soap)
+            nrecords += n
+    return nrecords
+
 #######################################################################
 # Tests
 #######################################################################
@@ -464,6 +560,17 @@ class TestRecoverReferenceSequence(unittest.TestCase):
                 "MD:Z:3C3T1^GCTCAG25T0"),
                          "AGGCTGGTAGCTCAGGGATGTCTCGTCTGTGAGTTACAGCT")
 
+class TestSAMBitwiseFlag(unittest.TestCase):
+    def test_sam_bitwise_flag(self):
+        flag = SAMBitwiseFlag(81)
+        self.assertTrue(flag.read_paired)
+        self.assertFalse(flag.read_mapped_in_proper_pair)
+        self.assertFalse(flag.read_unmapped)
+        self.assertTrue(flag.read_reverse_strand)
+        self.assertTrue(flag.first_in_pair)
+        self.assertFalse(flag.second_in_pair)
+        self.assertFalse(flag.pcr_or_optical_duplicate)
+
 class TestSoapTypeFromSam(unittest.TestCase):
     def test_soap_type_from_sam(self):
         self.assertEqual(soap_type_from_sam(
@@ -478,6 +585,103 @@ class TestSamToSoap(unittest.TestCase):
         self.assertEqual(str(sam_to_soap(sam)),
                          "SRR189243_1-SRR189243.3751	TATAGTTATATAAAAGACCTGAGTAGTACGTTTTATATAATCTGATTTTATGGCTATACTTTTTTTGACATGTAGC	#####################AAAA7AAAA2AA7AAAAAAA1,:0/57:8855)))),''(03388*',''))))#	1	a	76	-	gi|42410857|gb|AE017196.1|	60083	1	T->75C-23	76M	75T")
 
+import cStringIO
+
+class CountingReader:
+    """File-like object counting the batches of lines read from it
+    """
+    def __init__(self,data):
+        self.fp = cStringIO.StringIO(data)
+        self.nbatches = 0
+    def readlines(self,size):
+        lines = self.fp.readlines(size)
+        if lines:
+            self.nbatches += 1
+        return lines
+
+class RecordingWriter:
+    """File-like object recording how many batches had been read at each write
+    """
+    def __init__(self,reader):
+        self.reader = reader
+        self.nbatches_read = []
+        self.data = []
+    def write(self,s):
+        self.nbatches_read.append(self.reader.nbatches)
+        self.data.append(s)
+    def getvalue(self):
+        return ''.join(self.data)
+
+class TestConvertSamToSoap(unittest.TestCase):
+    def setUp(self):
+        self.sam_header = "@SQ\tSN:gi|42410857|gb|AE017196.1|\tLN:1267782\n"
+        self.sam_line = "SRR189243_1-SRR189243.3751\t81\tgi|42410857|gb|AE017196.1|\t60083\t30\t36M\t*\t0\t0\tCGATACGGGGACATCCGGCCTGCTCCTTCTCACATG\tIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIIII\tNM:i:1\tMD:Z:1A0C0C0C1T0C0T27\n"
+    def test_sam_to_soap_batch(self):
+        n,soap = sam_to_soap_batch([self.sam_header,self.sam_line,self.sam_line])
+        self.assertEqual(n,2)
+        expected = "%s\n" % sam_to_soap(SAMLine(self.sam_line))
+        self.assertEqual(soap,expected*2)
+    def test_sam_to_soap_batch_headers_only(self):
+        self.assertEqual(sam_to_soap_batch([self.sam_header]),(0,''))
+    def test_convert_sam_to_soap_serial(self):
+        samfile = cStringIO.StringIO(self.sam_header+self.sam_line*10)
+        soapfile = cStringIO.StringIO()
+        self.assertEqual(convert_sam_to_soap(samfile,soapfile,batch_size=100),10)
+        self.assertEqual(soapfile.getvalue(),
+                         "%s\n" % sam_to_soap(SAMLine(self.sam_line))*10)
+    def test_convert_sam_to_soap_parallel(self):
+        sam_lines = [self.sam_line.replace("SRR189243.3751","SRR189243.%d" % i)
+                     for i in xrange(50)]
+        samfile = cStringIO.StringIO(self.sam_header+''.join(sam_lines))
+        soapfile = cStringIO.StringIO()
+        self.assertEqual(convert_sam_to_soap(samfile,soapfile,nprocessors=3,
+                                             batch_size=500),50)
+        expected = ''.join(["%s\n" % sam_to_soap(SAMLine(line)) for line in sam_lines])
+        self.assertEqual(soapfile.getvalue(),expected)
+
+    def test_convert_sam_to_soap_parallel_reads_ahead_a_limited_amount(self):
+        samfile = CountingReader(self.sam_header+self.sam_line*100)
+        soapfile = RecordingWriter(samfile)
+        self.assertEqual(convert_sam_to_soap(samfile,soapfile,nprocessors=2,
+                                             batch_size=100),100)
+        max_batches = 2*QUEUE_SIZE_PER_WORKER
+        for nbatches in soapfile.nbatches_read:
+            self.assertTrue(nbatches <= max_batches)
+            max_batches += 1
+        self.assertEqual(soapfile.getvalue(),
+                         "%s\n" % sam_to_soap(SAMLine(self.sam_line))*100)
+
+    def test_convert_bam_to_soap(self):
+        bamfile = BAMFile.BAMIterator(fp=cStringIO.StringIO(BAMFile.bam_data))
+        soapfile = cStringIO.StringIO()
+        self.assertEqual(convert_sam_to_soap(bamfile,soapfile,batch_size=100),1)
+        self.assertEqual(soapfile.getvalue(),
+                         "%s\n" % sam_to_soap(SAMLine(BAMFile.sam_data)))
+
+    def test_convert_bam_to_soap_with_pool(self):
+        pool = multiprocessing.Pool(2)
+        try:
+            bamfile = BAMFile.BAMIterator(fp=cStringIO.StringIO(BAMFile.bam_data),
+                                          nthreads=2)
+            soapfile = cStringIO.StringIO()
+            self.assertEqual(convert_sam_to_soap(bamfile,soapfile,nprocessors=2,
+                                                 batch_size=100,pool=pool),1)
+            bamfile.close()
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(soapfile.getvalue(),
+                         "%s\n" % sam_to_soap(SAMLine(BAMFile.sam_data)))
+
+    def test_bam_fields_to_soap_batch(self):
+        bamfile = BAMFile.BAMIterator(fp=cStringIO.StringIO(BAMFile.bam_data))
+        batches = list(read_bam_batches(bamfile))
+        self.assertEqual(len(batches),1)
+        self.assertEqual(len(batches[0]),2)
+        n,soap = bam_fields_to_soap_batch(batches[0])
+        self.assertEqual(n,1)
+        self.assertEqual(soap,"%s\n" % sam_to_soap(SAMLine(BAMFile.sam_data)))
+
 def run_tests():
     print "Running unit tests"
     suite = unittest.TestSuite(unittest.TestLoader().\
@@ -493,12 +697,22 @@ def run_tests():
 
 if __name__ == "__main__":
     # Process command line
-    p = optparse.OptionParser(usage="%prog OPTIONS [ SAMFILE ]",
+    p = optparse.OptionParser(usage="%prog OPTIONS [ SAMFILE | BAMFILE ]",
                               description="Convert SAM file to SOAP format - reads from stdin "
                               "(or SAMFILE, if specified), and writes output to stdout unless "
-                              "-o option is specified.")
+                              "-o option is specified. BAM files are detected automatically "
+                              "and read directly.")
     p.add_option('-o',action="store",dest="soapfile",default=None,
                  help="Output SOAP file name")
+    p.add_option('-n','--nprocessors',action="store",dest="nprocessors",type='int',
+                 default=1,
+                 help="Number of processes to use for the conversion (default 1)")
+    p.add_option('--batch-size',action="store",dest="batch_size",type='int',
+                 default=BATCH_SIZE,
+                 help="Approximate size in bytes of each batch of SAM data handed "
+                 "to a process (default %d)" % BATCH_SIZE)
+    p.add_option('--bam',action="store_true",dest="bam",default=False,
+                 help="Input is BAM (only required when reading BAM from stdin)")
     p.add_option('--debug',action="store_true",dest="debug",default=False,
                  help="Turn on debugging output")
     p.add_option('--test',action="store_true",dest="run_tests",default=False,
@@ -507,30 +721,65 @@ if __name__ == "__main__":
     # Check arguments
     if len(args) > 1:
         p.error("Too many arguments")
+    if opts.nprocessors < 1:
+        p.error("-n: must be at least 1")
     # Debugging output
     if opts.debug: logging.getLogger().setLevel(logging.DEBUG)
     # Unit tests
     if opts.run_tests: run_tests()
+    # Create the pool of worker processes before any decompression
+    # threads are started for BAM input
+    if opts.nprocessors > 1:
+        pool = multiprocessing.Pool(opts.nprocessors)
+    else:
+        pool = None
     # Determine source of SAM data
     if args:
         # Read from file
-        samfile = open(args[0],'r')
+        if opts.bam or BAMFile.is_bam_file(args[0]):
+            samfile = BAMFile.BAMIterator(bam_file=args[0],
+                                          nthreads=opts.nprocessors)
+        else:
+            samfile = open(args[0],'r')
     else:
         # Read from stdin
-        samfile = sys.stdin
+        if opts.bam:
+            samfile = BAMFile.BAMIterator(fp=sys.stdin,
+                                          nthreads=opts.nprocessors)
+        else:
+            samfile = sys.stdin
     # Determine output target
     if opts.soapfile:
         soapfile = open(opts.soapfile,'w')
     else:
         soapfile = sys.stdout
     # Process the SAM data
-    for line in samfile:
-        # Skip header lines i.e. starting with '@'
-        if line.startswith('@'):
-            logging.debug("Skipped header line: %s" % line)
-            continue
-        # Process alignment lines and convert to SOAP
-        soapfile.write("%s\n" % sam_to_soap(SAMLine(line)))
+    start_time = time.time()
+    try:
+        nrecords = convert_sam_to_soap(samfile,soapfile,
+                                       nprocessors=opts.nprocessors,
+                                       batch_size=opts.batch_size,
+                                       pool=pool)
+        if pool is not None:
+            pool.close()
+    except:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.join()
+        if isinstance(samfile,BAMFile.BAMIterator):
+            samfile.close()
+        elif args:
+            samfile.close()
+    # Report throughput
+    elapsed = time.time() - start_time
+    if elapsed > 0:
+        rate = nrecords/elapsed
+    else:
+        rate = 0.0
+    sys.stderr.write("Converted %d records in %.2fs (%.0f records/s)\n" %
+                     (nrecords,elapsed,rate))
     # Finished
-    if args: samfile.close()
     if opts.soapfile: soapfile.close()